@@ -1,5 +1,17 @@
 import streamlit as st
 import os
+import pandas as pd
+from utils.profiler import profile_page
+from utils.session_resources import track_session
+from utils.tracing import begin_page_trace, finish_page_trace
+
+# 开启pandas写时复制（进程级设置，只在入口处设置一次）：数据登记表交给各会话的数据框与原件共享内存，
+# 页面代码修改时才复制被修改的列。pandas 3.0 起写时复制为默认且唯一的行为，无需再设置。
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# 按需剖析本页面的一次运行（?profile=sample 或 ?profile=cprofile）
+profile_page(__file__)
 
 # 页面配置
 st.set_page_config(
@@ -8,6 +20,12 @@ st.set_page_config(
     layout="wide"
 )
 
+# 记录本会话的资源占用
+track_session(st.session_state)
+
+# 开始记录本次运行的阶段耗时
+begin_page_trace()
+
 # 自定义CSS
 st.markdown("""
 <style>
@@ -223,4 +241,7 @@ st.markdown("""
 2. 在数据分析和可视化页面，您可以使用交互式控件调整显示效果
 3. 所有图表都支持放大和下载
 """)
-st.markdown('</div>', unsafe_allow_html=True) 
\ No newline at end of file
+st.markdown('</div>', unsafe_allow_html=True) 
+
+# 结束本次运行的阶段耗时记录（调试模式下显示耗时面板）
+finish_page_trace(st)
@@ -1,10 +1,18 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from PIL import Image
 import os
 import sys
-import matplotlib.pyplot as plt
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.profiler import profile_page
+from utils.session_resources import track_session
+from utils.tracing import begin_page_trace, finish_page_trace
+from utils.ppp import PRESET_COUNTRIES, ppp_valuation, ppp_table, preset_frame, ppp_bar_chart
+
+# 按需剖析本页面的一次运行（?profile=sample 或 ?profile=cprofile）
+profile_page(__file__)
 
 # 页面配置
 st.set_page_config(
@@ -13,6 +21,23 @@ st.set_page_config(
     layout="wide"
 )
 
+# 记录本会话的资源占用
+track_session(st.session_state)
+
+# 开始记录本次运行的阶段耗时
+begin_page_trace()
+
+# 计算结果表的列名
+PPP_COLUMN_LABELS = {
+    'country': '国家/地区',
+    'local_price': '本币价格',
+    'us_price': '美国价格(美元)',
+    'big_mac_rate': '巨无霸汇率',
+    'market_rate': '市场汇率',
+    'valuation_pct': '高估(+)/低估(-)%',
+    'status': '结论',
+}
+
 # 自定义CSS
 st.markdown("""
 <style>
@@ -181,14 +206,9 @@ with st.expander("练习1：巨无霸汇率计算"):
     col_a, col_b = st.columns(2)
     
     with col_a:
-        country = st.selectbox("选择国家", ["日本", "英国", "欧元区", "澳大利亚"])
+        country = st.selectbox("选择国家", list(PRESET_COUNTRIES))
         
-        country_data = {
-            "日本": {"price": 390, "currency": "日元", "exchange_rate": 110},
-            "英国": {"price": 3.49, "currency": "英镑", "exchange_rate": 0.72},
-            "欧元区": {"price": 4.1, "currency": "欧元", "exchange_rate": 0.85},
-            "澳大利亚": {"price": 6.4, "currency": "澳元", "exchange_rate": 1.3}
-        }
+        country_data = PRESET_COUNTRIES
         
         us_price = st.number_input("美国巨无霸价格(美元)", value=5.0, min_value=0.0, max_value=100.0, step=0.1)
         local_price = st.number_input(f"{country}巨无霸价格({country_data[country]['currency']})", 
@@ -204,36 +224,57 @@ with st.expander("练习1：巨无霸汇率计算"):
     
     with col_b:
         if st.button("计算"):
-            # 计算巨无霸汇率
-            big_mac_rate = local_price / us_price
-            
-            # 计算高估/低估程度
-            over_under = (big_mac_rate - market_rate) / market_rate * 100
-            
-            currency_status = "高估" if over_under > 0 else "低估"
-            
-            st.markdown(f"""
-            ### 计算结果
-            
-            - 巨无霸汇率：1美元 = {big_mac_rate:.2f} {country_data[country]['currency']}
-            - 市场汇率：1美元 = {market_rate:.2f} {country_data[country]['currency']}
-            - {country}货币相对美元{currency_status}了 {abs(over_under):.2f}%
-            """)
+            # 计算巨无霸汇率和高估/低估程度
+            big_mac_rate, over_under = (float(v) for v in ppp_valuation(local_price, us_price, market_rate))
             
-            # 可视化对比
-            fig, ax = plt.subplots(figsize=(8, 5))
-            bars = ax.bar(["巨无霸汇率", "市场汇率"], [big_mac_rate, market_rate], color=["#ff9999", "#66b3ff"])
-            ax.set_ylabel(f"汇率(1美元兑换{country_data[country]['currency']})")
-            ax.set_title(f"{country}货币汇率对比")
-            
-            # 添加数据标签
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                        f"{height:.2f}",
-                        ha='center', va='bottom')
-            
-            st.pyplot(fig)
+            if np.isnan(over_under):
+                st.warning("美国价格和市场汇率必须大于0。")
+            else:
+                currency_status = "高估" if over_under > 0 else "低估"
+                
+                st.markdown(f"""
+                ### 计算结果
+                
+                - 巨无霸汇率：1美元 = {big_mac_rate:.2f} {country_data[country]['currency']}
+                - 市场汇率：1美元 = {market_rate:.2f} {country_data[country]['currency']}
+                - {country}货币相对美元{currency_status}了 {abs(over_under):.2f}%
+                """)
+                
+                # 可视化对比：相同输入的图表在所有会话间共享，只绘制一次
+                st.image(ppp_bar_chart(country, country_data[country]['currency'],
+                                       round(big_mac_rate, 2), round(market_rate, 2)))
+    
+    # 所有预设国家按当前美国价格一次性计算
+    st.markdown("**全部预设国家对比**（按当前美国巨无霸价格计算）")
+    preset_result = ppp_table(preset_frame(us_price))
+    st.dataframe(
+        preset_result.rename(columns=PPP_COLUMN_LABELS)[list(PPP_COLUMN_LABELS.values())],
+        use_container_width=True,
+        hide_index=True,
+    )
+    
+    # 批量计算：学生可以添加任意多行自己的数据
+    st.markdown("**批量计算**（可编辑或添加行）")
+    batch_input = st.data_editor(
+        preset_frame(us_price),
+        num_rows="dynamic",
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'country': st.column_config.TextColumn("国家/地区"),
+            'currency': st.column_config.TextColumn("货币"),
+            'local_price': st.column_config.NumberColumn("本币价格", min_value=0.0),
+            'us_price': st.column_config.NumberColumn("美国价格(美元)", min_value=0.0),
+            'market_rate': st.column_config.NumberColumn("市场汇率(1美元兑本币)", min_value=0.0),
+        },
+        key="ppp_batch_input",
+    )
+    batch_result = ppp_table(batch_input.dropna(how='all'))
+    st.dataframe(
+        batch_result.rename(columns=PPP_COLUMN_LABELS)[list(PPP_COLUMN_LABELS.values())],
+        use_container_width=True,
+        hide_index=True,
+    )
 
 # 概念理解问题
 with st.expander("练习2：理论理解"):
@@ -289,4 +330,7 @@ st.markdown("""
 st.markdown("""
 ---
 👉 **完成理论学习后，您可以继续前往 [数据导入](/数据导入) 环节，开始实际的数据分析过程。**
-""") 
\ No newline at end of file
+""") 
+
+# 结束本次运行的阶段耗时记录（调试模式下显示耗时面板）
+finish_page_trace(st)
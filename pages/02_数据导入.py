@@ -3,12 +3,22 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import plotly.express as px
+import plotly.graph_objects as go
 import os
 import sys
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.data_processor import DataProcessor
+from utils.data_registry import SESSION_VERSION_KEY, data_update_available, load_latest_builtin
+from utils.exporter import EXPORT_FORMATS
+from utils.profiler import profile_page
+from utils.session_resources import track_session
+from utils.tiles import LEVELS, frame_pyramid, tile_traces
+from utils.tracing import begin_page_trace, finish_page_trace, traced
+
+# 按需剖析本页面的一次运行（?profile=sample 或 ?profile=cprofile）
+profile_page(__file__)
 
 # 页面配置
 st.set_page_config(
@@ -17,6 +27,15 @@ st.set_page_config(
     layout="wide"
 )
 
+# 记录本会话的资源占用
+track_session(st.session_state)
+
+# 开始记录本次运行的阶段耗时
+begin_page_trace()
+
+# 图表序列化计入阶段耗时
+plotly_chart = traced("page.plotly_chart")(st.plotly_chart)
+
 # 自定义CSS
 st.markdown("""
 <style>
@@ -76,6 +95,13 @@ if 'data_processor' not in st.session_state:
 if 'analysis_data' not in st.session_state:
     st.session_state.analysis_data = None
 
+# 后台已载入更新的内置数据时提示切换
+if data_update_available(st.session_state):
+    st.info("有新数据可用：内置数据文件已更新，新数据已在后台处理完成。")
+    if st.button("加载最新数据"):
+        load_latest_builtin(st.session_state.data_processor, st.session_state)
+        st.rerun()
+
 # 导航选项卡
 tab1, tab2, tab3 = st.tabs(["数据导入", "数据预览", "数据预处理"])
 
@@ -98,13 +124,8 @@ with tab1:
                 # 使用数据处理器加载内置数据
                 processor = st.session_state.data_processor
                 
-                # 加载内置数据
-                bigmac_data = processor.load_builtin_bigmac_data()
-                exchange_rate_data = processor.load_builtin_exchange_rate_data()
-                
-                # 保存到会话状态
-                st.session_state.bigmac_data = bigmac_data
-                st.session_state.exchange_rate_data = exchange_rate_data
+                # 加载后台已预处理好的最新内置数据，并保存到会话状态（只保存共享数据的句柄）
+                load_latest_builtin(processor, st.session_state)
                 
                 st.markdown('<div class="success-box">✅ 内置数据加载成功！</div>', unsafe_allow_html=True)
                 st.markdown("您现在可以切换到 **数据预览** 选项卡查看数据，或者继续进行数据预处理。")
@@ -130,6 +151,8 @@ with tab1:
         - local_price: 当地货币价格
         - dollar_ex: 兑美元汇率
         - dollar_price: 美元价格
+        
+        文件需同时包含中国(CHN)和美国(USA)的数据：巨无霸汇率 = 人民币价格 ÷ 同期美国巨无霸价格。
         """)
         
         # 提供数据获取指导
@@ -165,9 +188,11 @@ with tab1:
                     # 处理汇率数据
                     exchange_rate_data = processor.load_exchange_rate_data(uploaded_exchange)
                     
-                    # 保存到会话状态
-                    st.session_state.bigmac_data = bigmac_data
-                    st.session_state.exchange_rate_data = exchange_rate_data
+                    # 保存到会话状态（只保存共享数据的句柄）
+                    st.session_state.bigmac_data = processor.handle('bigmac_data')
+                    st.session_state.exchange_rate_data = processor.handle('exchange_rate_data')
+                    # 上传的数据不随内置数据更新
+                    st.session_state[SESSION_VERSION_KEY] = None
                     
                     st.markdown('<div class="success-box">✅ 数据上传并处理成功！</div>', unsafe_allow_html=True)
                     st.markdown("您现在可以切换到 **数据预览** 选项卡查看数据，或者继续进行数据预处理。")
@@ -188,7 +213,7 @@ with tab2:
         
         if st.session_state.bigmac_data is not None:
             # 显示基本信息
-            df_bigmac = st.session_state.bigmac_data
+            df_bigmac = st.session_state.bigmac_data.df
             
             st.markdown('<div class="data-info">', unsafe_allow_html=True)
             col1, col2, col3 = st.columns(3)
@@ -234,7 +259,7 @@ with tab2:
                 newnames = {'local_price': '人民币价格', 'dollar_price': '美元价格'}
                 fig.for_each_trace(lambda t: t.update(name = newnames[t.name]))
                 
-                st.plotly_chart(fig, use_container_width=True)
+                plotly_chart(fig, use_container_width=True)
             else:
                 st.warning("找不到中国的巨无霸数据，无法生成趋势图。")
         
@@ -242,7 +267,7 @@ with tab2:
         
         if st.session_state.exchange_rate_data is not None:
             # 显示基本信息
-            df_fx = st.session_state.exchange_rate_data
+            df_fx = st.session_state.exchange_rate_data.df
             
             st.markdown('<div class="data-info">', unsafe_allow_html=True)
             col1, col2, col3 = st.columns(3)
@@ -263,15 +288,78 @@ with tab2:
             # 获取汇率列名
             rate_col = 'actual_rate' if 'actual_rate' in df_fx.columns else 'actual_rates'
             
-            fig = px.line(df_fx, x='date', y=rate_col, 
-                          title='美元兑人民币汇率历史走势',
-                          labels={
-                              'date': '日期',
-                              rate_col: '美元兑人民币汇率'
-                          },
-                          color_discrete_sequence=['#2ca02c'])
-            
-            st.plotly_chart(fig, use_container_width=True)
+            # 按所选时间范围从预聚合数据中取点：跨度较大时绘制周/月/季均值和区间带，而不是全部日度数据
+            fx_pyramid = frame_pyramid(st.session_state.exchange_rate_data, rate_col)
+            if fx_pyramid.start is not None:
+                fx_start, fx_end = st.slider(
+                    "汇率图时间范围",
+                    min_value=fx_pyramid.start.to_pydatetime(),
+                    max_value=fx_pyramid.end.to_pydatetime(),
+                    value=(fx_pyramid.start.to_pydatetime(), fx_pyramid.end.to_pydatetime()),
+                    format="YYYY-MM-DD"
+                )
+                fx_level, fx_tile = fx_pyramid.query(fx_start, fx_end)
+                
+                fig = go.Figure(tile_traces(fx_level, fx_tile, '美元兑人民币汇率', '#2ca02c', 'rgba(44, 160, 44, 0.2)'))
+                fig.update_layout(title='美元兑人民币汇率历史走势', xaxis_title='日期', yaxis_title='美元兑人民币汇率')
+                
+                plotly_chart(fig, use_container_width=True)
+                st.caption(f"当前显示按{LEVELS[fx_level][1]}聚合的数据，共 {len(fx_tile):,} 个点")
+
+        # 完整的多国面板不保存在会话中：按所选国家和年份在分析库中筛选，只取回展示的行
+        with st.expander("多国面板数据查询"):
+            processor = st.session_state.data_processor
+            try:
+                countries_overview = processor.query_aggregate('dollar_price', by='iso_a3', how='count')
+                years_overview = processor.query_aggregate('dollar_price', by='year', how='count')
+            except ValueError as e:
+                st.info(f"多国面板查询不可用：{e}")
+                countries_overview = None
+
+            if countries_overview is not None and not countries_overview.empty:
+                iso_options = countries_overview['iso_a3'].tolist()
+                years = years_overview['year'].astype(int)
+                col_q1, col_q2 = st.columns([2, 1])
+                with col_q1:
+                    query_isos = st.multiselect(
+                        "国家/地区（ISO代码）",
+                        iso_options,
+                        default=[iso for iso in ('CHN', 'JPN', 'GBR') if iso in iso_options]
+                    )
+                with col_q2:
+                    query_years = st.slider("年份范围", int(years.min()), int(years.max()),
+                                            (int(years.min()), int(years.max())))
+
+                if query_isos:
+                    query_start, query_end = f"{query_years[0]}-01-01", f"{query_years[1]}-12-31"
+                    panel_rows = processor.query_bigmac_range(
+                        query_isos, query_start, query_end,
+                        columns=['date', 'iso_a3', 'name', 'currency_code', 'local_price', 'dollar_ex', 'dollar_price']
+                    )
+                    fig = px.line(panel_rows, x='date', y='dollar_price', color='name', markers=True,
+                                  labels={'date': '日期', 'dollar_price': '巨无霸美元价格', 'name': '国家/地区'},
+                                  title='巨无霸美元价格')
+                    plotly_chart(fig, use_container_width=True)
+
+                    # 各国相对美国的巨无霸汇率偏差（as-of 汇率匹配在分析库中完成）
+                    deviations = []
+                    for iso in query_isos:
+                        if iso == 'USA':
+                            continue
+                        try:
+                            deviations.append(processor.query_comparison(iso, query_start, query_end))
+                        except ValueError:
+                            pass
+                    if deviations:
+                        fig = px.line(pd.concat(deviations, ignore_index=True), x='date', y='deviation_pct',
+                                      color='name', labels={'date': '日期', 'deviation_pct': '偏差 (%)',
+                                                            'name': '国家/地区'},
+                                      title='市场汇率相对巨无霸汇率的偏差')
+                        fig.add_hline(y=0, line_color='black', line_width=1)
+                        plotly_chart(fig, use_container_width=True)
+
+                    st.dataframe(panel_rows, use_container_width=True, hide_index=True)
+                    st.caption(f"共 {len(panel_rows):,} 行")
     else:
         st.info("请先在 '数据导入' 选项卡中上传数据。")
 
@@ -281,9 +369,9 @@ with tab3:
         st.markdown('<div class="sub-header">数据预处理</div>', unsafe_allow_html=True)
         
         st.write("在这个步骤中，我们将对上传的数据进行预处理，包括：")
-        st.write("1. 筛选中国数据")
+        st.write("1. 筛选中国数据，并附上同期美国巨无霸价格")
         st.write("2. 合并巨无霸指数和汇率数据")
-        st.write("3. 计算巨无霸汇率和汇率偏差")
+        st.write("3. 计算巨无霸汇率（人民币价格 ÷ 美国价格）和汇率偏差")
         st.write("4. 分析结果")
         
         if st.button("执行数据预处理"):
@@ -295,7 +383,8 @@ with tab3:
                 comparison_data = processor.analyze_data()
                 
                 # 保存分析结果到会话状态
-                st.session_state.analysis_data = comparison_data
+                st.session_state.analysis_data = processor.handle('comparison_data')
+                st.session_state.export_file = None
                 
                 st.markdown('<div class="success-box">✅ 数据预处理成功！</div>', unsafe_allow_html=True)
                 
@@ -330,7 +419,7 @@ with tab3:
                 newnames = {'big_mac_rate': '巨无霸指数汇率', 'actual_rate': '实际市场汇率'}
                 fig_rates.for_each_trace(lambda t: t.update(name = newnames[t.name]))
                 
-                st.plotly_chart(fig_rates, use_container_width=True)
+                plotly_chart(fig_rates, use_container_width=True)
                 
                 # 计算巨无霸汇率指标
                 avg_bigmac_rate = comparison_data['big_mac_rate'].mean()
@@ -363,7 +452,7 @@ with tab3:
                               annotation_text="无偏差线", 
                               annotation_position="bottom right")
                 
-                st.plotly_chart(fig, use_container_width=True)
+                plotly_chart(fig, use_container_width=True)
                 
                 # 计算关键指标
                 avg_deviation = comparison_data['deviation_pct'].mean()
@@ -404,19 +493,43 @@ with tab3:
                     'data_period': f"{comparison_data['date'].min().strftime('%Y-%m-%d')} 至 {comparison_data['date'].max().strftime('%Y-%m-%d')}"
                 }
                 
-                # 导出选项
-                st.markdown("### 导出数据")
-                
+            except Exception as e:
+                st.error(f"数据预处理出错: {str(e)}")
+        
+        # 导出选项：仅在用户请求下载时才生成文件，相同数据与格式的结果会被缓存
+        if st.session_state.analysis_data is not None:
+            st.markdown("### 导出数据")
+            
+            export_col1, export_col2 = st.columns([1, 2])
+            with export_col1:
+                export_format = st.selectbox(
+                    "导出格式",
+                    list(EXPORT_FORMATS.keys()),
+                    format_func=lambda fmt: EXPORT_FORMATS[fmt][1]
+                )
+            with export_col2:
+                st.write("")
+                prepare_export = st.button("生成下载文件")
+            
+            if prepare_export:
+                try:
+                    processor = st.session_state.data_processor
+                    st.session_state.export_file = (
+                        export_format,
+                        processor.export_analysis_data(st.session_state.analysis_data, fmt=export_format)
+                    )
+                except Exception as e:
+                    st.error(f"数据导出出错: {str(e)}")
+            
+            export_file = st.session_state.get('export_file')
+            if export_file is not None and export_file[0] == export_format:
                 if st.download_button(
-                    label="下载分析结果为Excel",
-                    data=processor.export_analysis_data(comparison_data),
-                    file_name="巨无霸指数分析结果.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    label=f"下载分析结果为{EXPORT_FORMATS[export_format][1]}",
+                    data=export_file[1],
+                    file_name=f"巨无霸指数分析结果.{export_format}",
+                    mime=EXPORT_FORMATS[export_format][0]
                 ):
                     st.success("数据导出成功！")
-                
-            except Exception as e:
-                st.error(f"数据预处理出错: {str(e)}")
         
         # 引导用户进入下一步
         if 'analysis_data' in st.session_state and st.session_state.analysis_data is not None:
@@ -425,4 +538,7 @@ with tab3:
             👉 **数据预处理完成！您现在可以前往 [数据分析](/数据分析) 页面进行更深入的分析。**
             """)
     else:
-        st.info("请先在 '数据导入' 选项卡中上传数据。") 
\ No newline at end of file
+        st.info("请先在 '数据导入' 选项卡中上传数据。") 
+
+# 结束本次运行的阶段耗时记录（调试模式下显示耗时面板）
+finish_page_trace(st)
@@ -4,15 +4,24 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 import sys
 from datetime import datetime
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.data_processor import DataProcessor
+from utils.data_processor import DataProcessor, flag_change_points
+from utils.data_registry import data_update_available, load_latest_builtin
+from utils.batch_report import load_report_manifest
+from utils.country_pipeline import run_country_pipeline
+from utils.snapshot import get_snapshot_index
+from utils.gdp_adjustment import get_adjustment_engine
+from utils.job_queue import get_job_queue, DONE as JOB_DONE, FAILED as JOB_FAILED
+from utils.profiler import profile_page
+from utils.session_resources import track_session
+from utils.tiles import frame_pyramid, tile_traces
+from utils.tracing import begin_page_trace, finish_page_trace, stop_page, traced
+from utils.prompt_builder import PromptBuilder, DEFAULT_TOKEN_BUDGET, estimate_tokens, summarize_series, format_series_summary
 try:
     from utils.ai_analyzer import DeepSeekAnalyzer
 except ImportError:
@@ -24,14 +33,29 @@ except ImportError:
         def set_api_key(self, api_key):
             pass
         
-        def _call_api(self, prompt):
+        def _call_api(self, prompt, on_wait=None):
             return "这是一个示例AI分析结果。实际部署时，这里将显示AI生成的分析内容。"
         
+        def get_traffic_metrics(self):
+            return {}
+        
         def mock_analyze_metrics(self, metrics):
             return "这是一个示例AI分析结果。实际部署时，这里将显示AI生成的基于指标的分析内容。"
         
         def mock_analyze_trends(self, start_year, end_year):
             return "这是一个示例AI分析结果。实际部署时，这里将显示AI生成的趋势分析内容。"
+        
+        def generate_report(self, metrics, trend_analysis, metrics_analysis):
+            return "这是一个示例AI分析报告。实际部署时，这里将显示AI生成的完整报告。"
+        
+        def mock_generate_report(self, metrics):
+            return "这是一个示例AI分析报告。实际部署时，这里将显示AI生成的完整报告。"
+
+# 写入AI提示的显著变化点数量上限
+PROMPT_TOP_K_CHANGES = 10
+
+# 按需剖析本页面的一次运行（?profile=sample 或 ?profile=cprofile）
+profile_page(__file__)
 
 # 页面配置
 st.set_page_config(
@@ -40,6 +64,15 @@ st.set_page_config(
     layout="wide"
 )
 
+# 记录本会话的资源占用（同时生成会话ID）
+track_session(st.session_state)
+
+# 开始记录本次运行的阶段耗时
+begin_page_trace()
+
+# 图表序列化计入阶段耗时
+plotly_chart = traced("page.plotly_chart")(st.plotly_chart)
+
 # 自定义CSS
 st.markdown("""
 <style>
@@ -114,10 +147,17 @@ st.write("在这个页面，您可以对巨无霸指数和汇率数据进行深
 # 检查分析数据是否已加载
 if 'analysis_data' not in st.session_state or st.session_state.analysis_data is None:
     st.warning("您尚未完成数据预处理，请先前往 **数据导入** 页面进行数据处理。")
-    st.stop()
+    stop_page(st)
+
+# 后台已载入更新的内置数据时提示切换（新版本的对比数据已预先计算）
+if data_update_available(st.session_state) and 'data_processor' in st.session_state:
+    st.info("有新数据可用：内置数据文件已更新，新数据已在后台处理完成。")
+    if st.button("加载最新数据"):
+        load_latest_builtin(st.session_state.data_processor, st.session_state)
+        st.rerun()
 
 # 获取分析数据
-analysis_data = st.session_state.analysis_data
+analysis_data = st.session_state.analysis_data.df
 
 # 初始化AI分析器
 if 'ai_analyzer' not in st.session_state:
@@ -149,6 +189,67 @@ with st.sidebar:
                 st.success("API密钥设置成功！")
             except Exception as e:
                 st.error(f"API设置失败: {str(e)}")
+    
+    # 显示所有会话共享的AI请求队列状态
+    traffic = st.session_state.ai_analyzer.get_traffic_metrics()
+    if traffic:
+        with st.expander("AI请求队列状态"):
+            col_q1, col_q2 = st.columns(2)
+            with col_q1:
+                st.metric("排队请求", traffic['queue_length'])
+                st.metric("平均排队(秒)", f"{traffic['avg_queue_wait']:.1f}")
+            with col_q2:
+                st.metric("进行中", f"{traffic['active']}/{traffic['max_concurrency']}")
+                st.metric("吞吐量(次/分)", f"{traffic['throughput_per_min']:.1f}")
+
+# AI分析在后台任务队列中执行，页面无需等待结果返回
+job_queue = get_job_queue()
+if 'ai_jobs' not in st.session_state:
+    st.session_state.ai_jobs = {}
+
+def submit_ai_job(kind, prompt, fn, *args, **kwargs):
+    """提交后台AI分析任务并记录任务ID"""
+    st.session_state.ai_jobs[kind] = job_queue.submit(st.session_state.session_id, kind, prompt, fn, *args, **kwargs)
+
+def _render_ai_job(kind, result_key, download_label, file_name):
+    job = job_queue.get(st.session_state.ai_jobs.get(kind))
+    if job is None:
+        return
+    
+    if job.status == JOB_DONE:
+        # 显示分析结果
+        st.markdown('<div class="analysis-result">', unsafe_allow_html=True)
+        st.markdown(job.result)
+        st.markdown('</div>', unsafe_allow_html=True)
+        
+        # 保存分析结果到会话状态
+        st.session_state[result_key] = job.result
+        
+        # 显示下载按钮
+        if st.download_button(
+            label=download_label,
+            data=job.result,
+            file_name=file_name,
+            mime="text/markdown",
+            key=f"download_{kind}"
+        ):
+            st.success("分析结果下载成功！")
+    elif job.status == JOB_FAILED:
+        st.error(f"分析过程中出错: {job.error}。可再次点击生成按钮重试。")
+    else:
+        if job.queue_position:
+            st.info(f"当前AI请求较多，您正在排队：第 {job.queue_position} 位。您可以先浏览其他选项卡，结果完成后会显示在这里。")
+        else:
+            st.info("AI正在后台分析中……您可以先浏览其他选项卡，结果完成后会显示在这里。")
+        st.button("刷新结果", key=f"refresh_{kind}")
+
+def render_ai_job(kind, result_key, download_label, file_name):
+    """显示后台分析任务的状态或结果，未完成时定期自动刷新"""
+    job = job_queue.get(st.session_state.ai_jobs.get(kind))
+    if job is not None and not job.finished and hasattr(st, "fragment"):
+        st.fragment(run_every=2)(_render_ai_job)(kind, result_key, download_label, file_name)
+    else:
+        _render_ai_job(kind, result_key, download_label, file_name)
 
 # 创建侧边栏过滤器
 st.sidebar.markdown("## 数据过滤")
@@ -172,7 +273,7 @@ else:
     filtered_data = analysis_data.copy()
 
 # 数据分析选项卡
-tab1, tab2, tab3 = st.tabs(["基本统计分析", "汇率政策与趋势", "显著变化点分析"])
+tab1, tab2, tab3, tab4 = st.tabs(["基本统计分析", "汇率政策与趋势", "显著变化点分析", "国际横截面对比"])
 
 # 基本统计分析选项卡
 with tab1:
@@ -181,12 +282,19 @@ with tab1:
     # 创建双Y轴图表
     fig_compare = make_subplots(specs=[[{"secondary_y": True}]])
     
-    # 添加市场汇率
-    fig_compare.add_trace(
-        go.Scatter(x=filtered_data['date'], y=filtered_data['actual_rate'], 
-                 name="实际市场汇率", line=dict(color='#4e73df', width=2)),
-        secondary_y=False,
-    )
+    # 添加市场汇率：有日度汇率数据时按所选时间范围从预聚合数据中取点，否则使用各发布日期的汇率
+    fx_handle = st.session_state.get('exchange_rate_data')
+    if fx_handle is not None and not filtered_data.empty and 'actual_rate' in fx_handle.df.columns:
+        fx_level, fx_tile = frame_pyramid(fx_handle, 'actual_rate').query(filtered_data['date'].min(),
+                                                                          filtered_data['date'].max())
+        for trace in tile_traces(fx_level, fx_tile, "实际市场汇率", '#4e73df', 'rgba(78, 115, 223, 0.2)'):
+            fig_compare.add_trace(trace, secondary_y=False)
+    else:
+        fig_compare.add_trace(
+            go.Scatter(x=filtered_data['date'], y=filtered_data['actual_rate'], 
+                     name="实际市场汇率", line=dict(color='#4e73df', width=2)),
+            secondary_y=False,
+        )
     
     # 添加巨无霸汇率
     fig_compare.add_trace(
@@ -215,7 +323,7 @@ with tab1:
     fig_compare.update_yaxes(title_text="汇率 (CNY/USD)", secondary_y=False)
     fig_compare.update_yaxes(title_text="偏差百分比 (%)", secondary_y=True)
     
-    st.plotly_chart(fig_compare, use_container_width=True)
+    plotly_chart(fig_compare, use_container_width=True)
     
     # 计算关键指标
     period_start = filtered_data['date'].min().strftime('%Y-%m-%d')
@@ -248,7 +356,7 @@ with tab1:
         
         # 修复类型错误：逐行处理而不是批量处理，对数值类型应用round()
         for i, row in stats_df.iterrows():
-            if row['指标'] != "分析周期" and isinstance(row['值'], (int, float)):
+            if row['指标'] != "分析周期" and isinstance(row['值'], (int, float, np.floating)):
                 stats_df.at[i, '值'] = round(row['值'], 2)
         
         st.dataframe(stats_df, use_container_width=True)
@@ -265,7 +373,7 @@ with tab1:
                           line_dash="dot", line_color="green",
                           annotation_text="平均值")
         
-        st.plotly_chart(fig_hist, use_container_width=True)
+        plotly_chart(fig_hist, use_container_width=True)
     
     # 年度走势图
     st.markdown("### 年度分析")
@@ -317,7 +425,7 @@ with tab1:
         # 添加零线
         fig_yearly.add_hline(y=0, line_dash="dash", line_color="gray")
         
-        st.plotly_chart(fig_yearly, use_container_width=True)
+        plotly_chart(fig_yearly, use_container_width=True)
     
     with col2:
         # 计算各指标的同比变化率
@@ -348,7 +456,7 @@ with tab1:
             hovermode="x unified"
         )
         
-        st.plotly_chart(fig_yoy, use_container_width=True)
+        plotly_chart(fig_yoy, use_container_width=True)
     
     # 替换固定的AI分析结果为AI交互区域
     st.markdown('<div class="sub-header">AI分析洞察</div>', unsafe_allow_html=True)
@@ -388,33 +496,15 @@ with tab1:
     custom_prompt = st.text_area("自定义提示词（修改或使用默认）", prompt_template, height=300)
     
     if st.button("生成指标智能分析"):
-        with st.spinner("AI正在分析数据..."):
-            try:
-                # 尝试使用真实API
-                if api_key:
-                    analysis_result = st.session_state.ai_analyzer._call_api(custom_prompt)
-                else:
-                    # 使用模拟数据进行演示
-                    analysis_result = st.session_state.ai_analyzer.mock_analyze_metrics(metrics)
-                
-                # 显示分析结果
-                st.markdown('<div class="analysis-result">', unsafe_allow_html=True)
-                st.markdown(analysis_result)
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # 保存分析结果到会话状态
-                st.session_state.metrics_analysis = analysis_result
-                
-                # 显示下载按钮
-                if st.download_button(
-                    label="下载分析结果",
-                    data=analysis_result,
-                    file_name="巨无霸指数指标分析.md",
-                    mime="text/markdown"
-                ):
-                    st.success("分析结果下载成功！")
-            except Exception as e:
-                st.error(f"分析过程中出错: {str(e)}")
+        # 尝试使用真实API
+        if api_key:
+            submit_ai_job("metrics", custom_prompt, st.session_state.ai_analyzer._call_api, custom_prompt,
+                          report_queue_position=True)
+        else:
+            # 使用模拟数据进行演示
+            submit_ai_job("metrics", custom_prompt, st.session_state.ai_analyzer.mock_analyze_metrics, metrics)
+    
+    render_ai_job("metrics", "metrics_analysis", "下载分析结果", "巨无霸指数指标分析.md")
 
 # 汇率政策与趋势选项卡
 with tab2:
@@ -490,7 +580,7 @@ with tab2:
             font=dict(size=10)
         )
     
-    st.plotly_chart(fig_trend, use_container_width=True)
+    plotly_chart(fig_trend, use_container_width=True)
     
     # 汇率政策影响分析
     st.markdown("### 重要汇率政策影响分析")
@@ -642,33 +732,16 @@ with tab2:
     trend_custom_prompt = st.text_area("自定义提示词（修改或使用默认）", trend_prompt_template, height=300, key="trend_prompt")
     
     if st.button("生成趋势智能分析"):
-        with st.spinner("AI正在分析趋势数据..."):
-            try:
-                # 尝试使用真实API
-                if api_key:
-                    trend_analysis = st.session_state.ai_analyzer._call_api(trend_custom_prompt)
-                else:
-                    # 使用模拟数据进行演示
-                    trend_analysis = st.session_state.ai_analyzer.mock_analyze_trends(start_year, end_year)
-                
-                # 显示分析结果
-                st.markdown('<div class="analysis-result">', unsafe_allow_html=True)
-                st.markdown(trend_analysis)
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # 保存分析结果到会话状态
-                st.session_state.trend_analysis = trend_analysis
-                
-                # 显示下载按钮
-                if st.download_button(
-                    label="下载趋势分析结果",
-                    data=trend_analysis,
-                    file_name="人民币汇率偏差趋势分析.md",
-                    mime="text/markdown"
-                ):
-                    st.success("分析结果下载成功！")
-            except Exception as e:
-                st.error(f"分析过程中出错: {str(e)}")
+        # 尝试使用真实API
+        if api_key:
+            submit_ai_job("trends", trend_custom_prompt, st.session_state.ai_analyzer._call_api, trend_custom_prompt,
+                          report_queue_position=True)
+        else:
+            # 使用模拟数据进行演示
+            submit_ai_job("trends", trend_custom_prompt, st.session_state.ai_analyzer.mock_analyze_trends,
+                          start_year, end_year)
+    
+    render_ai_job("trends", "trend_analysis", "下载趋势分析结果", "人民币汇率偏差趋势分析.md")
 
 # 显著变化点分析选项卡
 with tab3:
@@ -676,10 +749,6 @@ with tab3:
     
     st.write("本分析识别出人民币汇率偏差发生显著变化的时间点，帮助理解影响汇率偏差的关键事件。")
     
-    # 计算偏差同比变化率和绝对变化量
-    filtered_data['monthly_change'] = filtered_data['deviation_pct'].diff()
-    filtered_data['abs_monthly_change'] = filtered_data['monthly_change'].abs()
-    
     # 设置阈值 - 默认使用90%分位数，但允许用户调整
     change_threshold = st.slider(
         "变化量阈值百分位数", 
@@ -689,11 +758,11 @@ with tab3:
         help="调整以识别更多或更少的显著变化点。较高的百分位数将识别出更少但更显著的变化点。"
     )
     
-    threshold_value = filtered_data['abs_monthly_change'].quantile(change_threshold/100)
+    # 计算偏差的期间变化量和绝对变化量，并识别变化显著的点
+    filtered_data, threshold_value = flag_change_points(filtered_data, change_threshold)
     st.write(f"当前阈值: 月度绝对变化量 > {threshold_value:.2f}%")
     
-    # 识别变化显著的点
-    significant_changes = filtered_data[filtered_data['abs_monthly_change'] > threshold_value].copy()
+    significant_changes = filtered_data[filtered_data['significant']].copy()
     
     if not significant_changes.empty:
         significant_changes = significant_changes.sort_values('date')
@@ -737,7 +806,7 @@ with tab3:
             showlegend=True
         )
         
-        st.plotly_chart(fig_changes, use_container_width=True)
+        plotly_chart(fig_changes, use_container_width=True)
         
         # 生成变化点表格
         st.markdown("### 显著变化点详情")
@@ -875,16 +944,20 @@ with tab3:
     st.markdown("### 获取AI分析")
     
     if num_change_points > 0:
-        # 提取变化点详细数据用于AI分析
+        # 只取变化幅度最大的若干个点写入提示，提示长度不随时间范围扩大而无限增长
+        top_changes = significant_changes.reindex(
+            significant_changes['abs_monthly_change'].sort_values(ascending=False).index
+        ).head(PROMPT_TOP_K_CHANGES)
+        
         change_points_data = []
-        for _, row in significant_changes.iterrows():
+        for _, row in top_changes.iterrows():
             change_date = row['date'].strftime('%Y-%m-%d')
             deviation_value = round(row['deviation_pct'], 2)
             change_value = round(row['monthly_change'], 2)
             change_direction = row['方向']
             change_magnitude = row['变化幅度']
             
-            # 查找相关事件
+            # 查找相关事件（每个变化点最多列出2个）
             related_events = []
             for event in filtered_events:
                 if abs((event["date"] - row['date']).days) <= 30:
@@ -893,37 +966,47 @@ with tab3:
                     time_rel = "之前" if days_diff < 0 else "之后"
                     related_events.append(f"{event['event']}({event_date}，{abs(days_diff)}天{time_rel})")
             
-            events_str = "，".join(related_events) if related_events else "无明显相关事件"
+            events_str = "，".join(related_events[:2]) if related_events else "无明显相关事件"
             
-            change_points_data.append(f"- {change_date}: 偏差为{deviation_value}%，{change_direction}了{abs(change_value)}%（{change_magnitude}）。相关事件：{events_str}")
+            change_points_data.append((
+                f"- {change_date}: 偏差为{deviation_value}%，{change_direction}了{abs(change_value)}%（{change_magnitude}）。相关事件：{events_str}",
+                f"- {change_date}: {change_direction}{abs(change_value)}%"
+            ))
         
-        change_points_text = "\n".join(change_points_data)
+        # 变化点段落由详到简的几个版本，超出token预算时逐级降级
+        change_points_variants = [
+            "\n".join(full for full, _ in change_points_data),
+            "\n".join(full for full, _ in change_points_data[:5]),
+            "\n".join(short for _, short in change_points_data[:5]),
+        ]
         
-        # 构建更具针对性的提示词
-        change_prompt_template = f"""
-        请基于以下人民币汇率偏差的显著变化点详细数据进行深入分析：
+        deviation_summary = summarize_series(filtered_data, 'deviation_pct', top_k=3)
         
-        ## 基本统计
+        # 构建更具针对性的提示词
+        change_builder = PromptBuilder("请基于以下人民币汇率偏差的显著变化点详细数据进行深入分析：")
+        change_builder.add_section("基本统计", f"""
         - 分析时间段: {filtered_data['date'].min().strftime('%Y-%m-%d')} 至 {filtered_data['date'].max().strftime('%Y-%m-%d')}
         - 识别出的显著变化点数量: {num_change_points}个
         - 平均变化幅度: {avg_magnitude:.2f}%
-        - 上升变化点: {pos_changes}个
-        - 下降变化点: {neg_changes}个
-        
-        ## 具体变化点及相关事件
-        {change_points_text}
-        
-        ## 时间分布
-        {yearly_changes_str if 'yearly_changes_str' in locals() else ''}
-        
-        请分析：
+        - 上升变化点: {len(pos_changes)}个
+        - 下降变化点: {len(neg_changes)}个
+        """, required=True)
+        change_builder.add_section(f"变化幅度最大的{len(change_points_data)}个变化点及相关事件", change_points_variants, required=True)
+        change_builder.add_section("偏差分布与分期均值", [
+            format_series_summary(deviation_summary, top_k=0),
+            format_series_summary(deviation_summary, top_k=0, include_periods=False),
+        ])
+        if 'yearly_changes_str' in locals():
+            change_builder.add_section("变化点时间分布", yearly_changes_str)
+        change_builder.add_section("请分析", """
         1. 这些显著变化点与相关经济事件之间存在怎样的因果关系？是否能够观察到某些规律？
         2. 为什么有些重大事件会导致汇率偏差的显著变化，而有些则影响较小？
         3. 变化点的方向分布（上升vs下降）和时间分布反映了什么样的汇率调整模式？
         4. 基于这些变化点的分析，投资者和政策制定者应该如何预测和应对未来可能的汇率偏差波动？
         
         请进行专业、深入的分析，关注变化点的时序特征和经济含义。
-        """
+        """, required=True)
+        change_prompt_template = change_builder.build()
     else:
         # 构建无变化点的提示词
         change_prompt_template = f"""
@@ -947,38 +1030,225 @@ with tab3:
         """
     
     change_custom_prompt = st.text_area("自定义提示词（修改或使用默认）", change_prompt_template, height=300, key="change_prompt")
+    st.caption(f"预计约 {estimate_tokens(change_custom_prompt)} tokens（预算 {DEFAULT_TOKEN_BUDGET}）")
     
     if st.button("生成变化点智能分析"):
-        with st.spinner("AI正在分析变化点数据..."):
+        # 尝试使用真实API
+        if api_key:
+            submit_ai_job("change_points", change_custom_prompt, st.session_state.ai_analyzer._call_api,
+                          change_custom_prompt, report_queue_position=True)
+        else:
+            # 使用模拟数据进行演示
+            submit_ai_job("change_points", change_custom_prompt,
+                          lambda: "这是变化点分析的示例结果。实际部署时，这里将显示AI根据变化点数据生成的分析内容。")
+    
+    render_ai_job("change_points", "change_analysis", "下载变化点分析结果", "人民币汇率显著变化点分析.md")
+
+# 国际横截面对比选项卡
+with tab4:
+    st.markdown('<div class="sub-header">各国货币估值横截面</div>', unsafe_allow_html=True)
+    
+    st.write("拖动滑块浏览巨无霸指数各期发布数据，查看所有国家货币相对所选基准货币的原始估值和经人均GDP调整后的估值。")
+    
+    snapshot_index = get_snapshot_index()
+    release_dates = snapshot_index.release_dates
+    
+    col_s1, col_s2 = st.columns([3, 1])
+    with col_s1:
+        snapshot_date = st.select_slider(
+            "发布日期",
+            options=release_dates,
+            value=release_dates[-1],
+            format_func=lambda d: d.strftime('%Y-%m-%d')
+        )
+    with col_s2:
+        base_options = snapshot_index.base_options(snapshot_date)
+        base_currency = st.selectbox(
+            "基准货币",
+            base_options,
+            index=base_options.index('USD') if 'USD' in base_options else 0
+        )
+    
+    snapshot = snapshot_index.query(snapshot_date, base_currency)
+    has_adjusted = snapshot['adjusted_valuation'].notna().any()
+    
+    valuation_col = 'raw_valuation'
+    if has_adjusted:
+        valuation_type = st.radio("估值口径", ["原始估值", "GDP调整估值"], horizontal=True)
+        if valuation_type == "GDP调整估值":
+            valuation_col = 'adjusted_valuation'
+    else:
+        st.caption("该期数据没有GDP调整估值（调整估值自2011年起提供）。")
+    
+    chart_data = snapshot.dropna(subset=[valuation_col]).sort_values(valuation_col)
+    fig_snapshot = px.bar(
+        chart_data,
+        x=valuation_col,
+        y='name',
+        orientation='h',
+        color=chart_data[valuation_col] > 0,
+        color_discrete_map={True: '#E53935', False: '#1E88E5'},
+        labels={valuation_col: f'相对{base_currency}的估值 (%)', 'name': ''},
+        height=max(400, 18 * len(chart_data))
+    )
+    fig_snapshot.update_layout(showlegend=False)
+    fig_snapshot.add_vline(x=0, line_color='black', line_width=1)
+    plotly_chart(fig_snapshot, use_container_width=True)
+    
+    st.dataframe(
+        snapshot[['rank', 'name', 'currency_code', 'local_price', 'dollar_price',
+                  'raw_valuation', 'adjusted_rank', 'adjusted_valuation']].rename(columns={
+            'rank': '排名',
+            'name': '国家/地区',
+            'currency_code': '货币',
+            'local_price': '本币价格',
+            'dollar_price': '美元价格',
+            'raw_valuation': '原始估值(%)',
+            'adjusted_rank': '调整后排名',
+            'adjusted_valuation': 'GDP调整估值(%)',
+        }).round(2),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    # 全部货币两两之间的交叉估值（切换基准货币只是取矩阵中的一列）
+    with st.expander("货币交叉估值矩阵"):
+        cross_matrix = snapshot_index.cross_rate_matrix(snapshot_date)
+        matrix_frame = cross_matrix.valuation_frame(adjusted=valuation_col == 'adjusted_valuation')
+        fig_matrix = px.imshow(
+            matrix_frame.round(1),
+            color_continuous_scale='RdBu_r',
+            color_continuous_midpoint=0,
+            labels={'x': '基准货币', 'y': '被估值货币', 'color': '估值 (%)'},
+            aspect='auto',
+            height=max(500, 14 * len(matrix_frame))
+        )
+        plotly_chart(fig_matrix, use_container_width=True)
+        st.caption("第i行第j列表示货币i相对货币j的估值：正值为高估，负值为低估。")
+    
+    # 修改输入后重新做价格对人均GDP的横截面回归（全部发布日期一次完成）
+    with st.expander("修改价格或人均GDP，重算GDP调整估值"):
+        st.write("修改本期任意国家的本币价格、汇率或人均GDP，按美元价格对人均GDP回归重新计算调整价格和相对所选基准货币的估值。")
+        adjustment_engine = get_adjustment_engine()
+        baseline = adjustment_engine.compute().to_frame(bases=[base_currency], date=snapshot_date)
+        adjusted_col = f'{base_currency}_adjusted'
+        if baseline['GDP_bigmac'].notna().sum() < 2:
+            st.info("该期数据没有足够的人均GDP数据，无法回归。")
+        else:
+            edited_inputs = st.data_editor(
+                baseline[['iso_a3', 'name', 'local_price', 'dollar_ex', 'GDP_bigmac']],
+                disabled=['iso_a3', 'name'],
+                column_config={
+                    'iso_a3': '代码',
+                    'name': '国家/地区',
+                    'local_price': st.column_config.NumberColumn('本币价格', min_value=0.0, format="%.2f"),
+                    'dollar_ex': st.column_config.NumberColumn('汇率(1美元兑本币)', min_value=0.0, format="%.4f"),
+                    'GDP_bigmac': st.column_config.NumberColumn('人均GDP(美元)', min_value=0.0, format="%.0f"),
+                },
+                hide_index=True,
+                use_container_width=True,
+                key=f"gdp_inputs_{snapshot_date.strftime('%Y%m%d')}"
+            )
+            adjustment = adjustment_engine.compute(edited_inputs.assign(date=snapshot_date))
+            recomputed = adjustment.to_frame(bases=[base_currency], date=snapshot_date)
+            regression = adjustment.regression_frame()
+            fit = regression[regression['date'] == snapshot_date].iloc[0]
+            st.caption(f"回归: 美元价格 = {fit['intercept']:.3f} + {fit['slope'] * 1000:.4f} × 人均GDP(千美元)，"
+                       f"样本 {int(fit['countries'])} 个国家")
+            comparison_table = recomputed[['name', 'dollar_price', 'adj_price', adjusted_col]].assign(
+                original=baseline[adjusted_col].to_numpy() * 100)
+            comparison_table[adjusted_col] = comparison_table[adjusted_col] * 100
+            st.dataframe(
+                comparison_table.sort_values(adjusted_col, ascending=False).rename(columns={
+                    'name': '国家/地区',
+                    'dollar_price': '美元价格',
+                    'adj_price': 'GDP拟合价格',
+                    adjusted_col: '重算调整估值(%)',
+                    'original': '修改前调整估值(%)',
+                }).round(2),
+                use_container_width=True,
+                hide_index=True
+            )
+    
+    # 对全部国家并行执行与本页相同的偏差与变化点分析
+    with st.expander("全部国家偏差概览"):
+        st.write("对面板中每个国家计算巨无霸汇率与市场汇率的偏差、关键指标和显著变化点（多进程并行）。")
+        if st.button("分析全部国家"):
+            progress_bar = st.progress(0.0)
+            progress_text = st.empty()
+            
+            def _show_progress(done, total, iso):
+                progress_bar.progress(done / total)
+                progress_text.caption(f"已完成 {done}/{total} 个国家（{iso}）")
+            
             try:
-                # 尝试使用真实API
-                if api_key:
-                    change_analysis = st.session_state.ai_analyzer._call_api(change_custom_prompt)
-                else:
-                    # 使用模拟数据进行演示
-                    change_analysis = "这是变化点分析的示例结果。实际部署时，这里将显示AI根据变化点数据生成的分析内容。"
-                
-                # 显示分析结果
-                st.markdown('<div class="analysis-result">', unsafe_allow_html=True)
-                st.markdown(change_analysis)
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # 保存分析结果到会话状态
-                st.session_state.change_analysis = change_analysis
-                
-                # 显示下载按钮
-                if st.download_button(
-                    label="下载变化点分析结果",
-                    data=change_analysis,
-                    file_name="人民币汇率显著变化点分析.md",
-                    mime="text/markdown"
-                ):
-                    st.success("分析结果下载成功！")
+                fx_handle = st.session_state.data_processor.handle('fx_matrix') if 'data_processor' in st.session_state else None
+                st.session_state.country_overview = run_country_pipeline(
+                    fx_matrix=fx_handle.df if fx_handle is not None else None,
+                    change_percentile=change_threshold,
+                    progress=_show_progress,
+                )
             except Exception as e:
-                st.error(f"分析过程中出错: {str(e)}")
+                st.error(f"全部国家分析失败: {str(e)}")
+        
+        country_overview = st.session_state.get('country_overview')
+        if country_overview is not None and not country_overview['summary'].empty:
+            overview = country_overview['summary']
+            st.caption(f"共 {len(overview)} 个国家，用时 {country_overview['elapsed_sec']:.1f} 秒")
+            st.dataframe(
+                overview[['name', 'currency_code', 'latest_deviation', 'avg_deviation', 'over_under',
+                          'change_points', 'data_period']].rename(columns={
+                    'name': '国家/地区',
+                    'currency_code': '货币',
+                    'latest_deviation': '最新偏差(%)',
+                    'avg_deviation': '平均偏差(%)',
+                    'over_under': '最新状态',
+                    'change_points': '显著变化点',
+                    'data_period': '数据区间',
+                }).round(2),
+                use_container_width=True,
+                hide_index=True
+            )
+
+# 完整分析报告
+st.markdown('<div class="sub-header">完整分析报告</div>', unsafe_allow_html=True)
+
+if st.session_state.get('metrics_analysis') and st.session_state.get('trend_analysis'):
+    if st.button("生成完整分析报告"):
+        report_key = f"{metrics}\n{st.session_state.metrics_analysis}\n{st.session_state.trend_analysis}"
+        if api_key:
+            submit_ai_job("report", report_key, st.session_state.ai_analyzer.generate_report, metrics,
+                          st.session_state.trend_analysis, st.session_state.metrics_analysis)
+        else:
+            submit_ai_job("report", report_key, st.session_state.ai_analyzer.mock_generate_report, metrics)
+    
+    render_ai_job("report", "report_analysis", "下载完整分析报告", "巨无霸指数分析报告.md")
+else:
+    st.info("请先在“基本统计分析”和“汇率政策与趋势”选项卡中生成指标分析与趋势分析，再生成完整报告。")
+
+# 预生成的批量报告（由 python -m utils.batch_report 生成）
+report_dir = os.environ.get("BIGMAC_REPORT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reports"))
+report_manifest = load_report_manifest(report_dir)
+if report_manifest and report_manifest['reports']:
+    with st.expander(f"浏览预生成报告（共 {len(report_manifest['reports'])} 份，生成于 {report_manifest['generated_at']}）"):
+        available_reports = [entry for entry in report_manifest['reports'] if entry['status'] == 'ok']
+        if not available_reports:
+            st.warning("预生成报告全部生成失败，请查看报告目录中 manifest.json 记录的错误信息。")
+        else:
+            report_countries = sorted({(entry['iso_a3'], entry['name']) for entry in available_reports})
+            selected_country = st.selectbox("选择国家", report_countries, format_func=lambda c: f"{c[1]} ({c[0]})")
+            country_reports = [entry for entry in available_reports if entry['iso_a3'] == selected_country[0]]
+            selected_report = st.selectbox("选择时间段", country_reports, format_func=lambda entry: entry['period'])
+            if selected_report:
+                st.caption(f"分析时间段: {selected_report['metrics']['data_period']}，平均偏差: {selected_report['metrics']['avg_deviation']:.2f}%")
+                with open(os.path.join(report_dir, selected_report['report_path']), encoding="utf-8") as f:
+                    st.markdown(f.read())
 
 # 修改页面底部提示
 st.markdown("""
 ---
 👉 **通过数据分析与AI洞察结合，您可以全面了解巨无霸指数反映的人民币汇率偏差状况及其背后的原因。请尝试使用提供的提示词模板，或根据您的需求自定义提示词，与AI互动获取更深入的分析。**
-""") 
\ No newline at end of file
+""") 
+
+# 结束本次运行的阶段耗时记录（调试模式下显示耗时面板）
+finish_page_trace(st)
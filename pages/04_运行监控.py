@@ -0,0 +1,110 @@
+import streamlit as st
+import pandas as pd
+import os
+import sys
+from datetime import datetime
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.profiler import profile_page
+from utils.session_resources import get_session_manager, process_rss_bytes, track_session
+from utils.tracing import begin_page_trace, finish_page_trace, get_tracer, query_param, stop_page
+
+# 按需剖析本页面的一次运行（?profile=sample 或 ?profile=cprofile）
+profile_page(__file__)
+
+# 页面配置
+st.set_page_config(
+    page_title="运行监控 - 巨无霸指数分析",
+    page_icon="🛠️",
+    layout="wide"
+)
+
+# 记录本会话的资源占用
+track_session(st.session_state)
+
+# 开始记录本次运行的阶段耗时
+begin_page_trace()
+
+
+def _format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+# 仅管理员可见：需设置环境变量 BIGMAC_ADMIN_TOKEN，并以 ?token=<令牌> 访问本页
+admin_token = os.environ.get("BIGMAC_ADMIN_TOKEN")
+if not admin_token:
+    st.info("运行监控页面未启用。设置环境变量 BIGMAC_ADMIN_TOKEN 后，通过 ?token=<令牌> 访问。")
+    stop_page(st)
+if query_param("token") != admin_token:
+    st.warning("无权访问运行监控页面。")
+    stop_page(st)
+
+st.title("运行监控")
+
+manager = get_session_manager()
+
+if st.button("立即清理空闲会话"):
+    result = manager.sweep()
+    st.success(f"已溢出 {result['spilled']} 份数据，清除 {result['expired']} 个过期会话记录，删除 {result['removed_files']} 个缓存文件和 {result['removed_uploads']} 个过期的上传数据源。")
+
+stats = manager.stats()
+registry = stats['registry']
+rss = process_rss_bytes()
+
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("进程常驻内存", _format_bytes(rss) if rss is not None else "未知")
+with col2:
+    st.metric("活跃会话记录", stats['sessions'])
+with col3:
+    st.metric("共享数据", f"{registry['frames']} 份 / {_format_bytes(registry['bytes'])}")
+with col4:
+    st.metric("会话独占内存", _format_bytes(stats['private_bytes']))
+
+st.caption(
+    f"共享数据命中 {registry['hits']} 次、新建 {registry['misses']} 次；"
+    f"溢出到磁盘 {registry['spills']} 次、重新加载 {registry['reloads']} 次。"
+    f"会话空闲 {manager.spill_after:.0f} 秒后溢出不小于 {_format_bytes(manager.spill_min_bytes)} 的数据。"
+)
+
+st.subheader("内存占用最多的会话")
+sessions = manager.top_sessions(limit=50)
+if not sessions:
+    st.write("暂无会话记录。")
+else:
+    table = pd.DataFrame([{
+        '会话': s['session_id'][:8] + ('（当前）' if s['session_id'] == st.session_state.session_id else ''),
+        '最近活动': datetime.fromtimestamp(s['last_active']).strftime('%H:%M:%S'),
+        '空闲(秒)': int(s['idle_sec']),
+        '运行次数': s['runs'],
+        '独占内存': _format_bytes(s['private_bytes']),
+        '引用共享数据': _format_bytes(s['shared_bytes']),
+        '数据份数': s['frames'],
+        '已溢出': s['spilled_frames'],
+        '占用最多的键': "，".join(f"{key}({_format_bytes(size)})" for key, size in s['top_keys'] if size),
+    } for s in sessions])
+    st.dataframe(table, use_container_width=True, hide_index=True)
+
+st.subheader("各阶段累计耗时")
+stage_summary = get_tracer().summary()
+if not stage_summary:
+    st.write("暂无阶段耗时记录。")
+else:
+    stage_table = pd.DataFrame([{
+        '阶段': name,
+        '次数': item['count'],
+        '平均(毫秒)': round(item['avg_sec'] * 1000, 1),
+        '合计(秒)': round(item['total_sec'], 2),
+        '行数': item['rows'],
+        '异常': item['errors'],
+    } for name, item in stage_summary.items()]).sort_values('合计(秒)', ascending=False)
+    st.dataframe(stage_table, use_container_width=True, hide_index=True)
+    st.download_button("下载Prometheus指标", get_tracer().render_prometheus(),
+                       file_name="bigmac_metrics.prom", mime="text/plain")
+
+# 结束本次运行的阶段耗时记录（调试模式下显示耗时面板）
+finish_page_trace(st)
@@ -1,2 +1,20 @@
 # utils初始化文件
-# 此文件将目录标记为Python包 
\ No newline at end of file
+# 此文件将目录标记为Python包
+#
+# 常用类通过模块级 __getattr__ 按需导入，import utils 本身不会加载pandas、matplotlib等重型依赖
+import importlib
+
+_LAZY_EXPORTS = {
+    'DataProcessor': 'utils.data_processor',
+    'DeepSeekAnalyzer': 'utils.ai_analyzer',
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        value = getattr(importlib.import_module(_LAZY_EXPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'utils' has no attribute {name!r}")
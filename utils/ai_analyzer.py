@@ -1,67 +1,90 @@
-import requests
 import json
 import os
 import pandas as pd
-import io
-import matplotlib.pyplot as plt
-from typing import Optional, Dict, Any, List, Union
+import time
+from typing import Optional, Dict, Any, List, Union, Callable, Iterator, Tuple
+from utils.rate_limiter import LLMTrafficGovernor, get_governor
+from utils.tracing import span, traced
+from utils.prompt_builder import PromptBuilder, DEFAULT_TOKEN_BUDGET, summarize_series, format_series_summary
 
 class DeepSeekAnalyzer:
     """DeepSeek API客户端，用于分析数据并生成报告"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    # 遇到429限流时的最大重试次数
+    MAX_RETRIES = 2
+    
+    # 请求超时（秒）：(建立连接, 两次读取之间)，超时后释放并发名额，避免上游挂起占满名额
+    REQUEST_TIMEOUT = (
+        float(os.environ.get("DEEPSEEK_CONNECT_TIMEOUT", 10)),
+        float(os.environ.get("DEEPSEEK_READ_TIMEOUT", 120)),
+    )
+    
+    # 默认API基础URL，可通过环境变量 DEEPSEEK_API_BASE_URL 指向本地替身服务
+    DEFAULT_API_BASE_URL = "https://api.deepseek.com"
+    
+    def __init__(self, api_key: Optional[str] = None, governor: Optional[LLMTrafficGovernor] = None,
+                 api_base_url: Optional[str] = None):
         self.api_key = api_key or os.environ.get("DEEPSEEK_API_KEY", "")
-        self.api_base_url = "https://api.deepseek.com"  # 更新为正确的API基础URL
+        self.api_base_url = (api_base_url or os.environ.get("DEEPSEEK_API_BASE_URL", "")
+                             or self.DEFAULT_API_BASE_URL).rstrip("/")
         self.model = "deepseek-chat"  # 默认模型
+        self.prompt_token_budget = DEFAULT_TOKEN_BUDGET  # 数据类提示的token预算
+        # 所有会话共享同一个流量控制器，避免突发请求触发429
+        self.governor = governor or get_governor()
         
     def set_api_key(self, api_key: str):
         """设置API密钥"""
         self.api_key = api_key
         
-    def analyze_metrics(self, metrics: Dict[str, Any]) -> str:
-        """分析汇率偏差指标"""
-        if not self.api_key:
-            return "请先设置DeepSeek API密钥"
-            
-        # 构建分析提示
-        prompt = f"""
-        请基于以下中美汇率与巨无霸指数偏差数据进行经济分析：
+    def set_api_base_url(self, api_base_url: str):
+        """设置API基础URL（例如本地替身服务 http://127.0.0.1:8787）"""
+        self.api_base_url = api_base_url.rstrip("/")
+        
+    def get_traffic_metrics(self) -> Dict[str, Any]:
+        """获取共享请求队列的排队与吞吐指标"""
+        return self.governor.snapshot()
+        
+    @staticmethod
+    def analysis_subject(metrics: Dict[str, Any]) -> Tuple[str, str]:
+        """分析对象的 (国家名称, 货币名称)，指标中未注明时为中国和人民币"""
+        return metrics.get('country_name', '中国'), metrics.get('currency_label', '人民币')
+        
+    def build_metrics_prompt(self, metrics: Dict[str, Any]) -> str:
+        """构建汇率偏差指标分析提示（按 metrics 中的 country_name / currency_label 填写分析对象）"""
+        country, currency = self.analysis_subject(metrics)
+        return f"""
+        请基于以下{currency}兑美元汇率与巨无霸指数偏差数据进行经济分析（{country}）：
         
         - 分析时间段: {metrics['data_period']}
         - 平均偏差百分比: {metrics['avg_deviation']:.2f}%
         - 最大偏差百分比: {metrics['max_deviation']:.2f}%
         - 最小偏差百分比: {metrics['min_deviation']:.2f}%
         - 最新偏差百分比: {metrics['latest_deviation']:.2f}%
-        - 汇率状态: 人民币相对美元{metrics['over_under']}
+        - 汇率状态: {currency}相对美元{metrics['over_under']}
         
         请回答：
-        1. 根据巨无霸指数，人民币相对美元汇率的总体状况如何？是被高估还是低估？程度如何？
+        1. 根据巨无霸指数，{currency}相对美元汇率的总体状况如何？是被高估还是低估？程度如何？
         2. 这种偏差的主要经济原因可能是什么？
-        3. 这种现象与中国的经济政策和国际贸易地位有何关联？
-        4. 巨无霸指数在预测中国汇率方面有哪些局限性？
+        3. 这种现象与{country}的经济政策和国际贸易地位有何关联？
+        4. 巨无霸指数在预测{country}汇率方面有哪些局限性？
         
         请给出专业、简洁的分析，每个问题的回答控制在100字左右。
         """
         
-        try:
-            # 请求API
-            response = self._call_api(prompt)
-            return response
-        except Exception as e:
-            return f"分析失败: {str(e)}"
-            
-    def analyze_data_trends(self, comparison_data: pd.DataFrame, include_chart: bool = False, chart_path: Optional[str] = None) -> str:
-        """分析汇率偏差趋势"""
-        if not self.api_key:
-            return "请先设置DeepSeek API密钥"
+    def analyze_metrics(self, metrics: Dict[str, Any]) -> str:
+        """分析汇率偏差指标，API调用失败时抛出异常（由调用方决定如何展示）"""
+        return self._call_api(self.build_metrics_prompt(metrics))
             
-        # 提取关键时间点的数据
-        recent_years = comparison_data.sort_values('date').tail(20)  # 最近的观测值
-        yearly_data = comparison_data.resample('Y', on='date').mean().reset_index()  # 年度平均
+    def build_trend_prompt(self, comparison_data: pd.DataFrame, country: str = '中国', currency: str = '人民币') -> str:
+        """构建汇率偏差趋势分析提示"""
+        # 将序列压缩为固定大小的摘要（分位数、分期均值、最大变化），提示长度不随数据跨度增长
+        comparison_data = comparison_data.sort_values('date')
+        summary = summarize_series(comparison_data, 'deviation_pct')
+        recent_summary = summarize_series(comparison_data.tail(20), 'deviation_pct', top_k=3)
             
         # 计算关键趋势指标
-        start_deviation = comparison_data.iloc[0]['deviation_pct']
-        end_deviation = comparison_data.iloc[-1]['deviation_pct']
+        start_deviation = summary['start_value']
+        end_deviation = summary['end_value']
         change = end_deviation - start_deviation
         
         # 查找峰值和谷值
@@ -71,40 +94,45 @@ class DeepSeekAnalyzer:
         trough_date = comparison_data.loc[comparison_data['deviation_pct'].idxmin(), 'date'].strftime('%Y-%m-%d')
         
         # 构建分析提示
-        prompt = f"""
-        请基于以下中美汇率与巨无霸指数偏差的趋势数据进行深入分析：
-        
-        - 分析时间段: {comparison_data['date'].min().strftime('%Y-%m-%d')} 至 {comparison_data['date'].max().strftime('%Y-%m-%d')}
+        builder = PromptBuilder(f"请基于以下{currency}兑美元汇率与巨无霸指数偏差的趋势数据进行深入分析（{country}）：",
+                                budget=self.prompt_token_budget)
+        builder.add_section("关键指标", f"""
+        - 分析时间段: {summary['start_date'].strftime('%Y-%m-%d')} 至 {summary['end_date'].strftime('%Y-%m-%d')}
         - 初始偏差: {start_deviation:.2f}%
         - 最终偏差: {end_deviation:.2f}%
         - 总体变化: {change:.2f}% ({'上升' if change > 0 else '下降'})
         - 最高偏差: {peak:.2f}% (于 {peak_date})
         - 最低偏差: {trough:.2f}% (于 {trough_date})
-        
-        请分析：
-        1. 在分析期间内，人民币汇率相对于巨无霸指数的偏差呈现什么样的总体趋势？
+        """, required=True)
+        builder.add_section("全期分布与分期均值", [
+            format_series_summary(summary),
+            format_series_summary(summary, top_k=3),
+            format_series_summary(summary, top_k=0, include_periods=False),
+        ])
+        builder.add_section("近期走势（最近20个观测）", [
+            format_series_summary(recent_summary, include_periods=False),
+            format_series_summary(recent_summary, top_k=0, include_periods=False),
+        ])
+        builder.add_section("请分析", f"""
+        1. 在分析期间内，{currency}汇率相对于巨无霸指数的偏差呈现什么样的总体趋势？
         2. 偏差出现峰值和谷值的时间点与当时的重大经济事件有何对应关系？
         3. 近期趋势如何？这可能预示着什么样的未来发展？
-        4. 基于巨无霸指数的分析，对中国汇率政策有何建议？
+        4. 基于巨无霸指数的分析，对{country}汇率政策有何建议？
         
         请给出专业、简洁的分析，每个问题的回答控制在150字左右。
-        """
-        
-        try:
-            # 请求API
-            response = self._call_api(prompt)
-            return response
-        except Exception as e:
-            return f"分析失败: {str(e)}"
+        """, required=True)
+        return builder.build()
     
-    def generate_report(self, metrics: Dict[str, Any], trend_analysis: str, metrics_analysis: str) -> str:
-        """生成完整分析报告"""
-        if not self.api_key:
-            return "请先设置DeepSeek API密钥"
-            
-        # 构建报告提示
-        prompt = f"""
-        请基于以下中美汇率与巨无霸指数分析内容，编写一份简明的学术分析报告：
+    def analyze_data_trends(self, comparison_data: pd.DataFrame, include_chart: bool = False, chart_path: Optional[str] = None,
+                            country: str = '中国', currency: str = '人民币') -> str:
+        """分析汇率偏差趋势，API调用失败时抛出异常"""
+        return self._call_api(self.build_trend_prompt(comparison_data, country, currency))
+    
+    def build_report_prompt(self, metrics: Dict[str, Any], trend_analysis: str, metrics_analysis: str) -> str:
+        """构建完整分析报告提示"""
+        country, currency = self.analysis_subject(metrics)
+        return f"""
+        请基于以下{currency}兑美元汇率与巨无霸指数分析内容（{country}），编写一份简明的学术分析报告：
         
         ## 基本数据
         - 分析时间段: {metrics['data_period']}
@@ -112,7 +140,7 @@ class DeepSeekAnalyzer:
         - 最大偏差百分比: {metrics['max_deviation']:.2f}%
         - 最小偏差百分比: {metrics['min_deviation']:.2f}%
         - 最新偏差百分比: {metrics['latest_deviation']:.2f}%
-        - 汇率状态: 人民币相对美元{metrics['over_under']}
+        - 汇率状态: {currency}相对美元{metrics['over_under']}
         
         ## 指标分析
         {metrics_analysis}
@@ -132,46 +160,116 @@ class DeepSeekAnalyzer:
         
         请确保报告内容专业、简洁、有逻辑性，总字数控制在1000字左右。
         """
+    
+    def generate_report(self, metrics: Dict[str, Any], trend_analysis: str, metrics_analysis: str) -> str:
+        """生成完整分析报告，API调用失败时抛出异常"""
+        return self._call_api(self.build_report_prompt(metrics, trend_analysis, metrics_analysis))
+    
+    @traced("deepseek.call_api")
+    def _call_api(self, prompt: str, on_wait: Optional[Callable[[int], None]] = None) -> str:
+        """调用DeepSeek API
         
-        try:
-            # 请求API
-            response = self._call_api(prompt)
-            return response
-        except Exception as e:
-            return f"报告生成失败: {str(e)}"
+        请求先在进程级队列中排队，on_wait 会在排队位置变化时收到当前位置。
+        """
+        if not self.api_key:
+            raise ValueError("未设置API密钥")
+            
+        # requests 仅在真正发起调用时加载，加快页面冷启动
+        import requests
+        
+        headers = self._build_headers()
+        data = self._build_payload(prompt, stream=False)
+        
+        for attempt in range(self.MAX_RETRIES + 1):
+            with span("deepseek.queue_wait"):
+                self.governor.acquire(on_wait=on_wait)
+            success = False
+            try:
+                with span("deepseek.http"):
+                    response = requests.post(
+                        f"{self.api_base_url}/chat/completions",
+                        headers=headers,
+                        json=data,
+                        timeout=self.REQUEST_TIMEOUT
+                    )
+                if response.status_code == 429 and attempt < self.MAX_RETRIES:
+                    self.governor.record_rate_limited()
+                    retry_after = response.headers.get("Retry-After", "")
+                    backoff = float(retry_after) if retry_after.isdigit() else 2 ** attempt
+                else:
+                    response.raise_for_status()
+                    content = response.json()["choices"][0]["message"]["content"]
+                    success = True
+                    return content
+                    
+            except requests.Timeout as e:
+                raise Exception(f"API请求超时: {str(e)}")
+            except requests.RequestException as e:
+                raise Exception(f"API请求失败: {str(e)}")
+            finally:
+                self.governor.release(success=success)
+            
+            # 在归还名额后再退避，避免占用并发名额
+            time.sleep(backoff)
     
-    def _call_api(self, prompt: str) -> str:
-        """调用DeepSeek API"""
+    def stream_api(self, prompt: str, on_wait: Optional[Callable[[int], None]] = None) -> Iterator[str]:
+        """以流式方式调用DeepSeek API，逐段返回生成的文本"""
         if not self.api_key:
             raise ValueError("未设置API密钥")
+        
+        import requests
             
-        headers = {
+        self.governor.acquire(on_wait=on_wait)
+        success = False
+        try:
+            with requests.post(
+                f"{self.api_base_url}/chat/completions",
+                headers=self._build_headers(),
+                json=self._build_payload(prompt, stream=True),
+                stream=True,
+                timeout=self.REQUEST_TIMEOUT
+            ) as response:
+                if response.status_code == 429:
+                    self.governor.record_rate_limited()
+                response.raise_for_status()
+                
+                # 解析SSE数据流：每行形如 "data: {...}"，以 "data: [DONE]" 结束
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    delta = json.loads(payload)["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        yield delta["content"]
+            success = True
+        except requests.Timeout as e:
+            raise Exception(f"API请求超时: {str(e)}")
+        except requests.RequestException as e:
+            raise Exception(f"API请求失败: {str(e)}")
+        finally:
+            self.governor.release(success=success)
+    
+    def _build_headers(self) -> Dict[str, str]:
+        """构建请求头"""
+        return {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
-        
-        data = {
+    
+    def _build_payload(self, prompt: str, stream: bool = False) -> Dict[str, Any]:
+        """构建 /chat/completions 请求体"""
+        return {
             "model": self.model,
             "messages": [
                 {"role": "system", "content": "你是一个专业的经济分析师，擅长分析汇率和购买力平价理论。"},
                 {"role": "user", "content": prompt}
             ],
-            "stream": False,
+            "stream": stream,
             "temperature": 0.7,
             "max_tokens": 2000
         }
-        
-        try:
-            response = requests.post(
-                f"{self.api_base_url}/chat/completions",
-                headers=headers,
-                json=data
-            )
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
-            
-        except requests.RequestException as e:
-            raise Exception(f"API请求失败: {str(e)}")
             
     # 模拟API调用的函数，实际部署时应删除此函数
     def mock_analyze_metrics(self, metrics: Dict[str, Any]) -> str:
@@ -204,6 +302,22 @@ class DeepSeekAnalyzer:
         """
         return response
         
+    def mock_country_report(self, metrics: Dict[str, Any]) -> str:
+        """模拟生成任一国家的分析报告（只根据指标填写，不含针对中国的论述）"""
+        currency = metrics.get('currency_label', '该货币')
+        response = f"""
+        # {currency}汇率与巨无霸指数分析报告（模拟）
+        
+        ## 数据概览
+        
+        {metrics['data_period']}期间，{currency}兑美元的市场汇率相对巨无霸汇率平均偏差为{metrics['avg_deviation']:.2f}%，最大偏差{metrics['max_deviation']:.2f}%，最小偏差{metrics['min_deviation']:.2f}%。最新一期偏差为{metrics['latest_deviation']:.2f}%，按巨无霸指数衡量，{currency}相对美元处于{metrics['over_under']}状态。
+        
+        ## 说明
+        
+        这是本地模拟生成的示例报告，只根据上述指标填写，不包含对该国经济政策的分析。设置DeepSeek API密钥后可生成完整的AI分析报告。
+        """
+        return response
+        
     def mock_generate_report(self, metrics: Dict[str, Any]) -> str:
         """模拟生成完整分析报告"""
         response = f"""
@@ -0,0 +1,232 @@
+"""离线批量报告生成
+
+对完整的巨无霸指数面板，按国家和时间段并行计算分析指标（进程池，各进程内存映射同一份
+三维面板文件），再以受限的API并发
+生成AI报告（或使用本地模拟报告），结果写入报告目录并生成 manifest.json 供课堂浏览。
+
+用法：
+    python -m utils.batch_report --output reports --mock
+    python -m utils.batch_report --countries CHN,JPN,GBR --periods all,2000-2009,2010-2019 --api-concurrency 2
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Tuple, Optional, Dict, Any
+
+import pandas as pd
+
+from utils.data_processor import (DataProcessor, load_bigmac_panel, build_country_comparison,
+                                  compute_key_metrics)
+from utils.fx import market_rate_frame
+from utils.panel import BigMacPanel
+
+MANIFEST_NAME = "manifest.json"
+
+# 各进程内存映射的面板数据（由进程池初始化函数设置）
+_worker_panel = None
+_worker_fx_matrix = None
+
+
+def parse_periods(spec: str, min_year: int, max_year: int) -> List[Tuple[str, int, int]]:
+    """解析时间段参数
+
+    支持 "all"（全部年份）、"decade"（按十年切分）以及 "2000-2009"、"2015-" 形式的区间，以逗号分隔。
+    """
+    periods = []
+    for item in [p.strip() for p in spec.split(",") if p.strip()]:
+        if item == "all":
+            periods.append(("all", min_year, max_year))
+        elif item == "decade":
+            for start in range(min_year - min_year % 10, max_year + 1, 10):
+                periods.append((f"{start}s", max(start, min_year), min(start + 9, max_year)))
+        elif "-" in item:
+            start, _, end = item.partition("-")
+            start_year = int(start) if start else min_year
+            end_year = int(end) if end else max_year
+            periods.append((f"{start_year}-{end_year}", start_year, end_year))
+        else:
+            year = int(item)
+            periods.append((str(year), year, year))
+    return periods
+
+
+def _init_worker(panel_dir: str, fx_matrix: Optional[pd.DataFrame]):
+    global _worker_panel, _worker_fx_matrix
+    _worker_panel = BigMacPanel.load(panel_dir, mmap=True)
+    _worker_fx_matrix = fx_matrix
+
+
+def _analyze_country(iso_a3: str, periods: List[Tuple[str, int, int]]) -> List[Dict[str, Any]]:
+    """在工作进程中计算单个国家各时间段的对比数据与关键指标"""
+    country_rows = _worker_panel.to_frame([iso_a3, 'USA'])
+    # 中行牌价中有该国货币时使用牌价套算的市场汇率，否则使用面板中的 dollar_ex
+    currency = str(country_rows.loc[country_rows['iso_a3'] == iso_a3, 'currency_code'].iloc[-1])
+    rates = market_rate_frame(_worker_fx_matrix, currency) if _worker_fx_matrix is not None else None
+    comparison = build_country_comparison(country_rows, iso_a3, rates)
+    if comparison.empty:
+        return []
+
+    results = []
+    for label, start_year, end_year in periods:
+        years = comparison['date'].dt.year
+        subset = comparison[(years >= start_year) & (years <= end_year)].reset_index(drop=True)
+        # 少于2个观测点时无法分析趋势
+        if len(subset) < 2:
+            continue
+        results.append({
+            'iso_a3': iso_a3,
+            'name': str(subset['name'].iloc[0]),
+            'currency_code': str(subset['currency_code'].iloc[0]),
+            'period': label,
+            'metrics': compute_key_metrics(subset),
+            'comparison': subset[['date', 'local_price', 'dollar_price', 'actual_rate',
+                                  'big_mac_rate', 'deviation_pct']],
+        })
+    return results
+
+
+def _generate_report(item: Dict[str, Any], analyzer, use_mock: bool) -> str:
+    """为一个国家/时间段生成报告文本，API调用失败时抛出异常（该报告记为失败）"""
+    metrics = dict(item['metrics'], country_name=item['name'],
+                   currency_label=f"{item['name']}货币({item['currency_code']})")
+    if use_mock:
+        # 本地模拟报告的论述针对人民币，其他国家使用只陈述指标的模拟报告
+        if item['iso_a3'] == 'CHN':
+            return analyzer.mock_generate_report(metrics)
+        return analyzer.mock_country_report(metrics)
+    metrics_analysis = analyzer.analyze_metrics(metrics)
+    trend_analysis = analyzer.analyze_data_trends(item['comparison'], country=metrics['country_name'],
+                                                  currency=metrics['currency_label'])
+    return analyzer.generate_report(metrics, trend_analysis, metrics_analysis)
+
+
+def _jsonable(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: (float(v) if not isinstance(v, str) else v) for k, v in metrics.items()}
+
+
+def run_batch(output_dir: str, countries: Optional[List[str]] = None, period_spec: str = "all,decade",
+              workers: Optional[int] = None, api_concurrency: int = 2, use_mock: bool = True,
+              api_key: Optional[str] = None, panel_path: Optional[str] = None) -> Dict[str, Any]:
+    """批量生成报告并写入 manifest，返回 manifest 内容"""
+    from utils.ai_analyzer import DeepSeekAnalyzer
+    from utils.rate_limiter import LLMTrafficGovernor
+
+    started = time.time()
+    panel = load_bigmac_panel(panel_path)
+    # 面板中没有的国家代码记为失败，其余国家照常生成
+    failed: Dict[str, str] = {}
+    if countries:
+        known = set(panel['iso_a3'].astype(str))
+        failed = {iso: f"面板中没有国家 {iso} 的数据" for iso in countries if iso not in known or iso == 'USA'}
+        countries = [iso for iso in countries if iso not in failed]
+        if not countries:
+            raise ValueError(f"面板中没有所选国家的数据: {', '.join(failed)}")
+        panel = panel[panel['iso_a3'].isin(set(countries) | {'USA'})]
+    try:
+        fx_matrix = DataProcessor().load_builtin_fx_matrix()
+    except ValueError:
+        fx_matrix = None
+
+    years = panel['date'].dt.year
+    periods = parse_periods(period_spec, int(years.min()), int(years.max()))
+    iso_codes = sorted(countries or panel.loc[panel['iso_a3'] != 'USA', 'iso_a3'].unique())
+
+    # 第一阶段：进程池并行计算各国指标，面板保存为可内存映射的文件，不再逐进程序列化数据框
+    items = []
+    with tempfile.TemporaryDirectory(prefix="bigmac-panel-") as panel_dir:
+        BigMacPanel.from_frame(panel).save(panel_dir)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(panel_dir, fx_matrix)) as pool:
+            futures = {pool.submit(_analyze_country, iso, periods): iso for iso in iso_codes}
+            for future in as_completed(futures):
+                try:
+                    items.extend(future.result())
+                except Exception as e:
+                    failed[futures[future]] = str(e)
+    items.sort(key=lambda item: (item['iso_a3'], item['period']))
+
+    # 第二阶段：以受限的API并发生成报告
+    governor = LLMTrafficGovernor(max_concurrency=api_concurrency, burst=api_concurrency)
+    analyzer = DeepSeekAnalyzer(api_key=api_key, governor=governor)
+    if not use_mock and not analyzer.api_key:
+        raise ValueError("未设置API密钥，请通过 --api-key 或 DEEPSEEK_API_KEY 提供，或使用 --mock")
+
+    os.makedirs(output_dir, exist_ok=True)
+    entries = []
+
+    def _process(item):
+        entry = {
+            'iso_a3': item['iso_a3'],
+            'name': item['name'],
+            'currency_code': item['currency_code'],
+            'period': item['period'],
+            'metrics': _jsonable(item['metrics']),
+            'source': 'mock' if use_mock else 'api',
+        }
+        try:
+            report = _generate_report(item, analyzer, use_mock)
+            relative_path = os.path.join(item['iso_a3'], f"{item['period']}.md")
+            path = os.path.join(output_dir, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"<!-- {item['name']} ({item['iso_a3']}) {item['metrics']['data_period']} -->\n")
+                f.write(report)
+            entry.update(status='ok', report_path=relative_path)
+        except Exception as e:
+            entry.update(status='failed', error=str(e))
+        entry['generated_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max(1, api_concurrency)) as pool:
+        entries = list(pool.map(_process, items))
+
+    manifest = {
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'elapsed_sec': round(time.time() - started, 2),
+        'source': 'mock' if use_mock else 'api',
+        'periods': [label for label, _, _ in periods],
+        'failed': failed,
+        'reports': entries,
+    }
+    tmp_path = os.path.join(output_dir, f"{MANIFEST_NAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST_NAME))
+    return manifest
+
+
+def load_report_manifest(output_dir: str) -> Optional[Dict[str, Any]]:
+    """读取报告目录中的 manifest，不存在时返回None"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线批量生成巨无霸指数分析报告")
+    parser.add_argument("--output", default="reports", help="报告输出目录")
+    parser.add_argument("--countries", default="", help="逗号分隔的ISO国家代码，默认全部国家")
+    parser.add_argument("--periods", default="all,decade", help="时间段，如 all,decade,2000-2009,2015-")
+    parser.add_argument("--workers", type=int, default=None, help="分析进程数，默认使用CPU核数")
+    parser.add_argument("--api-concurrency", type=int, default=2, help="同时进行的API请求数上限")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟报告，不调用API")
+    parser.add_argument("--api-key", default=None, help="DeepSeek API密钥，默认读取 DEEPSEEK_API_KEY")
+    parser.add_argument("--panel", default=None, help="巨无霸指数面板CSV路径，默认使用内置数据")
+    args = parser.parse_args(argv)
+
+    countries = [c.strip().upper() for c in args.countries.split(",") if c.strip()] or None
+    manifest = run_batch(args.output, countries, args.periods, args.workers, args.api_concurrency,
+                         args.mock, args.api_key, args.panel)
+    ok = sum(1 for entry in manifest['reports'] if entry['status'] == 'ok')
+    print(f"已生成 {ok}/{len(manifest['reports'])} 份报告，用时 {manifest['elapsed_sec']} 秒，输出目录: {args.output}")
+    for iso, error in manifest['failed'].items():
+        print(f"  {iso}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""服务端静态图表渲染
+
+直接使用 matplotlib.figure.Figure 和 Agg 画布，不经过 pyplot：图形不会登记到 pyplot 的全局
+图形管理器，也不修改全局样式（rcParams），可以在多个Streamlit脚本线程中同时使用。
+渲染结果按 (数据指纹, 图表类型, 格式, 尺寸, 分辨率) 缓存为PNG/SVG字节串，图形在渲染后立即清理释放。
+"""
+import io
+from typing import Tuple, Optional, Dict, Callable, TYPE_CHECKING
+
+import pandas as pd
+
+from utils.exporter import ExportCache, analysis_fingerprint
+from utils.tracing import span
+
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+
+CHART_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+DEFAULT_SIZE = (12.0, 6.0)
+DEFAULT_DPI = 100
+
+# 与 seaborn whitegrid 风格相近的坐标轴设置，逐个图形应用，不改动全局rcParams
+_GRID_COLOR = '#dddddd'
+
+
+def _apply_whitegrid(ax: "Axes"):
+    ax.set_facecolor('white')
+    ax.grid(True, color=_GRID_COLOR, linewidth=0.8)
+    ax.set_axisbelow(True)
+    for spine in ax.spines.values():
+        spine.set_color(_GRID_COLOR)
+
+
+def _draw_comparison(ax: "Axes", data: pd.DataFrame):
+    ax.plot(data['date'], data['big_mac_rate'], 'b-', label='Big Mac Index Rate')
+    ax.plot(data['date'], data['actual_rate'], 'r-', label='Actual Market Rate')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('CNY/USD Exchange Rate')
+    ax.set_title('Big Mac Index Predicted Rate vs Actual Market Rate')
+    ax.legend(loc='best')
+
+
+def _draw_deviation(ax: "Axes", data: pd.DataFrame):
+    ax.bar(data['date'], data['deviation_pct'], color='green', alpha=0.7)
+    ax.axhline(y=0, color='black', linestyle='-', alpha=0.3)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Deviation Percentage (%)')
+    ax.set_title('CNY/USD Exchange Rate: Market Rate vs Big Mac Index Prediction Deviation')
+
+
+CHART_DRAWERS: Dict[str, Callable[["Axes", pd.DataFrame], None]] = {
+    'comparison': _draw_comparison,
+    'deviation': _draw_deviation,
+}
+
+
+def new_figure(size: Tuple[float, float] = DEFAULT_SIZE, dpi: int = DEFAULT_DPI) -> "Figure":
+    """创建不登记到 pyplot 的图形（附带Agg画布）"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def build_figure(data: pd.DataFrame, chart_type: str, size: Tuple[float, float] = DEFAULT_SIZE,
+                 dpi: int = DEFAULT_DPI) -> "Figure":
+    """绘制指定类型的图表并返回图形对象（调用方用完后无需关闭，不再引用即可回收）"""
+    if chart_type not in CHART_DRAWERS:
+        raise ValueError(f"不支持的图表类型: {chart_type}")
+    fig = new_figure(size, dpi)
+    ax = fig.add_subplot()
+    _apply_whitegrid(ax)
+    CHART_DRAWERS[chart_type](ax, data)
+    fig.tight_layout()
+    return fig
+
+
+def figure_to_bytes(fig: "Figure", fmt: str = 'png', release: bool = True) -> bytes:
+    """把图形渲染为PNG/SVG字节串；release=True 时渲染后清空图形，释放其中的绘图对象"""
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"不支持的图片格式: {fmt}")
+    output = io.BytesIO()
+    try:
+        fig.savefig(output, format=fmt)
+    finally:
+        if release:
+            fig.clear()
+    return output.getvalue()
+
+
+_chart_cache = ExportCache(max_bytes=32 * 1024 * 1024)
+
+
+def render_chart(data: pd.DataFrame, chart_type: str, fmt: str = 'png',
+                 size: Tuple[float, float] = DEFAULT_SIZE, dpi: int = DEFAULT_DPI,
+                 fingerprint: Optional[str] = None, cache: Optional[ExportCache] = None) -> bytes:
+    """渲染图表为字节串，相同数据、类型、格式和尺寸只渲染一次"""
+    if chart_type not in CHART_DRAWERS:
+        raise ValueError(f"不支持的图表类型: {chart_type}")
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"不支持的图片格式: {fmt}")
+    cache = cache or _chart_cache
+    key = (fingerprint or analysis_fingerprint(data), chart_type, fmt, tuple(size), dpi)
+    payload = cache.get(key)
+    if payload is None:
+        with span(f"chart.render.{chart_type}", rows=len(data)):
+            payload = figure_to_bytes(build_figure(data, chart_type, size, dpi), fmt)
+        cache.put(key, payload)
+    return payload
@@ -0,0 +1,184 @@
+"""全部国家并行分析流水线
+
+对巨无霸面板中的每个国家执行与数据分析页相同的流程：与同期美国价格对比得到巨无霸汇率和偏差、
+计算关键指标、识别显著变化点。各国的计算分发到进程池中执行；面板和汇率宽表只在主进程复制一次
+到共享内存，工作进程直接映射，不逐个任务序列化数据框。各国结果合并为两张整洁的表：
+
+- summary：每个国家一行，包含关键指标和显著变化点统计；
+- series：每个国家每个发布日期一行，包含汇率、偏差、变化量和是否为显著变化点。
+
+用法：
+    python -m utils.country_pipeline --workers 4 --output country_summary.csv
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.data_processor import build_country_comparison, compute_key_metrics, flag_change_points, load_bigmac_panel
+from utils.fx import market_rate_frame
+from utils.panel import BigMacPanel
+from utils.shared_arrays import ArraySpec, SharedArrays, attach_arrays
+from utils.tracing import span
+
+DEFAULT_CHANGE_PERCENTILE = 90
+
+SERIES_COLUMNS = ['iso_a3', 'date', 'local_price', 'us_price', 'actual_rate', 'big_mac_rate',
+                  'deviation_pct', 'monthly_change', 'significant']
+
+# 进度回调：(已完成国家数, 国家总数, 刚完成的国家代码)
+ProgressCallback = Callable[[int, int, str], None]
+
+# 工作进程映射的共享数据（由进程池初始化函数设置）
+_worker_panel = None
+_worker_fx_matrix = None
+_worker_blocks: List[Any] = []
+
+
+def _share_fx_matrix(fx_matrix: pd.DataFrame) -> SharedArrays:
+    columns = [col for col in fx_matrix.columns if col != 'date']
+    return SharedArrays({
+        'date': fx_matrix['date'].to_numpy(dtype='datetime64[ns]'),
+        'values': fx_matrix[columns].to_numpy(dtype=np.float64),
+    })
+
+
+def _init_worker(panel_spec: ArraySpec, panel_labels: dict, fx_spec: Optional[ArraySpec],
+                 fx_columns: List[str]):
+    global _worker_panel, _worker_fx_matrix, _worker_blocks
+    _worker_panel, _worker_blocks = BigMacPanel.attach(panel_spec, panel_labels)
+    if fx_spec is not None:
+        arrays, blocks = attach_arrays(fx_spec)
+        _worker_blocks.extend(blocks)
+        _worker_fx_matrix = pd.DataFrame(arrays['values'], columns=fx_columns)
+        _worker_fx_matrix.insert(0, 'date', arrays['date'])
+
+
+def analyze_country(panel: BigMacPanel, iso_a3: str, fx_matrix: Optional[pd.DataFrame] = None,
+                    change_percentile: float = DEFAULT_CHANGE_PERCENTILE) -> Optional[Dict[str, Any]]:
+    """单个国家的对比、关键指标和显著变化点；观测少于2期时返回None"""
+    country_rows = panel.to_frame([iso_a3, 'USA'])
+    own_rows = country_rows[country_rows['iso_a3'] == iso_a3]
+    if own_rows.empty:
+        return None
+    currency = str(own_rows['currency_code'].iloc[-1])
+    # 汇率宽表中有该货币时使用牌价套算的市场汇率，否则使用面板中的 dollar_ex
+    rates = market_rate_frame(fx_matrix, currency) if fx_matrix is not None else None
+    comparison = build_country_comparison(country_rows, iso_a3, rates)
+    if len(comparison) < 2:
+        return None
+
+    flagged, threshold_value = flag_change_points(comparison, change_percentile)
+    change_points = flagged[flagged['significant']]
+    metrics = compute_key_metrics(comparison)
+    summary = {
+        'iso_a3': iso_a3,
+        'name': panel.names.get(iso_a3, iso_a3),
+        'currency_code': currency,
+        'rate_source': 'fx' if rates is not None else 'panel',
+        'observations': len(comparison),
+        **metrics,
+        'change_threshold': threshold_value,
+        'change_points': len(change_points),
+        'latest_change_point': change_points['date'].max() if len(change_points) else pd.NaT,
+    }
+    series = flagged.assign(iso_a3=iso_a3)[SERIES_COLUMNS]
+    return {'summary': summary, 'series': series}
+
+
+def _analyze_in_worker(iso_a3: str, change_percentile: float) -> Optional[Dict[str, Any]]:
+    return analyze_country(_worker_panel, iso_a3, _worker_fx_matrix, change_percentile)
+
+
+def run_country_pipeline(panel: Optional[BigMacPanel] = None, fx_matrix: Optional[pd.DataFrame] = None,
+                         countries: Optional[List[str]] = None, workers: Optional[int] = None,
+                         change_percentile: float = DEFAULT_CHANGE_PERCENTILE,
+                         progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """并行分析多个国家，返回 {'summary', 'series', 'failed', 'elapsed_sec'}
+
+    panel 默认使用内置面板；countries 默认为除美国外的全部国家；
+    progress 在主进程中每完成一个国家调用一次，可直接更新Streamlit进度条。
+    """
+    started = time.perf_counter()
+    if panel is None:
+        panel = BigMacPanel.from_frame(load_bigmac_panel())
+    iso_codes = sorted(countries or [iso for iso in panel.countries if iso != 'USA'])
+    unknown = [iso for iso in iso_codes if iso not in panel.country_index]
+    if unknown:
+        raise ValueError(f"面板中没有以下国家: {', '.join(unknown)}")
+
+    results: List[Dict[str, Any]] = []
+    failed: Dict[str, str] = {}
+    fx_columns = [col for col in fx_matrix.columns if col != 'date'] if fx_matrix is not None else []
+    with span("pipeline.countries", rows=len(iso_codes)):
+        with panel.share() as shared_panel:
+            shared_fx = _share_fx_matrix(fx_matrix) if fx_matrix is not None else None
+            try:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(shared_panel.spec, panel.labels(),
+                                                   shared_fx.spec if shared_fx else None, fx_columns)) as pool:
+                    futures = {pool.submit(_analyze_in_worker, iso, change_percentile): iso for iso in iso_codes}
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        iso = futures[future]
+                        try:
+                            result = future.result()
+                            if result is not None:
+                                results.append(result)
+                        except Exception as e:
+                            failed[iso] = str(e)
+                        if progress is not None:
+                            progress(done, len(iso_codes), iso)
+            finally:
+                if shared_fx is not None:
+                    shared_fx.close()
+
+    results.sort(key=lambda result: result['summary']['iso_a3'])
+    summary = pd.DataFrame([result['summary'] for result in results])
+    series = (pd.concat([result['series'] for result in results], ignore_index=True)
+              if results else pd.DataFrame(columns=SERIES_COLUMNS))
+    return {
+        'summary': summary,
+        'series': series,
+        'failed': failed,
+        'elapsed_sec': time.perf_counter() - started,
+    }
+
+
+def main(argv=None):
+    from utils.data_processor import DataProcessor
+
+    parser = argparse.ArgumentParser(description="并行分析巨无霸面板中的全部国家")
+    parser.add_argument("--countries", default="", help="逗号分隔的ISO国家代码，默认全部国家")
+    parser.add_argument("--workers", type=int, default=None, help="分析进程数，默认使用CPU核数")
+    parser.add_argument("--percentile", type=float, default=DEFAULT_CHANGE_PERCENTILE, help="显著变化点的百分位数阈值")
+    parser.add_argument("--panel", default=None, help="巨无霸指数面板CSV路径，默认使用内置数据")
+    parser.add_argument("--output", default=None, help="把各国汇总表写入CSV文件")
+    parser.add_argument("--series-output", default=None, help="把各国逐期数据写入CSV文件")
+    args = parser.parse_args(argv)
+
+    try:
+        fx_matrix = DataProcessor().load_builtin_fx_matrix()
+    except ValueError:
+        fx_matrix = None
+    countries = [c.strip().upper() for c in args.countries.split(",") if c.strip()] or None
+
+    def _print_progress(done, total, iso):
+        print(f"\r已完成 {done}/{total}（{iso}）", end="", flush=True)
+
+    result = run_country_pipeline(BigMacPanel.from_frame(load_bigmac_panel(args.panel)), fx_matrix, countries,
+                                  args.workers, args.percentile, progress=_print_progress)
+    print()
+    print(f"分析了 {len(result['summary'])} 个国家，失败 {len(result['failed'])} 个，用时 {result['elapsed_sec']:.2f} 秒")
+    for iso, error in result['failed'].items():
+        print(f"  {iso}: {error}")
+    if args.output:
+        result['summary'].to_csv(args.output, index=False, encoding="utf-8-sig")
+    if args.series_output:
+        result['series'].to_csv(args.series_output, index=False, encoding="utf-8-sig")
+
+
+if __name__ == "__main__":
+    main()
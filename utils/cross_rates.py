@@ -0,0 +1,53 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+
+class CrossRateMatrix:
+    """某一发布日期所有货币两两之间的隐含购买力平价汇率与估值矩阵
+
+    第 i 行第 j 列表示货币 i 相对基准货币 j：
+    - implied_ppp[i, j] = 本国巨无霸价格_i / 本国巨无霸价格_j（1单位货币j兑货币i的巨无霸汇率）
+    - market_rate[i, j] = dollar_ex_i / dollar_ex_j（市场交叉汇率）
+    - valuation[i, j] = implied_ppp / market_rate - 1，等价于美元价格之比减1
+    - adjusted_valuation 用经人均GDP调整后的价格计算
+    选择任一基准货币只是取一列，不需要重新计算。
+    """
+
+    def __init__(self, date: np.datetime64, currency_codes: np.ndarray, local_price: np.ndarray,
+                 dollar_ex: np.ndarray, adj_price: np.ndarray):
+        self.date = date
+        self.currency_codes = currency_codes
+        self._positions: Dict[str, int] = {code: i for i, code in enumerate(currency_codes)}
+
+        dollar_price = local_price / dollar_ex
+        adj_ratio = dollar_price / adj_price
+        # 一次广播得到全部货币对
+        self.implied_ppp = local_price[:, None] / local_price[None, :]
+        self.market_rate = dollar_ex[:, None] / dollar_ex[None, :]
+        self.valuation = dollar_price[:, None] / dollar_price[None, :] - 1
+        self.adjusted_valuation = adj_ratio[:, None] / adj_ratio[None, :] - 1
+
+    def position(self, base: str) -> int:
+        """基准货币在矩阵中的列号"""
+        try:
+            return self._positions[base]
+        except KeyError:
+            raise ValueError(f"{pd.Timestamp(self.date).strftime('%Y-%m-%d')} 没有基准货币 {base} 的数据")
+
+    def for_base(self, base: str) -> pd.DataFrame:
+        """各货币相对指定基准货币的隐含汇率、市场汇率和估值（百分比）"""
+        j = self.position(base)
+        return pd.DataFrame({
+            'currency_code': self.currency_codes,
+            'implied_ppp': self.implied_ppp[:, j],
+            'market_rate': self.market_rate[:, j],
+            'valuation': self.valuation[:, j] * 100,
+            'adjusted_valuation': self.adjusted_valuation[:, j] * 100,
+        })
+
+    def valuation_frame(self, adjusted: bool = False) -> pd.DataFrame:
+        """完整的估值矩阵（百分比），行为被估值货币，列为基准货币"""
+        values = self.adjusted_valuation if adjusted else self.valuation
+        return pd.DataFrame(values * 100, index=self.currency_codes, columns=self.currency_codes)
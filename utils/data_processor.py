@@ -1,95 +1,216 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional, Sequence, TYPE_CHECKING
 import os
 import io
+from utils.exporter import export_bytes, analysis_fingerprint
+from utils.dtypes import compact_frame
+from utils.frame_registry import InternedFrame, FrameHandle
+from utils.tracing import span, traced
+from utils.chart_renderer import DEFAULT_SIZE, build_figure, render_chart
+from utils.fx import parse_fx_quotes, reference_rates, market_rate_frame
+from utils.store import BUILTIN_SOURCE, get_store
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+# 内置数据目录
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+BIGMAC_DATA_PATH = os.path.join(DATA_DIR, 'big-mac-full-index.csv')
+EXCHANGE_RATE_DATA_PATH = os.path.join(DATA_DIR, 'RESSET_FXBOCQUOT.xlsx')
+
+
+def load_bigmac_panel(path: Optional[str] = None) -> pd.DataFrame:
+    """加载完整的多国巨无霸指数面板数据"""
+    panel = pd.read_csv(path or BIGMAC_DATA_PATH)
+    panel['date'] = pd.to_datetime(panel['date'])
+    return compact_frame(panel.sort_values(['date', 'iso_a3']).reset_index(drop=True))
+
+
+def _deviation_pct(actual_rate: pd.Series, big_mac_rate: pd.Series) -> pd.Series:
+    """计算偏差百分比（始终以float64计算，避免float32输入放大误差）"""
+    actual_rate = actual_rate.astype(np.float64)
+    big_mac_rate = big_mac_rate.astype(np.float64)
+    return (actual_rate - big_mac_rate) / big_mac_rate * 100
+
+
+def _add_bigmac_rate(comparison_data: pd.DataFrame) -> pd.DataFrame:
+    """计算巨无霸汇率和偏差百分比（各对比数据统一使用的口径）
+
+    巨无霸汇率 = 本国巨无霸价格 ÷ 同期美国巨无霸价格（us_price），即购买力平价汇率；
+    偏差 = (实际汇率 - 巨无霸汇率) ÷ 巨无霸汇率。
+    """
+    comparison_data['big_mac_rate'] = (comparison_data['local_price'].astype(np.float64)
+                                       / comparison_data['us_price'].astype(np.float64))
+    comparison_data['deviation_pct'] = _deviation_pct(comparison_data['actual_rate'], comparison_data['big_mac_rate'])
+    return comparison_data
+
+
+def _select_china(raw_data: pd.DataFrame) -> pd.DataFrame:
+    """筛选中国的数据，并附上同期美国巨无霸价格 us_price（用于计算巨无霸汇率）"""
+    columns = ['date', 'name', 'local_price', 'dollar_ex', 'dollar_price']
+    if 'USD_raw' in raw_data.columns:
+        columns.append('USD_raw')
+    cn_data = raw_data.loc[raw_data['iso_a3'] == 'CHN', columns]
+    us_price = raw_data.loc[raw_data['iso_a3'] == 'USA', ['date', 'local_price']].rename(columns={'local_price': 'us_price'})
+    if us_price.empty:
+        raise ValueError("数据中没有美国(USA)的巨无霸价格，无法计算巨无霸汇率")
+    return cn_data.merge(us_price, on='date', how='inner')
+
+
+def build_comparison(bigmac_data: pd.DataFrame, exchange_rate_data: pd.DataFrame) -> pd.DataFrame:
+    """合并巨无霸数据与汇率数据，计算巨无霸汇率和偏差百分比（口径见 _add_bigmac_rate）"""
+    if 'us_price' not in bigmac_data.columns:
+        raise ValueError("巨无霸数据缺少同期美国价格(us_price)，请重新加载数据")
+    with span("data.merge_asof", rows=len(bigmac_data)):
+        comparison_data = pd.merge_asof(
+            bigmac_data.sort_values('date'), 
+            exchange_rate_data.sort_values('date'), 
+            on='date', 
+            direction='nearest'
+        )
+    
+    return compact_frame(_add_bigmac_rate(comparison_data))
+
+
+def build_country_comparison(panel: pd.DataFrame, iso_a3: str,
+                             exchange_rate_data: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """基于面板数据计算任一国家相对美国的巨无霸汇率与偏差
+    
+    巨无霸汇率与偏差的口径与 build_comparison 相同（见 _add_bigmac_rate）；实际汇率默认使用面板中的
+    dollar_ex，提供 exchange_rate_data 时改用其中的 actual_rate。
+    """
+    country = panel[panel['iso_a3'] == iso_a3]
+    us_price = panel.loc[panel['iso_a3'] == 'USA', ['date', 'local_price']].rename(columns={'local_price': 'us_price'})
+    comparison_data = country.merge(us_price, on='date', how='inner').sort_values('date')
+    
+    if exchange_rate_data is not None:
+        with span("data.merge_asof", rows=len(comparison_data)):
+            comparison_data = pd.merge_asof(comparison_data, exchange_rate_data.sort_values('date'),
+                                            on='date', direction='nearest')
+    else:
+        comparison_data['actual_rate'] = comparison_data['dollar_ex']
+    
+    return compact_frame(_add_bigmac_rate(comparison_data.reset_index(drop=True)))
+
+
+def compute_key_metrics(comparison_data: pd.DataFrame) -> dict:
+    """根据对比数据计算关键指标"""
+    deviation = comparison_data['deviation_pct']
+    latest = comparison_data.iloc[-1]
+    return {
+        'avg_deviation': deviation.mean(),
+        'max_deviation': deviation.max(),
+        'min_deviation': deviation.min(),
+        'latest_deviation': latest['deviation_pct'],
+        'avg_bigmac_rate': comparison_data['big_mac_rate'].mean(),
+        'latest_bigmac_rate': latest['big_mac_rate'],
+        'latest_actual_rate': latest['actual_rate'],
+        'data_period': f"{comparison_data['date'].min().strftime('%Y-%m-%d')} 至 {comparison_data['date'].max().strftime('%Y-%m-%d')}",
+        'over_under': "低估" if latest['deviation_pct'] < 0 else "高估"
+    }
+
+
+def flag_change_points(comparison_data: pd.DataFrame, percentile: float = 90) -> Tuple[pd.DataFrame, float]:
+    """计算相邻两期偏差的变化量，标记绝对变化量超过给定百分位数的显著变化点
+
+    返回 (增加 monthly_change / abs_monthly_change / significant 列的数据副本, 变化量阈值)。
+    """
+    monthly_change = comparison_data['deviation_pct'].astype(np.float64).diff()
+    abs_monthly_change = monthly_change.abs()
+    threshold_value = float(abs_monthly_change.quantile(percentile / 100))
+    flagged = comparison_data.assign(
+        monthly_change=monthly_change,
+        abs_monthly_change=abs_monthly_change,
+        significant=abs_monthly_change > threshold_value,
+    )
+    return flagged, threshold_value
+
 
 class DataProcessor:
-    """处理巨无霸指数和汇率数据的工具类"""
+    """处理巨无霸指数和汇率数据的工具类
+    
+    各份数据均登记在共享的数据框登记表中，实例只保存句柄；内容相同的数据在各会话间只保存一份。
+    """
+    
+    bigmac_data = InternedFrame()
+    exchange_rate_data = InternedFrame()
+    comparison_data = InternedFrame()
+    fx_matrix = InternedFrame()
     
     def __init__(self):
         self.bigmac_data = None
         self.exchange_rate_data = None
         self.comparison_data = None
-        
+        self.fx_matrix = None
+        # 分析库中对应当前数据的数据源（内置数据或按内容指纹命名的上传数据）
+        self.store_sources = {'bigmac': BUILTIN_SOURCE, 'fx': BUILTIN_SOURCE}
+    
+    def handle(self, name: str) -> Optional[FrameHandle]:
+        """返回 bigmac_data / exchange_rate_data / comparison_data / fx_matrix 对应的句柄，便于保存到会话状态"""
+        if name not in ('bigmac_data', 'exchange_rate_data', 'comparison_data', 'fx_matrix'):
+            raise ValueError(f"未知的数据名称: {name}")
+        return self.__dict__.get(f"_{name}_handle")
+
+    def adopt(self, handles: Dict[str, Optional[FrameHandle]]):
+        """直接使用已预处理好的内置数据句柄（见 utils.data_registry），不重新读取文件"""
+        for name, frame_handle in handles.items():
+            if name not in ('bigmac_data', 'exchange_rate_data', 'comparison_data', 'fx_matrix'):
+                raise ValueError(f"未知的数据名称: {name}")
+            setattr(self, name, frame_handle)
+        self.store_sources = {'bigmac': BUILTIN_SOURCE, 'fx': BUILTIN_SOURCE}
+
+    @traced("data.load_builtin_bigmac")
     def load_builtin_bigmac_data(self) -> pd.DataFrame:
         """加载内置的巨无霸指数数据"""
         try:
             # 读取内置数据
-            data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'big-mac-full-index.csv')
-            self.bigmac_data = pd.read_csv(data_path)
+            with span("data.read_csv") as read_span:
+                raw_data = pd.read_csv(BIGMAC_DATA_PATH)
+                read_span.rows = len(raw_data)
             
             # 数据预处理
             # 转换日期格式
-            self.bigmac_data['date'] = pd.to_datetime(self.bigmac_data['date'])
+            raw_data['date'] = pd.to_datetime(raw_data['date'])
             
-            # 筛选中国的数据
-            cn_data = self.bigmac_data[self.bigmac_data['iso_a3'] == 'CHN']
-            if 'USD_raw' in cn_data.columns:
-                cn_data = cn_data[['date', 'name', 'local_price', 'dollar_ex', 'dollar_price', 'USD_raw']]
-            else:
-                cn_data = cn_data[['date', 'name', 'local_price', 'dollar_ex', 'dollar_price']]
+            # 筛选中国的数据（附上同期美国价格）
+            cn_data = _select_china(raw_data)
             
-            self.bigmac_data = cn_data
-            return cn_data
+            self.bigmac_data = compact_frame(cn_data)
+            self.store_sources['bigmac'] = BUILTIN_SOURCE
+            return self.bigmac_data
         except Exception as e:
             raise ValueError(f"内置巨无霸指数数据加载失败: {str(e)}")
     
-    def load_builtin_exchange_rate_data(self) -> pd.DataFrame:
-        """加载内置的汇率数据"""
+    @traced("data.load_builtin_fx_matrix")
+    def load_builtin_fx_matrix(self) -> pd.DataFrame:
+        """加载内置汇率文件中的全部货币对与报价类型（按日对齐的宽表，1单位外币兑人民币）"""
         try:
-            # 读取内置数据
-            data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'RESSET_FXBOCQUOT.xlsx')
-            self.exchange_rate_data = pd.read_excel(data_path)
+            with span("data.read_excel") as read_span:
+                raw_data = pd.read_excel(EXCHANGE_RATE_DATA_PATH)
+                read_span.rows = len(raw_data)
             
-            # 数据预处理
-            # 尝试找出日期列和汇率列
-            date_cols = [col for col in self.exchange_rate_data.columns if '日期' in col or 'date' in col.lower() or '截止日期' in col]
-            rate_cols = [col for col in self.exchange_rate_data.columns if '汇率' in col or 'rate' in col.lower() or '基准价' in col]
-            
-            if date_cols and rate_cols:
-                date_col = date_cols[0]
-                rate_col = rate_cols[0]
-                
-                # 创建新的DataFrame
-                actual_rates = pd.DataFrame()
-                actual_rates['date'] = pd.to_datetime(self.exchange_rate_data[date_col])
-                
-                # 处理汇率，如果是人民币/100美元格式，需要除以100
-                if '100' in rate_col or self.exchange_rate_data[rate_col].mean() > 500:  # 假设如果均值大于500，可能是100外币的格式
-                    actual_rates['actual_rate'] = self.exchange_rate_data[rate_col] / 100
-                else:
-                    actual_rates['actual_rate'] = self.exchange_rate_data[rate_col]
-                
-                # 处理日期缺失问题，使用最近的之前交易日报价填充
-                actual_rates = actual_rates.sort_values('date')
-                
-                # 填充缺失日期
-                date_range = pd.date_range(start=actual_rates['date'].min(), end=actual_rates['date'].max())
-                full_dates = pd.DataFrame({'date': date_range})
-                actual_rates = pd.merge(full_dates, actual_rates, on='date', how='left')
-                actual_rates['actual_rate'] = actual_rates['actual_rate'].fillna(method='ffill')
-                
-                self.exchange_rate_data = actual_rates
-                return actual_rates
-            else:
-                # 如果无法自动识别列名，尝试使用固定列名
-                if 'date' in self.exchange_rate_data.columns and 'actual_rate' in self.exchange_rate_data.columns:
-                    self.exchange_rate_data['date'] = pd.to_datetime(self.exchange_rate_data['date'])
-                    return self.exchange_rate_data
-                elif 'date' in self.exchange_rate_data.columns and 'actual_rates' in self.exchange_rate_data.columns:
-                    # 重命名列
-                    self.exchange_rate_data = self.exchange_rate_data.rename(columns={'actual_rates': 'actual_rate'})
-                    self.exchange_rate_data['date'] = pd.to_datetime(self.exchange_rate_data['date'])
-                    return self.exchange_rate_data
-                else:
-                    raise ValueError("无法识别日期列和汇率列，请确保文件包含'date'和'actual_rate'或'actual_rates'列")
+            # 以巨无霸面板中的汇率为参照，逐个货币对判断报价单位
+            fx_matrix = parse_fx_quotes(raw_data, reference_rates(load_bigmac_panel()))
+            self.fx_matrix = compact_frame(fx_matrix)
+            self.store_sources['fx'] = BUILTIN_SOURCE
+            return self.fx_matrix
         except Exception as e:
             raise ValueError(f"内置汇率数据加载失败: {str(e)}")
     
+    @traced("data.load_builtin_exchange_rate")
+    def load_builtin_exchange_rate_data(self) -> pd.DataFrame:
+        """加载内置的汇率数据（美元兑人民币）"""
+        fx_matrix = self.load_builtin_fx_matrix()
+        actual_rates = market_rate_frame(fx_matrix, 'CNY')
+        if actual_rates is None:
+            raise ValueError("内置汇率数据加载失败: 汇率文件中没有美元报价")
+        
+        self.exchange_rate_data = compact_frame(actual_rates)
+        return self.exchange_rate_data
+    
+    @traced("data.load_bigmac")
     def load_bigmac_data(self, uploaded_file) -> pd.DataFrame:
         """加载巨无霸指数数据"""
         if uploaded_file is None:
@@ -97,26 +218,27 @@ class DataProcessor:
             
         try:
             # 读取上传的数据
-            self.bigmac_data = pd.read_csv(uploaded_file)
+            with span("data.read_csv") as read_span:
+                raw_data = pd.read_csv(uploaded_file)
+                read_span.rows = len(raw_data)
             
             # 数据预处理
             # 转换日期格式
-            self.bigmac_data['date'] = pd.to_datetime(self.bigmac_data['date'])
+            raw_data['date'] = pd.to_datetime(raw_data['date'])
             
-            # 筛选中国的数据
-            cn_data = self.bigmac_data[self.bigmac_data['iso_a3'] == 'CHN']
-            if 'USD_raw' in cn_data.columns:
-                cn_data = cn_data[['date', 'name', 'local_price', 'dollar_ex', 'dollar_price', 'USD_raw']]
-            else:
-                cn_data = cn_data[['date', 'name', 'local_price', 'dollar_ex', 'dollar_price']]
+            # 筛选中国的数据（附上同期美国价格）
+            cn_data = _select_china(raw_data)
             
-            self.bigmac_data = cn_data
-            return cn_data
+            self.bigmac_data = compact_frame(cn_data)
+            # 完整的上传面板写入分析库，之后按需查询，不在会话中保存
+            self._store_upload('bigmac', raw_data)
+            return self.bigmac_data
         except Exception as e:
             raise ValueError(f"巨无霸指数数据处理失败: {str(e)}")
         
         return None
     
+    @traced("data.load_exchange_rate")
     def load_exchange_rate_data(self, uploaded_file) -> pd.DataFrame:
         """加载汇率数据"""
         if uploaded_file is None:
@@ -125,15 +247,19 @@ class DataProcessor:
         try:
             # 读取上传的数据
             if uploaded_file.name.endswith('.xlsx') or uploaded_file.name.endswith('.xls'):
-                self.exchange_rate_data = pd.read_excel(uploaded_file)
+                with span("data.read_excel") as read_span:
+                    raw_data = pd.read_excel(uploaded_file)
+                    read_span.rows = len(raw_data)
             else:
-                self.exchange_rate_data = pd.read_csv(uploaded_file)
+                with span("data.read_csv") as read_span:
+                    raw_data = pd.read_csv(uploaded_file)
+                    read_span.rows = len(raw_data)
             
             # 数据预处理
             try:
                 # 尝试找出日期列和汇率列
-                date_cols = [col for col in self.exchange_rate_data.columns if '日期' in col or 'date' in col.lower() or '截止日期' in col]
-                rate_cols = [col for col in self.exchange_rate_data.columns if '汇率' in col or 'rate' in col.lower() or '基准价' in col]
+                date_cols = [col for col in raw_data.columns if '日期' in col or 'date' in col.lower() or '截止日期' in col]
+                rate_cols = [col for col in raw_data.columns if '汇率' in col or 'rate' in col.lower() or '基准价' in col]
                 
                 if date_cols and rate_cols:
                     date_col = date_cols[0]
@@ -141,13 +267,13 @@ class DataProcessor:
                     
                     # 创建新的DataFrame
                     actual_rates = pd.DataFrame()
-                    actual_rates['date'] = pd.to_datetime(self.exchange_rate_data[date_col])
+                    actual_rates['date'] = pd.to_datetime(raw_data[date_col])
                     
                     # 处理汇率，如果是人民币/100美元格式，需要除以100
-                    if '100' in rate_col or self.exchange_rate_data[rate_col].mean() > 500:  # 假设如果均值大于500，可能是100外币的格式
-                        actual_rates['actual_rate'] = self.exchange_rate_data[rate_col] / 100
+                    if '100' in rate_col or raw_data[rate_col].mean() > 500:  # 假设如果均值大于500，可能是100外币的格式
+                        actual_rates['actual_rate'] = raw_data[rate_col] / 100
                     else:
-                        actual_rates['actual_rate'] = self.exchange_rate_data[rate_col]
+                        actual_rates['actual_rate'] = raw_data[rate_col]
                     
                     # 处理日期缺失问题，使用最近的之前交易日报价填充
                     actual_rates = actual_rates.sort_values('date')
@@ -158,17 +284,22 @@ class DataProcessor:
                     actual_rates = pd.merge(full_dates, actual_rates, on='date', how='left')
                     actual_rates['actual_rate'] = actual_rates['actual_rate'].fillna(method='ffill')
                     
-                    self.exchange_rate_data = actual_rates
-                    return actual_rates
+                    self.exchange_rate_data = compact_frame(actual_rates)
+                    self._store_uploaded_rates()
+                    return self.exchange_rate_data
                 else:
                     # 如果无法自动识别列名，尝试使用固定列名
-                    if 'date' in self.exchange_rate_data.columns and 'actual_rate' in self.exchange_rate_data.columns:
-                        self.exchange_rate_data['date'] = pd.to_datetime(self.exchange_rate_data['date'])
+                    if 'date' in raw_data.columns and 'actual_rate' in raw_data.columns:
+                        raw_data['date'] = pd.to_datetime(raw_data['date'])
+                        self.exchange_rate_data = compact_frame(raw_data)
+                        self._store_uploaded_rates()
                         return self.exchange_rate_data
-                    elif 'date' in self.exchange_rate_data.columns and 'actual_rates' in self.exchange_rate_data.columns:
+                    elif 'date' in raw_data.columns and 'actual_rates' in raw_data.columns:
                         # 重命名列
-                        self.exchange_rate_data = self.exchange_rate_data.rename(columns={'actual_rates': 'actual_rate'})
-                        self.exchange_rate_data['date'] = pd.to_datetime(self.exchange_rate_data['date'])
+                        raw_data = raw_data.rename(columns={'actual_rates': 'actual_rate'})
+                        raw_data['date'] = pd.to_datetime(raw_data['date'])
+                        self.exchange_rate_data = compact_frame(raw_data)
+                        self._store_uploaded_rates()
                         return self.exchange_rate_data
                     else:
                         raise ValueError("无法识别日期列和汇率列，请确保文件包含'date'和'actual_rate'或'actual_rates'列")
@@ -179,6 +310,31 @@ class DataProcessor:
         
         return None
     
+    def _store_uploaded_rates(self):
+        """把上传的美元兑人民币汇率写入分析库"""
+        rates = self.exchange_rate_data[['date', 'actual_rate']].rename(columns={'actual_rate': 'USD_mid'})
+        self._store_upload('fx', rates)
+
+    def _store_upload(self, kind: str, data: pd.DataFrame):
+        """把上传的数据按内容指纹写入分析库；分析库不可用时只是无法查询该数据，不影响上传"""
+        source = f"upload-{analysis_fingerprint(data)[:16]}"
+        try:
+            store = get_store()
+            if kind == 'bigmac':
+                store.load_bigmac(data, source)
+            else:
+                store.load_fx(data, source)
+        except Exception:
+            source = None
+        self.store_sources[kind] = source
+
+    def _store_source(self, kind: str) -> str:
+        source = self.store_sources[kind]
+        if source is None:
+            raise ValueError("上传的数据未能写入分析库，无法查询")
+        return source
+    
+    @traced("data.analyze")
     def analyze_data(self) -> pd.DataFrame:
         """分析巨无霸指数和汇率数据"""
         if self.bigmac_data is None or self.exchange_rate_data is None:
@@ -195,108 +351,85 @@ class DataProcessor:
             else:
                 raise ValueError("汇率数据缺少actual_rate列")
         
-        # 合并数据集
-        comparison_data = pd.merge_asof(
-            self.bigmac_data.sort_values('date'), 
-            self.exchange_rate_data.sort_values('date'), 
-            on='date', 
-            direction='nearest'
-        )
-        
-        # 计算巨无霸汇率和偏差
-        comparison_data['big_mac_rate'] = comparison_data['local_price'] / comparison_data['dollar_price']
-        comparison_data['deviation_pct'] = ((comparison_data['actual_rate'] - comparison_data['big_mac_rate']) 
-                                          / comparison_data['big_mac_rate'] * 100)
+        # 合并数据集并计算巨无霸汇率和偏差
+        comparison_data = build_comparison(self.bigmac_data, self.exchange_rate_data)
         
         self.comparison_data = comparison_data
         return comparison_data
     
-    def generate_comparison_chart(self) -> plt.Figure:
+    def generate_comparison_chart(self) -> "Figure":
         """生成汇率对比图表"""
         if self.comparison_data is None:
             raise ValueError("请先分析数据")
-            
-        fig, ax = plt.subplots(figsize=(12, 6))
-        
-        # 设置风格
-        sns.set_style("whitegrid")
-        
-        # 绘制汇率比较
-        ax.plot(self.comparison_data['date'], self.comparison_data['big_mac_rate'], 
-                'b-', label='Big Mac Index Rate')
-        ax.plot(self.comparison_data['date'], self.comparison_data['actual_rate'], 
-                'r-', label='Actual Market Rate')
         
-        # 设置标签
-        ax.set_xlabel('Date')
-        ax.set_ylabel('CNY/USD Exchange Rate')
-        ax.set_title('Big Mac Index Predicted Rate vs Actual Market Rate')
-        ax.legend(loc='best')
-        
-        # 优化布局
-        plt.tight_layout()
-        
-        return fig
+        # 图形不经过 pyplot，不需要手动关闭
+        return build_figure(self.comparison_data, 'comparison')
     
-    def generate_deviation_chart(self) -> plt.Figure:
+    def generate_deviation_chart(self) -> "Figure":
         """生成偏差分析图表"""
         if self.comparison_data is None:
             raise ValueError("请先分析数据")
-            
-        fig, ax = plt.subplots(figsize=(12, 6))
         
-        # 设置风格
-        sns.set_style("whitegrid")
-        
-        # 绘制偏差趋势
-        ax.bar(self.comparison_data['date'], self.comparison_data['deviation_pct'], 
-               color='green', alpha=0.7)
-        ax.axhline(y=0, color='black', linestyle='-', alpha=0.3)
-        
-        # 设置标签
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Deviation Percentage (%)')
-        ax.set_title('CNY/USD Exchange Rate: Market Rate vs Big Mac Index Prediction Deviation')
-        
-        # 优化布局
-        plt.tight_layout()
+        return build_figure(self.comparison_data, 'deviation')
+    
+    def render_chart(self, chart_type: str, fmt: str = 'png', size: Tuple[float, float] = DEFAULT_SIZE) -> bytes:
+        """把 comparison / deviation 图表渲染为PNG或SVG字节串，相同数据与参数只渲染一次"""
+        handle = self.handle('comparison_data')
+        if handle is None:
+            raise ValueError("请先分析数据")
         
-        return fig
+        return render_chart(handle.df, chart_type, fmt, size, fingerprint=handle.fingerprint)
     
     def get_key_metrics(self) -> dict:
         """获取关键指标数据"""
         if self.comparison_data is None:
             raise ValueError("请先分析数据")
             
-        metrics = {
-            'avg_deviation': self.comparison_data['deviation_pct'].mean(),
-            'max_deviation': self.comparison_data['deviation_pct'].max(),
-            'min_deviation': self.comparison_data['deviation_pct'].min(),
-            'latest_deviation': self.comparison_data.iloc[-1]['deviation_pct'],
-            'avg_bigmac_rate': self.comparison_data['big_mac_rate'].mean(),
-            'latest_bigmac_rate': self.comparison_data.iloc[-1]['big_mac_rate'],
-            'latest_actual_rate': self.comparison_data.iloc[-1]['actual_rate'],
-            'data_period': f"{self.comparison_data['date'].min().strftime('%Y-%m-%d')} 至 {self.comparison_data['date'].max().strftime('%Y-%m-%d')}",
-            'over_under': "低估" if self.comparison_data.iloc[-1]['deviation_pct'] < 0 else "高估"
-        }
+        metrics = compute_key_metrics(self.comparison_data)
         
         return metrics
     
-    def export_analysis_data(self, data=None) -> io.BytesIO:
-        """导出分析数据"""
+    def query_bigmac_range(self, iso_a3: Optional[Sequence[str]] = None, start=None, end=None,
+                           columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """从分析库查询指定国家和日期区间的巨无霸数据（默认全部国家、全部日期）"""
+        return get_store().bigmac_range(iso_a3, start, end, columns, source=self._store_source('bigmac'))
+    
+    @traced("data.query_comparison")
+    def query_comparison(self, iso_a3: str = 'CHN', start=None, end=None) -> pd.DataFrame:
+        """在分析库中完成区间筛选和 as-of 汇率匹配，返回与 build_country_comparison 相同口径的对比数据
+        
+        人民币使用每个发布日期当天或之前最近一个交易日的美元牌价，其他货币使用面板中的 dollar_ex。
+        """
+        comparison_data = get_store().asof_join(iso_a3, 'USD', 'mid', start, end,
+                                                source=self._store_source('bigmac'), fx_source=self._store_source('fx'))
+        if comparison_data.empty:
+            raise ValueError(f"分析库中没有 {iso_a3} 在所选时间范围内的数据")
+        if (comparison_data['currency_code'] != 'CNY').any() or comparison_data['actual_rate'].isna().all():
+            comparison_data['actual_rate'] = comparison_data['dollar_ex']
+        return compact_frame(_add_bigmac_rate(comparison_data))
+    
+    def query_aggregate(self, metric: str, by: str = 'iso_a3', how: str = 'avg',
+                        iso_a3: Optional[Sequence[str]] = None, start=None, end=None) -> pd.DataFrame:
+        """在分析库中按国家、发布日期或年份分组统计面板指标"""
+        return get_store().aggregate(metric, by, how, iso_a3, start, end, source=self._store_source('bigmac'))
+    
+    @traced("data.export")
+    def export_analysis_data(self, data=None, fmt: str = 'xlsx') -> io.BytesIO:
+        """导出分析数据，支持 xlsx / csv / parquet 格式，相同数据只生成一次
+        
+        data 可以是数据框或会话中保存的句柄，传入句柄时直接复用其内容指纹。
+        """
         if data is None:
-            if self.comparison_data is None:
+            data = self.handle('comparison_data')
+            if data is None:
                 raise ValueError("请先分析数据")
-            data = self.comparison_data
-            
-        # 创建Excel文件
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            data.to_excel(writer, sheet_name='分析数据', index=False)
-            
-            # 创建关键指标表
-            metrics = pd.DataFrame([self.get_key_metrics()])
-            metrics.to_excel(writer, sheet_name='关键指标', index=False)
-            
+        
+        fingerprint = None
+        if isinstance(data, FrameHandle):
+            fingerprint = data.fingerprint
+            data = data.df
+        
+        # 关键指标直接基于待导出的数据计算，且仅在缓存未命中时计算
+        output = io.BytesIO(export_bytes(data, fmt, lambda: compute_key_metrics(data), fingerprint=fingerprint))
         output.seek(0)
-        return output 
\ No newline at end of file
+        return output
@@ -0,0 +1,186 @@
+"""内置数据热更新
+
+后台线程定期检查 data/ 目录中数据文件的大小和修改时间。文件变化（例如《经济学人》发布了新一期
+巨无霸指数）后，在后台重新读取和预处理内置数据，并重建横截面快照索引、GDP调整重算引擎和分析库，
+全部完成后一次性替换为新版本；构建失败时保留旧版本继续服务。
+
+已打开的会话记录自己使用的数据版本号，发现有更新版本时提示"有新数据可用"，一键切换到后台
+已处理好的数据，不需要重新计算。
+
+检查间隔由环境变量 BIGMAC_DATA_POLL_SEC 指定（默认5秒，设为0时不启动后台检查）。
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from utils.data_processor import DATA_DIR, DataProcessor, load_bigmac_panel
+from utils.frame_registry import FrameHandle
+from utils.gdp_adjustment import GdpAdjustmentEngine
+from utils.snapshot import ValuationSnapshotIndex
+from utils.store import get_store
+from utils.tracing import span
+
+# 参与检查的数据文件类型
+DATA_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+# 会话中保存所用数据版本号的键
+SESSION_VERSION_KEY = 'data_version'
+
+# 每个版本包含的预处理数据（DataProcessor 中的同名数据）
+VERSION_FRAMES = ('bigmac_data', 'exchange_rate_data', 'fx_matrix', 'comparison_data')
+
+
+class DataVersion:
+    """某一时刻 data/ 目录内容对应的全部预处理数据和派生结果（构建完成后只读）"""
+
+    def __init__(self, number: int, files: Dict[str, Tuple[int, int]], handles: Dict[str, Optional[FrameHandle]],
+                 snapshot_index: ValuationSnapshotIndex, adjustment_engine: GdpAdjustmentEngine, build_sec: float):
+        self.number = number
+        self.files = files
+        self.handles = handles
+        self.snapshot_index = snapshot_index
+        self.adjustment_engine = adjustment_engine
+        self.build_sec = build_sec
+        self.built_at = time.time()
+
+
+def scan_data_files(data_dir: str = DATA_DIR) -> Dict[str, Tuple[int, int]]:
+    """数据目录中各数据文件的 (大小, 修改时间ns)"""
+    files = {}
+    try:
+        names = os.listdir(data_dir)
+    except OSError:
+        return files
+    for name in sorted(names):
+        if not name.lower().endswith(DATA_EXTENSIONS) or name.startswith(('.', '~$')):
+            continue
+        try:
+            stat = os.stat(os.path.join(data_dir, name))
+        except OSError:
+            continue
+        files[name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class DataRegistry:
+    """内置数据的版本登记表：后台检查文件变化、重建并原子替换当前版本"""
+
+    def __init__(self, data_dir: str = DATA_DIR, poll_interval: float = 5.0):
+        self.data_dir = data_dir
+        self.poll_interval = poll_interval
+        self.last_error: Optional[str] = None
+        self._current: Optional[DataVersion] = None
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def current(self) -> DataVersion:
+        """当前版本（首次访问时同步构建）"""
+        if self._current is None:
+            self.refresh()
+            if self._current is None:
+                raise ValueError(f"内置数据加载失败: {self.last_error}")
+        return self._current
+
+    @property
+    def version(self) -> int:
+        return self._current.number if self._current is not None else 0
+
+    def _build(self, number: int, files: Dict[str, Tuple[int, int]]) -> DataVersion:
+        started = time.perf_counter()
+        with span("data_registry.build"):
+            processor = DataProcessor()
+            processor.load_builtin_bigmac_data()
+            processor.load_builtin_exchange_rate_data()
+            processor.analyze_data()
+            panel = load_bigmac_panel()
+            snapshot_index = ValuationSnapshotIndex(panel)
+            adjustment_engine = GdpAdjustmentEngine.from_frame(panel)
+            # 分析库按文件指纹判断是否需要重新导入；分析库不可用时不影响新版本
+            try:
+                get_store().ensure_builtin()
+            except Exception:
+                pass
+        handles = {name: processor.handle(name) for name in VERSION_FRAMES}
+        return DataVersion(number, files, handles, snapshot_index, adjustment_engine,
+                           time.perf_counter() - started)
+
+    def refresh(self) -> bool:
+        """数据文件有变化时重建并替换当前版本，返回是否产生了新版本"""
+        with self._build_lock:
+            files = scan_data_files(self.data_dir)
+            if self._current is not None and files == self._current.files:
+                return False
+            try:
+                version = self._build(self.version + 1, files)
+            except Exception as e:
+                # 文件可能正在写入，保留旧版本，下次检查时重试
+                self.last_error = str(e)
+                return False
+            # 新版本完整构建后才替换，读取方总是看到一个完整的版本
+            self._current = version
+            self.last_error = None
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.refresh()
+
+    def start(self):
+        """启动后台检查线程（重复调用无效）"""
+        if self._thread is None and self.poll_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="data-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        version = self._current
+        return {
+            'version': self.version,
+            'files': dict(version.files) if version else {},
+            'built_at': version.built_at if version else None,
+            'build_sec': version.build_sec if version else None,
+            'last_error': self.last_error,
+        }
+
+
+_data_registry = None
+_data_registry_lock = threading.Lock()
+
+
+def get_data_registry() -> DataRegistry:
+    """获取进程共享的内置数据登记表（首次调用时构建当前版本并启动后台检查）"""
+    global _data_registry
+    if _data_registry is None:
+        with _data_registry_lock:
+            if _data_registry is None:
+                registry = DataRegistry(poll_interval=float(os.environ.get("BIGMAC_DATA_POLL_SEC", 5)))
+                registry.start()
+                _data_registry = registry
+    return _data_registry
+
+
+def load_latest_builtin(processor: DataProcessor, state) -> DataVersion:
+    """把最新版本的内置数据装入数据处理器和会话状态，并记录版本号
+
+    会话中已有预处理结果时一并换成新版本中预先计算好的对比数据。
+    """
+    version = get_data_registry().current
+    processor.adopt(version.handles)
+    state['bigmac_data'] = processor.handle('bigmac_data')
+    state['exchange_rate_data'] = processor.handle('exchange_rate_data')
+    if state.get('analysis_data') is not None:
+        state['analysis_data'] = processor.handle('comparison_data')
+        state['export_file'] = None
+    state[SESSION_VERSION_KEY] = version.number
+    return version
+
+
+def data_update_available(state) -> bool:
+    """会话使用的是内置数据且后台已有更新的版本"""
+    session_version = state.get(SESSION_VERSION_KEY)
+    return session_version is not None and session_version < get_data_registry().version
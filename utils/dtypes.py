@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, Optional
+
+# 取值重复度高的文本列使用分类类型
+CATEGORY_COLUMNS = ('name', 'iso_a3', 'currency_code')
+
+# 价格、汇率类列只要在float32表示范围内即降为float32：float32的相对舍入误差不超过 2**-24（约6e-8），
+# 远小于原始数据记录的精度，因此不再逐值检查相对误差
+FLOAT32_COLUMNS = (
+    'local_price', 'dollar_ex', 'dollar_price', 'us_price', 'actual_rate', 'big_mac_rate',
+    'USD_raw', 'EUR_raw', 'GBP_raw', 'JPY_raw', 'CNY_raw', 'GDP_bigmac', 'adj_price',
+    'USD_adjusted', 'EUR_adjusted', 'GBP_adjusted', 'JPY_adjusted', 'CNY_adjusted',
+)
+
+# deviation_pct 降精度后允许的最大绝对误差（百分点），即保证展示到小数点后2位时结果不变
+DEVIATION_PCT_TOLERANCE = 1e-4
+
+
+def _fits_float32(values: pd.Series, atol: Optional[float] = None) -> bool:
+    """判断一列数值能否转为float32：不超出表示范围，且给定 atol 时绝对误差不超过 atol"""
+    original = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    narrowed = original.astype(np.float32).astype(np.float64)
+    finite = np.isfinite(original)
+    if not np.array_equal(finite, np.isfinite(narrowed)):
+        # 超出float32表示范围
+        return False
+    if atol is None:
+        return True
+    return bool(np.all(np.abs(narrowed[finite] - original[finite]) <= atol))
+
+
+def compact_frame(data: pd.DataFrame, category_columns: Iterable[str] = CATEGORY_COLUMNS,
+                  float32_columns: Iterable[str] = FLOAT32_COLUMNS) -> pd.DataFrame:
+    """返回使用紧凑类型的数据副本
+
+    - name / iso_a3 / currency_code 转为分类类型
+    - 价格与汇率列在不超出float32表示范围时转为float32
+    - deviation_pct 仅在绝对误差不超过 DEVIATION_PCT_TOLERANCE 个百分点时转为float32
+    """
+    converted: Dict[str, pd.Series] = {}
+    for col in category_columns:
+        if col in data.columns and not isinstance(data[col].dtype, pd.CategoricalDtype):
+            converted[col] = data[col].astype('category')
+    for col in float32_columns:
+        if col in data.columns and data[col].dtype == np.float64 and _fits_float32(data[col]):
+            converted[col] = data[col].astype(np.float32)
+    if 'deviation_pct' in data.columns and data['deviation_pct'].dtype == np.float64:
+        if _fits_float32(data['deviation_pct'], atol=DEVIATION_PCT_TOLERANCE):
+            converted['deviation_pct'] = data['deviation_pct'].astype(np.float32)
+
+    if not converted:
+        return data
+    return data.assign(**converted)
+
+
+def frame_memory_bytes(data: Optional[pd.DataFrame]) -> int:
+    """数据框的深度内存占用（字节）"""
+    if data is None:
+        return 0
+    return int(data.memory_usage(deep=True, index=True).sum())
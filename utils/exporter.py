@@ -0,0 +1,168 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterable, BinaryIO, Callable, Union
+
+import pandas as pd
+
+# 支持的导出格式：扩展名 -> (MIME类型, 显示名称)
+EXPORT_FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'Excel (.xlsx)'),
+    'csv': ('text/csv', 'CSV (.csv)'),
+    'parquet': ('application/vnd.apache.parquet', 'Parquet (.parquet)'),
+}
+
+
+def analysis_fingerprint(data: pd.DataFrame) -> str:
+    """根据列名、类型和内容计算数据指纹"""
+    digest = hashlib.sha1()
+    digest.update(repr(list(zip(data.columns, data.dtypes.astype(str)))).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def _metrics_frame(metrics: Optional[Dict[str, Any]]) -> Optional[pd.DataFrame]:
+    return pd.DataFrame([metrics]) if metrics else None
+
+
+def write_csv(data: pd.DataFrame, metrics: Optional[Dict[str, Any]] = None) -> bytes:
+    """导出为CSV（带BOM，便于Excel直接打开中文内容）"""
+    return data.to_csv(index=False).encode("utf-8-sig")
+
+
+def write_parquet(data: pd.DataFrame, metrics: Optional[Dict[str, Any]] = None) -> bytes:
+    """导出为Parquet，关键指标写入文件元数据"""
+    import json
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    if metrics:
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'key_metrics'] = json.dumps(metrics, ensure_ascii=False, default=str).encode("utf-8")
+        table = table.replace_schema_metadata(metadata)
+    output = io.BytesIO()
+    pq.write_table(table, output)
+    return output.getvalue()
+
+
+def write_xlsx(data: pd.DataFrame, metrics: Optional[Dict[str, Any]] = None) -> bytes:
+    """导出为Excel，包含分析数据和关键指标两个工作表"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        data.to_excel(writer, sheet_name='分析数据', index=False)
+        metrics_frame = _metrics_frame(metrics)
+        if metrics_frame is not None:
+            metrics_frame.to_excel(writer, sheet_name='关键指标', index=False)
+    return output.getvalue()
+
+
+WRITERS: Dict[str, Callable[[pd.DataFrame, Optional[Dict[str, Any]]], bytes]] = {
+    'xlsx': write_xlsx,
+    'csv': write_csv,
+    'parquet': write_parquet,
+}
+
+
+class ExportCache:
+    """按 (数据指纹, 格式) 等键缓存生成结果的LRU缓存，以总字节数为上限"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key: tuple, payload: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = payload
+            self._size += len(payload)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+_export_cache = ExportCache()
+
+
+def export_bytes(data: pd.DataFrame, fmt: str = 'xlsx',
+                 metrics: Union[Dict[str, Any], Callable[[], Dict[str, Any]], None] = None,
+                 fingerprint: Optional[str] = None, cache: Optional[ExportCache] = None) -> bytes:
+    """导出数据为指定格式的字节串，相同数据和格式只生成一次
+
+    metrics 可以是函数，仅在缓存未命中、确实需要生成文件时才调用。
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    cache = cache or _export_cache
+    key = (fingerprint or analysis_fingerprint(data), fmt)
+    payload = cache.get(key)
+    if payload is None:
+        if callable(metrics):
+            metrics = metrics()
+        payload = WRITERS[fmt](data, metrics)
+        cache.put(key, payload)
+    return payload
+
+
+def stream_export(chunks: Iterable[pd.DataFrame], fmt: str, output: BinaryIO,
+                  sheet_name: str = '分析数据') -> int:
+    """逐块写出大型数据（如多国面板），不在内存中构建完整文件，返回写出的行数
+
+    chunks 中各块的列需保持一致；output 为以二进制方式打开的文件对象。
+    """
+    rows = 0
+    if fmt == 'csv':
+        text = io.TextIOWrapper(output, encoding="utf-8-sig", newline="", write_through=True)
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(text, index=False, header=(i == 0))
+            rows += len(chunk)
+        text.detach()
+    elif fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output, table.schema)
+                writer.write_table(table.cast(writer.schema))
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    elif fmt == 'xlsx':
+        import xlsxwriter
+
+        # constant_memory 模式下每写完一行即刷新到磁盘临时文件，内存占用与行数无关
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'in_memory': False})
+        worksheet = workbook.add_worksheet(sheet_name)
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        for i, chunk in enumerate(chunks):
+            if i == 0:
+                worksheet.write_row(0, 0, [str(c) for c in chunk.columns])
+            for values in chunk.itertuples(index=False, name=None):
+                rows += 1
+                for col, value in enumerate(values):
+                    if isinstance(value, pd.Timestamp):
+                        worksheet.write_datetime(rows, col, value.to_pydatetime(), date_format)
+                    elif pd.isna(value):
+                        worksheet.write_blank(rows, col, None)
+                    else:
+                        worksheet.write(rows, col, value)
+        workbook.close()
+    else:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    return rows
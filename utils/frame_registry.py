@@ -0,0 +1,209 @@
+import os
+import threading
+import weakref
+from typing import Dict, Optional, Any
+
+import pandas as pd
+
+from utils.dtypes import frame_memory_bytes
+from utils.exporter import analysis_fingerprint
+
+
+def _copy_on_write_enabled() -> bool:
+    """写时复制是否生效：pandas 3.0 起为默认且唯一的行为，更早的版本由 app.py 在启动时开启"""
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    return pd.get_option("mode.copy_on_write") is True
+
+
+class _FrameEntry:
+    """登记表中的一份只读数据原件"""
+
+    __slots__ = ("fingerprint", "frame", "nbytes", "__weakref__")
+
+    def __init__(self, fingerprint: str, frame: pd.DataFrame):
+        self.fingerprint = fingerprint
+        self.frame = frame
+        self.nbytes = frame_memory_bytes(frame)
+
+
+class FrameHandle:
+    """指向登记表中只读数据的句柄
+
+    会话状态中保存句柄而不是数据副本；通过 df 取得的数据框可以随意修改，
+    修改只影响取得的这一份，不会影响原件和其他会话。
+    空闲会话的句柄可以溢出到磁盘（spill），释放对原件的引用，下次读取 df 时自动重新加载。
+    """
+
+    __slots__ = ("_entry", "_fingerprint", "_nbytes", "_spill_path", "_registry", "__weakref__")
+
+    def __init__(self, entry: _FrameEntry, registry: "FrameRegistry"):
+        self._entry: Optional[_FrameEntry] = entry
+        self._fingerprint = entry.fingerprint
+        self._nbytes = entry.nbytes
+        self._spill_path: Optional[str] = None
+        self._registry = registry
+
+    @property
+    def fingerprint(self) -> str:
+        return self._fingerprint
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    @property
+    def spill_path(self) -> Optional[str]:
+        """最近一次溢出写出的缓存文件路径，从未溢出时为None"""
+        return self._spill_path
+
+    @property
+    def spilled(self) -> bool:
+        """原件是否已溢出到磁盘（当前句柄不占用内存）"""
+        return self._entry is None
+
+    def _resident_entry(self) -> _FrameEntry:
+        entry = self._entry
+        if entry is None:
+            entry = self._registry._reload(self._fingerprint, self._spill_path)
+            self._entry = entry
+        return entry
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """返回与原件共享内存的数据框（写时复制），已溢出时先从磁盘重新加载
+
+        写时复制未开启时（未经 app.py 启动）返回深拷贝，页面修改不会影响原件。
+        """
+        return self._resident_entry().frame.copy(deep=not _copy_on_write_enabled())
+
+    def spill(self, directory: str) -> bool:
+        """把原件写入磁盘列式缓存并释放引用，返回是否发生了溢出"""
+        entry = self._entry
+        if entry is None:
+            return False
+        self._spill_path = self._registry._spill(entry, directory)
+        self._entry = None
+        return True
+
+    def __len__(self) -> int:
+        return len(self._resident_entry().frame)
+
+    def __repr__(self) -> str:
+        state = "spilled" if self.spilled else "resident"
+        return f"FrameHandle({self._fingerprint[:12]}, {state})"
+
+
+class FrameRegistry:
+    """按内容指纹驻留的只读数据框登记表
+
+    内容相同的数据在进程内只保存一份，由各会话的句柄共同引用；
+    最后一个句柄释放（或溢出到磁盘）后，原件随之回收。
+    """
+
+    def __init__(self):
+        self._entries: "weakref.WeakValueDictionary[str, _FrameEntry]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.reloads = 0
+
+    def intern(self, frame: pd.DataFrame, fingerprint: Optional[str] = None) -> FrameHandle:
+        """登记数据框并返回句柄，已有相同内容时复用已有原件"""
+        fingerprint = fingerprint or analysis_fingerprint(frame)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+                # 保存独立的副本，之后外部对传入数据的修改不会影响原件
+                entry = _FrameEntry(fingerprint, frame.copy(deep=True))
+                self._entries[fingerprint] = entry
+            else:
+                self.hits += 1
+        return FrameHandle(entry, self)
+
+    def _spill(self, entry: _FrameEntry, directory: str) -> str:
+        """把原件写为Parquet文件（同一内容只写一次），返回文件路径"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{entry.fingerprint}.parquet")
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            pq.write_table(pa.Table.from_pandas(entry.frame, preserve_index=True), tmp_path)
+            os.replace(tmp_path, path)
+        self.spills += 1
+        return path
+
+    def _reload(self, fingerprint: str, path: Optional[str]) -> _FrameEntry:
+        """重新取得已溢出的原件：其他会话仍持有时直接复用，否则从磁盘读取"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+        if entry is not None:
+            return entry
+        if path is None or not os.path.exists(path):
+            raise ValueError(f"数据缓存文件不存在，无法重新加载: {path}")
+        frame = pd.read_parquet(path)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                entry = _FrameEntry(fingerprint, frame)
+                self._entries[fingerprint] = entry
+            self.reloads += 1
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        """登记表当前状态：驻留的数据份数、总字节数与命中次数"""
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            'frames': len(entries),
+            'bytes': sum(entry.nbytes for entry in entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'spills': self.spills,
+            'reloads': self.reloads,
+        }
+
+
+_registry = FrameRegistry()
+
+
+def get_frame_registry() -> FrameRegistry:
+    """获取进程内共享的数据框登记表"""
+    return _registry
+
+
+def intern_frame(frame: Optional[pd.DataFrame]) -> Optional[FrameHandle]:
+    """把数据框登记到共享登记表，None 原样返回"""
+    if frame is None:
+        return None
+    return _registry.intern(frame)
+
+
+def unwrap_frame(value: Any) -> Optional[pd.DataFrame]:
+    """从句柄取出数据框；传入的已是数据框或None时原样返回"""
+    if isinstance(value, FrameHandle):
+        return value.df
+    return value
+
+
+class InternedFrame:
+    """类属性描述符：赋值时登记数据框，实例只保存句柄，读取时返回写时复制的数据框"""
+
+    def __set_name__(self, owner, name):
+        self.attr = f"_{name}_handle"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        handle = instance.__dict__.get(self.attr)
+        return handle.df if handle is not None else None
+
+    def __set__(self, instance, value):
+        if isinstance(value, FrameHandle) or value is None:
+            instance.__dict__[self.attr] = value
+        else:
+            instance.__dict__[self.attr] = intern_frame(value)
@@ -0,0 +1,214 @@
+"""多币种汇率读取
+
+把中行外汇牌价（RESSET FXBOCQUOT）等汇率文件中的全部货币对和报价类型（现汇/现钞买入卖出价、
+中间价）解析为按日期对齐的宽表：每个 (货币, 报价类型) 一列，统一为"1单位外币兑人民币"。
+每个货币对单独判断报价单位（每100外币或每1外币），有巨无霸面板作参照时按与面板汇率的比值判断。
+
+支持两种文件布局：
+- 长表：一列为币种（代码或中文名称），其余数值列为各类报价；
+- 宽表：日期列加若干汇率列，列名中包含币种（只有一列且无法识别币种时视为美元，兼容内置数据）。
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 中文币种名称与ISO代码（按名称长度从长到短匹配）
+CURRENCY_NAMES = {
+    '美元': 'USD', '欧元': 'EUR', '日元': 'JPY', '英镑': 'GBP', '港币': 'HKD', '港元': 'HKD',
+    '澳大利亚元': 'AUD', '澳元': 'AUD', '加拿大元': 'CAD', '加元': 'CAD', '瑞士法郎': 'CHF',
+    '新加坡元': 'SGD', '瑞典克朗': 'SEK', '丹麦克朗': 'DKK', '挪威克朗': 'NOK', '新西兰元': 'NZD',
+    '韩国元': 'KRW', '韩元': 'KRW', '俄罗斯卢布': 'RUB', '卢布': 'RUB', '泰国铢': 'THB', '泰铢': 'THB',
+    '林吉特': 'MYR', '菲律宾比索': 'PHP', '新台币': 'TWD', '澳门元': 'MOP', '南非兰特': 'ZAR',
+    '巴西里亚尔': 'BRL', '印度卢比': 'INR', '印尼卢比': 'IDR', '阿联酋迪拉姆': 'AED',
+    '沙特里亚尔': 'SAR', '土耳其里拉': 'TRY', '墨西哥比索': 'MXN',
+}
+
+# 可识别的ISO货币代码：上表中的币种加上巨无霸面板数据中出现的币种
+ISO_CURRENCY_CODES = frozenset(CURRENCY_NAMES.values()) | frozenset((
+    'CNY', 'ARS', 'AZN', 'BHD', 'CLP', 'COP', 'CRC', 'CZK', 'EGP', 'GTQ', 'HNL', 'HUF', 'ILS',
+    'JOD', 'KWD', 'LBP', 'LKR', 'MDL', 'NIO', 'OMR', 'PEN', 'PKR', 'PLN', 'QAR', 'RON', 'UAH',
+    'UYU', 'VEF', 'VES', 'VND',
+))
+
+# 报价类型关键字（先匹配更具体的写法）
+QUOTE_KEYWORDS = (
+    ('现钞买入', 'cash_buy'), ('现钞卖出', 'cash_sell'),
+    ('现汇买入', 'buy'), ('现汇卖出', 'sell'),
+    ('买入', 'buy'), ('卖出', 'sell'),
+    ('中间价', 'mid'), ('折算价', 'mid'), ('基准价', 'mid'),
+    ('cash_buy', 'cash_buy'), ('cash_sell', 'cash_sell'),
+    ('buy', 'buy'), ('bid', 'buy'), ('sell', 'sell'), ('ask', 'sell'),
+    ('mid', 'mid'), ('middle', 'mid'),
+)
+
+# 取某一货币汇率时报价类型的优先顺序
+QUOTE_PREFERENCE = ('mid', 'sell', 'buy', 'cash_sell', 'cash_buy')
+
+_DATE_KEYWORDS = ('日期', 'date')
+_PAIR_KEYWORDS = ('币种', '货币', 'currency', 'curr', 'pair')
+
+# 与参照汇率之比落在此区间时判定为每100外币报价
+_PER_100_RATIO = (30.0, 300.0)
+
+
+def _find_column(columns, keywords) -> Optional[str]:
+    for col in columns:
+        name = str(col).lower()
+        if any(keyword in name for keyword in keywords):
+            return col
+    return None
+
+
+def currency_code(label) -> Optional[str]:
+    """从币种名称或列名中识别ISO货币代码，无法识别时返回None"""
+    text = str(label).strip()
+    upper = text.upper()
+    # 只接受已知代码，避免把 bid/ask/mid 之类的三字母列名当成货币
+    if upper in ISO_CURRENCY_CODES:
+        return upper
+    for name in sorted(CURRENCY_NAMES, key=len, reverse=True):
+        if name in text:
+            return CURRENCY_NAMES[name]
+    # 列名中以分隔符隔开的货币代码，如 "USD_mid"、"EUR/CNY"
+    tokens = set(re.split(r'[^A-Z]+', upper))
+    for code in sorted(ISO_CURRENCY_CODES):
+        if code in tokens:
+            return code
+    return None
+
+
+def quote_type(label) -> str:
+    """从列名识别报价类型，无法识别时视为中间价"""
+    name = str(label).lower()
+    for keyword, quote in QUOTE_KEYWORDS:
+        if keyword in name:
+            return quote
+    return 'mid'
+
+
+def reference_rates(panel: pd.DataFrame) -> Dict[str, float]:
+    """由巨无霸面板推算各货币"1单位外币兑人民币"的参照汇率（各期中位数），用于判断报价单位"""
+    panel = panel.assign(currency_code=panel['currency_code'].astype(str))
+    dollar_ex = panel.pivot_table(index='date', columns='currency_code', values='dollar_ex')
+    if 'CNY' not in dollar_ex.columns:
+        return {}
+    cny_per_unit = dollar_ex.rdiv(dollar_ex['CNY'], axis=0)
+    cny_per_unit['USD'] = dollar_ex['CNY']
+    medians = cny_per_unit.median()
+    return {str(code): float(value) for code, value in medians.items() if np.isfinite(value) and value > 0}
+
+
+def _per_100(column: str, values: pd.Series, pair: str, reference: Optional[Dict[str, float]]) -> bool:
+    """判断一个货币对的报价是否以每100外币计"""
+    if '100' in str(column):
+        return True
+    quoted = float(values.median())
+    if reference and pair in reference:
+        ratio = quoted / reference[pair]
+        return _PER_100_RATIO[0] < ratio < _PER_100_RATIO[1]
+    # 没有参照时沿用原有规则：均值大于500视为每100外币报价
+    return float(values.mean()) > 500
+
+
+def _long_to_columns(raw: pd.DataFrame, date_col: str, pair_col: str) -> List[Tuple[str, str, str, pd.Series]]:
+    value_cols = [col for col in raw.columns if col not in (date_col, pair_col)
+                  and pd.api.types.is_numeric_dtype(raw[col])]
+    series = []
+    for label, group in raw.groupby(pair_col, sort=True):
+        pair = currency_code(label)
+        if pair is None:
+            continue
+        dates = pd.to_datetime(group[date_col])
+        for col in value_cols:
+            values = pd.Series(group[col].to_numpy(dtype=np.float64), index=dates)
+            series.append((pair, quote_type(col), col, values))
+    return series
+
+
+def _wide_to_columns(raw: pd.DataFrame, date_col: str, default_pair: str) -> List[Tuple[str, str, str, pd.Series]]:
+    value_cols = [col for col in raw.columns if col != date_col and pd.api.types.is_numeric_dtype(raw[col])]
+    dates = pd.to_datetime(raw[date_col])
+    series = []
+    for col in value_cols:
+        pair = currency_code(col)
+        if pair is None:
+            if len(value_cols) > 1:
+                continue
+            pair = default_pair
+        values = pd.Series(raw[col].to_numpy(dtype=np.float64), index=dates)
+        series.append((pair, quote_type(col), col, values))
+    return series
+
+
+def parse_fx_quotes(raw: pd.DataFrame, reference: Optional[Dict[str, float]] = None,
+                    default_pair: str = 'USD') -> pd.DataFrame:
+    """把汇率原始表解析为按日对齐的宽表
+
+    返回的数据框含 date 列和 "{货币代码}_{报价类型}" 列（如 USD_mid、EUR_buy），
+    数值统一为1单位外币兑人民币；日期补齐为连续自然日，缺失日期使用之前最近一个交易日的报价。
+    """
+    date_col = _find_column(raw.columns, _DATE_KEYWORDS)
+    if date_col is None:
+        raise ValueError("无法识别汇率数据的日期列")
+    pair_col = _find_column([col for col in raw.columns if col != date_col], _PAIR_KEYWORDS)
+    if pair_col is not None and not pd.api.types.is_numeric_dtype(raw[pair_col]):
+        series = _long_to_columns(raw, date_col, pair_col)
+    else:
+        series = _wide_to_columns(raw, date_col, default_pair)
+    if not series:
+        raise ValueError("汇率数据中没有可识别的货币对")
+
+    columns = {}
+    for pair, quote, column, values in series:
+        values = values.dropna()
+        values = values[~values.index.duplicated(keep='last')].sort_index()
+        if values.empty:
+            continue
+        if _per_100(column, values, pair, reference):
+            values = values / 100
+        name = f"{pair}_{quote}"
+        # 同一货币同一报价类型出现多列时保留第一列
+        columns.setdefault(name, values)
+    if not columns:
+        raise ValueError("汇率数据中没有有效的报价")
+
+    matrix = pd.DataFrame(columns).sort_index()
+    full_dates = pd.date_range(start=matrix.index.min(), end=matrix.index.max())
+    matrix = matrix.reindex(full_dates).ffill()
+    matrix.index.name = 'date'
+    return matrix[sorted(matrix.columns)].reset_index()
+
+
+def available_pairs(matrix: pd.DataFrame) -> List[str]:
+    """宽表中包含的货币代码"""
+    return sorted({col.rsplit('_', 1)[0] for col in matrix.columns if col != 'date'})
+
+
+def pair_series(matrix: pd.DataFrame, pair: str, quote: Optional[str] = None) -> Optional[pd.Series]:
+    """某一货币"1单位外币兑人民币"的序列（按 QUOTE_PREFERENCE 选择报价类型），不存在时返回None"""
+    for candidate in ([quote] if quote else QUOTE_PREFERENCE):
+        column = f"{pair}_{candidate}"
+        if column in matrix.columns:
+            return matrix[column]
+    return None
+
+
+def market_rate_frame(matrix: pd.DataFrame, currency: str, quote: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """某一货币兑美元的市场汇率（1美元兑本币，与面板 dollar_ex 口径一致），列为 date / actual_rate
+
+    人民币直接取美元牌价，其他货币由美元牌价与该货币牌价套算；缺少所需牌价时返回None。
+    """
+    usd = pair_series(matrix, 'USD', quote)
+    if usd is None or currency == 'USD':
+        return None
+    if currency == 'CNY':
+        rate = usd
+    else:
+        local = pair_series(matrix, currency, quote)
+        if local is None:
+            return None
+        rate = usd / local
+    frame = pd.DataFrame({'date': matrix['date'], 'actual_rate': rate.to_numpy(dtype=np.float64)})
+    return frame.dropna().reset_index(drop=True)
@@ -0,0 +1,158 @@
+"""GDP调整巨无霸指数重算
+
+按《经济学人》的做法，在每个发布日期对各国巨无霸美元价格和人均GDP做横截面线性回归，
+以回归拟合值作为"按收入水平应有的价格"（adj_price），再用 美元价格/拟合价格 计算相对
+任一基准货币的调整估值。所有发布日期的回归在 日期 × 国家 矩阵上用闭式最小二乘一次完成，
+修改任意价格、汇率或GDP后可以即时重算。
+
+由于《经济学人》的回归样本会剔除部分国家，重算结果与CSV中的 adj_price 可能略有差异。
+"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from utils.panel import BigMacPanel
+
+# 与CSV中 *_adjusted 列对应的基准货币
+ADJUSTMENT_BASES = ('USD', 'EUR', 'GBP', 'JPY', 'CNY')
+
+# 可以修改的输入指标
+EDITABLE_COLUMNS = ('local_price', 'dollar_ex', 'GDP_bigmac')
+
+
+def fit_price_gdp(dollar_price: np.ndarray, gdp: np.ndarray) -> Dict[str, np.ndarray]:
+    """对每一行（发布日期）分别做 dollar_price = intercept + slope × gdp 的最小二乘回归
+
+    参数为 日期 × 国家 矩阵，价格或GDP缺失（或GDP不为正）的国家不参与该日期的回归；
+    样本少于2个或GDP没有差异的日期结果为NaN。返回 intercept / slope / n 三个按日期的数组。
+    """
+    mask = np.isfinite(dollar_price) & np.isfinite(gdp) & (gdp > 0)
+    x = np.where(mask, gdp, 0.0)
+    y = np.where(mask, dollar_price, 0.0)
+    n = mask.sum(axis=1)
+    sum_x = x.sum(axis=1)
+    sum_y = y.sum(axis=1)
+    sum_xx = (x * x).sum(axis=1)
+    sum_xy = (x * y).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = n * sum_xx - sum_x * sum_x
+        slope = np.where((n >= 2) & (denominator > 0), (n * sum_xy - sum_x * sum_y) / denominator, np.nan)
+        intercept = (sum_y - slope * sum_x) / n
+    return {'intercept': intercept, 'slope': slope, 'n': n}
+
+
+class GdpAdjustmentResult:
+    """一次重算的结果：各期回归系数、拟合价格，以及相对任一基准货币的调整估值"""
+
+    def __init__(self, panel: BigMacPanel, local_price: np.ndarray, dollar_ex: np.ndarray, gdp: np.ndarray):
+        self.panel = panel
+        self.local_price = local_price
+        self.dollar_ex = dollar_ex
+        self.gdp = gdp
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.dollar_price = local_price / dollar_ex
+        fit = fit_price_gdp(self.dollar_price, gdp)
+        self.intercept = fit['intercept']
+        self.slope = fit['slope']
+        self.n = fit['n']
+        self.adj_price = self.intercept[:, None] + self.slope[:, None] * gdp
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._ratio = self.dollar_price / self.adj_price
+
+    def adjusted_valuation(self, base: str = 'USD') -> np.ndarray:
+        """各国相对基准货币的调整估值（日期 × 国家，小数形式），该期没有基准货币时为NaN"""
+        try:
+            code = self.panel.currency_labels.index(base)
+        except ValueError:
+            raise ValueError(f"面板中没有基准货币 {base} 的数据")
+        is_base = self.panel.currency == code
+        has_base = is_base.any(axis=1)
+        base_ratio = np.where(has_base, self._ratio[np.arange(len(is_base)), is_base.argmax(axis=1)], np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._ratio / base_ratio[:, None] - 1
+
+    def regression_frame(self) -> pd.DataFrame:
+        """各发布日期的回归系数和样本数"""
+        return pd.DataFrame({
+            'date': self.panel.dates,
+            'intercept': self.intercept,
+            'slope': self.slope,
+            'countries': self.n,
+        })
+
+    def to_frame(self, bases: Sequence[str] = ADJUSTMENT_BASES, date=None) -> pd.DataFrame:
+        """整理为长表（只含有观测的行），每个基准货币一列 {base}_adjusted；可只取某一发布日期"""
+        observed = self.panel.observed
+        if date is not None:
+            row = self.panel.date_position(date)
+            observed = np.zeros_like(observed)
+            observed[row] = self.panel.observed[row]
+        date_idx, country_idx = np.nonzero(observed)
+        iso_a3 = np.asarray(self.panel.countries, dtype=object)[country_idx]
+        frame = pd.DataFrame({
+            'date': self.panel.dates[date_idx],
+            'iso_a3': iso_a3,
+            'name': [self.panel.names.get(iso, iso) for iso in iso_a3],
+            'currency_code': np.asarray(self.panel.currency_labels, dtype=object)[self.panel.currency[date_idx, country_idx]],
+            'local_price': self.local_price[date_idx, country_idx],
+            'dollar_ex': self.dollar_ex[date_idx, country_idx],
+            'dollar_price': self.dollar_price[date_idx, country_idx],
+            'GDP_bigmac': self.gdp[date_idx, country_idx],
+            'adj_price': self.adj_price[date_idx, country_idx],
+        })
+        for base in bases:
+            if base in self.panel.currency_labels:
+                frame[f'{base}_adjusted'] = self.adjusted_valuation(base)[date_idx, country_idx]
+        return frame
+
+
+class GdpAdjustmentEngine:
+    """基于三维面板的GDP调整估值重算引擎
+
+    初始化时取出本币价格、汇率和人均GDP三个 日期 × 国家 矩阵（float64）；
+    compute() 可传入修改表，在副本上覆盖对应单元格后对全部日期一次性重算。
+    """
+
+    def __init__(self, panel: BigMacPanel):
+        self.panel = panel
+        self.local_price = panel.metric('local_price').astype(np.float64)
+        self.dollar_ex = panel.metric('dollar_ex').astype(np.float64)
+        self.gdp = panel.metric('GDP_bigmac').astype(np.float64)
+        self._baseline: Optional[GdpAdjustmentResult] = None
+
+    @classmethod
+    def from_frame(cls, panel: pd.DataFrame) -> "GdpAdjustmentEngine":
+        return cls(BigMacPanel.from_frame(panel))
+
+    def compute(self, edits: Optional[pd.DataFrame] = None) -> GdpAdjustmentResult:
+        """重算全部发布日期的GDP调整估值
+
+        edits 为修改表，包含 date、iso_a3 以及 local_price / dollar_ex / GDP_bigmac 中的任意列，
+        其中的缺失值表示不修改；只能修改面板中已有的 (date, iso_a3) 观测。
+        """
+        if edits is None or edits.empty:
+            # 未修改时的结果只计算一次
+            if self._baseline is None:
+                self._baseline = GdpAdjustmentResult(self.panel, self.local_price, self.dollar_ex, self.gdp)
+            return self._baseline
+
+        inputs = {'local_price': self.local_price.copy(), 'dollar_ex': self.dollar_ex.copy(),
+                  'GDP_bigmac': self.gdp.copy()}
+        rows = np.array([self.panel.date_position(d) for d in pd.to_datetime(edits['date'])], dtype=np.intp)
+        cols = np.array([self.panel.country_position(str(iso)) for iso in edits['iso_a3']], dtype=np.intp)
+        if not self.panel.observed[rows, cols].all():
+            raise ValueError("只能修改面板中已有的国家和日期")
+        for column in EDITABLE_COLUMNS:
+            if column in edits.columns:
+                values = pd.to_numeric(edits[column], errors='coerce').to_numpy(dtype=np.float64)
+                changed = ~np.isnan(values)
+                inputs[column][rows[changed], cols[changed]] = values[changed]
+        return GdpAdjustmentResult(self.panel, inputs['local_price'], inputs['dollar_ex'], inputs['GDP_bigmac'])
+
+
+def get_adjustment_engine() -> GdpAdjustmentEngine:
+    """获取基于内置面板数据的共享重算引擎（随内置数据热更新，见 utils.data_registry）"""
+    from utils.data_registry import get_data_registry
+    return get_data_registry().current.adjustment_engine
@@ -0,0 +1,181 @@
+"""导入耗时报告
+
+在独立子进程中以 python -X importtime 逐个导入应用模块，输出每个模块的冷启动导入耗时（毫秒），
+并检查是否提前加载了应延迟导入的重型依赖，用于防止冷启动性能回退。单独 import pandas 时已经
+加载的依赖（例如新版 pandas 会加载 pyarrow）不算作提前加载。
+
+页面脚本（app.py 与 pages/*.py）导入时会执行整个页面，无法单独导入，改为静态检查脚本顶层
+（函数体之外）是否直接导入了这些依赖。
+
+用法：
+    python -m utils.import_report
+    python -m utils.import_report --budget-ms 1500 --json
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, Any, List, Sequence
+
+# 需要检查的应用模块
+APP_MODULES = [
+    'utils',
+    'utils.rate_limiter',
+    'utils.prompt_builder',
+    'utils.job_queue',
+    'utils.exporter',
+    'utils.tracing',
+    'utils.profiler',
+    'utils.dtypes',
+    'utils.frame_registry',
+    'utils.session_resources',
+    'utils.shared_arrays',
+    'utils.panel',
+    'utils.tiles',
+    'utils.fx',
+    'utils.cross_rates',
+    'utils.ppp',
+    'utils.gdp_adjustment',
+    'utils.snapshot',
+    'utils.store',
+    'utils.data_registry',
+    'utils.chart_renderer',
+    'utils.data_processor',
+    'utils.ai_analyzer',
+    'utils.batch_report',
+    'utils.country_pipeline',
+    'utils.pipeline',
+]
+
+# 这些依赖只应在首次使用时加载
+LAZY_MODULES = ['matplotlib', 'seaborn', 'xlsxwriter', 'requests', 'pyarrow', 'duckdb']
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pandas_loaded_modules() -> List[str]:
+    """单独 import pandas 时就会加载的延迟依赖（这些依赖不计入各模块的提前加载）"""
+    code = f"import pandas, sys, json; print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return []
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def page_scripts() -> List[str]:
+    """需要静态检查的页面脚本（相对项目根目录的路径）"""
+    pages = sorted(glob.glob(os.path.join(PROJECT_ROOT, "pages", "*.py")))
+    return ["app.py"] + [os.path.relpath(path, PROJECT_ROOT) for path in pages]
+
+
+def _top_level_imports(node: ast.AST) -> List[str]:
+    """脚本运行时会立即执行的导入语句中的模块名（跳过函数体）"""
+    names = []
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            continue
+        if isinstance(child, ast.Import):
+            names.extend(alias.name for alias in child.names)
+        elif isinstance(child, ast.ImportFrom) and child.module and child.level == 0:
+            names.append(child.module)
+        names.extend(_top_level_imports(child))
+    return names
+
+
+def scan_page(script: str) -> Dict[str, Any]:
+    """静态检查页面脚本顶层直接导入的重型依赖"""
+    try:
+        with open(os.path.join(PROJECT_ROOT, script), encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=script)
+    except (OSError, SyntaxError) as e:
+        return {'module': script, 'error': str(e)}
+    roots = {name.split(".")[0] for name in _top_level_imports(tree)}
+    return {'module': script, 'static': True, 'eager_heavy_modules': [m for m in LAZY_MODULES if m in roots]}
+
+
+def measure_module(module: str, ignored: Sequence[str] = ()) -> Dict[str, Any]:
+    """在新的解释器中导入模块，返回总耗时、最慢的子模块以及提前加载的重型依赖
+
+    ignored 中的依赖（单独 import pandas 时已加载的）不计入提前加载。
+    """
+    code = (
+        f"import {module}; import sys, json; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {'module': module, 'error': proc.stderr.strip().splitlines()[-1] if proc.stderr else '导入失败'}
+
+    # 每行格式: "import time:   self [us] | cumulative | imported package"，子模块名前带缩进
+    parsed = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        parsed.append((fields[2].rstrip()[1:], int(fields[0]), int(fields[1])))
+
+    # 子模块先于父模块输出，只统计目标模块这一行及之前的记录（之后是检测代码自身的导入）
+    end = next((i for i, (name, _, _) in enumerate(parsed) if name == module), len(parsed) - 1)
+    parsed = parsed[:end + 1]
+    target = parsed[-1][2] if parsed else 0
+    slowest = sorted(((name.strip(), cumulative) for name, _, cumulative in parsed), key=lambda x: -x[1])[:5]
+
+    return {
+        'module': module,
+        'import_ms': round(target / 1000, 1),
+        'slowest': [{'module': name, 'ms': round(us / 1000, 1)} for name, us in slowest],
+        'eager_heavy_modules': [m for m in json.loads(proc.stdout.strip().splitlines()[-1]) if m not in ignored],
+    }
+
+
+def build_report(modules: List[str], pages: Sequence[str] = ()) -> List[Dict[str, Any]]:
+    ignored = pandas_loaded_modules()
+    return [measure_module(module, ignored) for module in modules] + [scan_page(page) for page in pages]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="应用模块导入耗时报告")
+    parser.add_argument("modules", nargs="*", default=APP_MODULES, help="要检查的模块，默认检查所有应用模块")
+    parser.add_argument("--budget-ms", type=float, default=None, help="单个模块导入耗时上限，超出时返回非零退出码")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    parser.add_argument("--no-pages", action="store_true", help="不静态检查 app.py 与 pages/*.py")
+    args = parser.parse_args(argv)
+
+    report = build_report(args.modules, [] if args.no_pages else page_scripts())
+    failed = False
+    for item in report:
+        if 'error' in item:
+            failed = True
+            continue
+        if item['eager_heavy_modules']:
+            failed = True
+        if args.budget_ms is not None and not item.get('static') and item['import_ms'] > args.budget_ms:
+            failed = True
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for item in report:
+            if 'error' in item:
+                print(f"{item['module']:<28} 导入失败: {item['error']}")
+                continue
+            eager = f"  提前加载: {', '.join(item['eager_heavy_modules'])}" if item['eager_heavy_modules'] else ""
+            if item.get('static'):
+                print(f"{item['module']:<28} {'静态检查':>11}{eager}")
+                continue
+            print(f"{item['module']:<28} {item['import_ms']:>8.1f} ms{eager}")
+            for slow in item['slowest'][:3]:
+                print(f"    {slow['module']:<40} {slow['ms']:>8.1f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, Callable
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def prompt_hash(kind: str, prompt: str, variant: str = "") -> str:
+    """计算分析类型、提示内容与生成方式（调用API或模拟）的哈希，用于结果去重与持久化"""
+    return hashlib.sha256(f"{kind}\n{variant}\n{prompt}".encode("utf-8")).hexdigest()[:16]
+
+
+def _fn_label(fn: Callable[..., str]) -> str:
+    """生成结果的函数标识：同一提示用真实API和模拟函数得到的结果不能互相复用"""
+    return f"{getattr(fn, '__module__', '')}.{getattr(fn, '__qualname__', type(fn).__name__)}"
+
+
+@dataclass
+class AnalysisJob:
+    """一次后台AI分析任务"""
+    job_id: str
+    session_id: str
+    kind: str
+    prompt_hash: str
+    status: str = PENDING
+    result: Optional[str] = None
+    error: Optional[str] = None
+    queue_position: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+class AnalysisJobQueue:
+    """AI分析后台任务队列
+
+    submit 立即返回任务ID，分析在线程池中执行，页面脚本不会被阻塞。
+    结果按 (会话ID, 提示哈希) 保存在内存并写入磁盘，页面切换或重新运行后仍可取回。
+    已结束的任务超过 ttl 秒后从内存和磁盘中清除，内存中最多保留 max_jobs 个已结束的任务。
+    """
+
+    # 两次清理磁盘结果目录的最小间隔（秒）
+    PRUNE_INTERVAL = 600
+
+    def __init__(self, max_workers: int = 4, store_dir: Optional[str] = None,
+                 ttl: float = 24 * 3600, max_jobs: int = 2000):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._by_key: Dict[tuple, str] = {}
+        self.store_dir = store_dir
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._last_prune = 0.0
+
+    def _result_path(self, session_id: str, key_hash: str) -> Optional[str]:
+        if not self.store_dir:
+            return None
+        return os.path.join(self.store_dir, session_id, f"{key_hash}.json")
+
+    def _persist(self, job: AnalysisJob):
+        path = self._result_path(job.session_id, job.prompt_hash)
+        if path is None or job.status != DONE:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(asdict(job), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            # 持久化失败不影响内存中的结果
+            pass
+
+    def _load_persisted(self, session_id: str, key_hash: str) -> Optional[AnalysisJob]:
+        path = self._result_path(session_id, key_hash)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                job = AnalysisJob(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        if self._expired(job, time.time()):
+            return None
+        return job
+
+    def _expired(self, job: AnalysisJob, now: float) -> bool:
+        return job.finished and job.finished_at is not None and now - job.finished_at > self.ttl
+
+    def _evict_locked(self, now: float):
+        """清除过期的已结束任务；仍超过上限时按结束时间从旧到新清除（调用方持有锁）"""
+        finished = sorted((job for job in self._jobs.values() if job.finished),
+                          key=lambda job: job.finished_at or 0.0)
+        excess = len(self._jobs) - self.max_jobs
+        for job in finished:
+            if not self._expired(job, now) and excess <= 0:
+                break
+            del self._jobs[job.job_id]
+            key = (job.session_id, job.prompt_hash)
+            if self._by_key.get(key) == job.job_id:
+                del self._by_key[key]
+            excess -= 1
+
+    def _prune_store(self, now: float):
+        """删除磁盘上超过 ttl 的结果文件和空的会话目录"""
+        if not self.store_dir or not os.path.isdir(self.store_dir):
+            return
+        for session_dir in os.scandir(self.store_dir):
+            if not session_dir.is_dir():
+                continue
+            try:
+                for entry in os.scandir(session_dir.path):
+                    if entry.is_file() and now - entry.stat().st_mtime > self.ttl:
+                        os.unlink(entry.path)
+                if not os.listdir(session_dir.path):
+                    os.rmdir(session_dir.path)
+            except OSError:
+                # 其他进程可能同时在清理
+                continue
+
+    def submit(self, session_id: str, kind: str, prompt: str, fn: Callable[..., str], *args,
+               report_queue_position: bool = False, **kwargs) -> str:
+        """提交分析任务并立即返回任务ID
+
+        相同会话、相同提示的任务若已完成或正在进行，直接返回已有任务ID。
+        fn 失败时应抛出异常而不是返回错误文本：失败的任务不会持久化，再次提交时重新执行；
+        返回的文本一律视为成功结果，会在 ttl 内被复用。
+        report_queue_position=True 时会向 fn 传入 on_wait 回调，用于记录在API队列中的位置。
+        """
+        key_hash = prompt_hash(kind, prompt, _fn_label(fn))
+        key = (session_id, key_hash)
+        now = time.time()
+        prune = now - self._last_prune > self.PRUNE_INTERVAL
+        with self._lock:
+            self._evict_locked(now)
+            if prune:
+                self._last_prune = now
+            existing_id = self._by_key.get(key)
+            if existing_id is not None and self._jobs[existing_id].status != FAILED:
+                return existing_id
+
+            persisted = self._load_persisted(session_id, key_hash)
+            if persisted is not None:
+                self._jobs[persisted.job_id] = persisted
+                self._by_key[key] = persisted.job_id
+                return persisted.job_id
+
+            job = AnalysisJob(job_id=uuid.uuid4().hex, session_id=session_id, kind=kind, prompt_hash=key_hash)
+            self._jobs[job.job_id] = job
+            self._by_key[key] = job.job_id
+
+        if prune:
+            self._prune_store(now)
+        if report_queue_position:
+            kwargs["on_wait"] = lambda position: setattr(job, "queue_position", position)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.job_id
+
+    def _run(self, job: AnalysisJob, fn: Callable[..., str], args: tuple, kwargs: Dict[str, Any]):
+        job.status = RUNNING
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.queue_position = None
+            job.finished_at = time.time()
+        self._persist(job)
+
+    def get(self, job_id: Optional[str]) -> Optional[AnalysisJob]:
+        """按任务ID查询任务"""
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find(self, session_id: str, kind: str, prompt: str, fn: Callable[..., str]) -> Optional[AnalysisJob]:
+        """按会话、提示与生成函数查询任务（包括磁盘上已持久化的结果）"""
+        key_hash = prompt_hash(kind, prompt, _fn_label(fn))
+        with self._lock:
+            job_id = self._by_key.get((session_id, key_hash))
+            if job_id is not None:
+                return self._jobs[job_id]
+        return self._load_persisted(session_id, key_hash)
+
+    def stats(self) -> Dict[str, int]:
+        """各状态的任务数量"""
+        with self._lock:
+            counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> AnalysisJobQueue:
+    """获取进程内共享的AI分析任务队列"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                store_dir = os.environ.get(
+                    "AI_JOB_STORE_DIR",
+                    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "ai_jobs"),
+                )
+                _job_queue = AnalysisJobQueue(
+                    max_workers=int(os.environ.get("AI_JOB_WORKERS", "8")),
+                    store_dir=store_dir,
+                    ttl=float(os.environ.get("AI_JOB_TTL_SEC", 24 * 3600)),
+                )
+    return _job_queue
@@ -0,0 +1,127 @@
+"""LLM调用延迟基准测试
+
+通过真实的HTTP传输路径（DeepSeekAnalyzer._call_api / stream_api）并发发起N次分析，
+统计p50/p95/p99延迟与吞吐量。默认自动启动本地替身服务，也可指向任意兼容的API地址。
+
+用法：
+    python -m utils.llm_benchmark --requests 100 --concurrency 20
+    python -m utils.llm_benchmark --base-url http://127.0.0.1:8787 --stream
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from utils.ai_analyzer import DeepSeekAnalyzer
+from utils.mock_llm_server import MockServerConfig, start_mock_server
+from utils.rate_limiter import LLMTrafficGovernor
+
+# 基准测试使用的示例指标
+SAMPLE_METRICS = {
+    'data_period': '2000-04-01 至 2023-07-01',
+    'avg_deviation': 3.12,
+    'max_deviation': 12.45,
+    'min_deviation': -4.87,
+    'latest_deviation': 1.23,
+    'over_under': '高估',
+}
+
+
+def _run_one(analyzer: DeepSeekAnalyzer, prompt: str, stream: bool) -> Dict[str, Any]:
+    """执行一次分析并记录耗时"""
+    start = time.perf_counter()
+    first_token = None
+    try:
+        if stream:
+            for _ in analyzer.stream_api(prompt):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+        else:
+            analyzer._call_api(prompt)
+        return {'ok': True, 'latency': time.perf_counter() - start, 'ttft': first_token}
+    except Exception as e:
+        return {'ok': False, 'latency': time.perf_counter() - start, 'ttft': None, 'error': str(e)}
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'p50': float('nan'), 'p95': float('nan'), 'p99': float('nan')}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+
+def run_benchmark(base_url: str, n_requests: int = 50, concurrency: int = 10, stream: bool = False,
+                  governor: Optional[LLMTrafficGovernor] = None, api_key: str = "sk-benchmark") -> Dict[str, Any]:
+    """并发执行 n_requests 次分析，返回延迟分位数与吞吐量统计"""
+    analyzer = DeepSeekAnalyzer(api_key=api_key, governor=governor, api_base_url=base_url)
+    prompt = analyzer.build_metrics_prompt(SAMPLE_METRICS)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _run_one(analyzer, prompt, stream), range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r['ok']]
+    report = {
+        'base_url': base_url,
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'stream': stream,
+        'succeeded': len(ok),
+        'failed': len(results) - len(ok),
+        'elapsed_sec': elapsed,
+        'throughput_rps': len(ok) / elapsed if elapsed > 0 else 0.0,
+        'latency_sec': _percentiles([r['latency'] for r in ok]),
+        'traffic': analyzer.get_traffic_metrics(),
+    }
+    if stream:
+        report['ttft_sec'] = _percentiles([r['ttft'] for r in ok if r['ttft'] is not None])
+    errors = [r['error'] for r in results if not r['ok']]
+    if errors:
+        report['sample_errors'] = errors[:5]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LLM调用延迟基准测试")
+    parser.add_argument("--base-url", default=None, help="API基础URL，不指定时自动启动本地替身服务")
+    parser.add_argument("--requests", type=int, default=50, help="总请求数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发数")
+    parser.add_argument("--stream", action="store_true", help="使用流式接口并统计首字延迟")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="令牌桶速率（次/秒），不指定时使用进程级共享配置")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="流量控制器的并发上限")
+    parser.add_argument("--latency", type=float, default=0.5, help="替身服务首字延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="替身服务生成速率（token/秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身服务错误注入概率")
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = start_mock_server(MockServerConfig(
+            latency=args.latency, token_rate=args.token_rate, error_rate=args.error_rate))
+        base_url = server.base_url
+
+    governor = None
+    if args.rate is not None or args.max_concurrency is not None:
+        governor = LLMTrafficGovernor(
+            rate_per_sec=args.rate or 1000.0,
+            burst=max(1, args.concurrency),
+            max_concurrency=args.max_concurrency or args.concurrency,
+        )
+
+    try:
+        report = run_benchmark(base_url, args.requests, args.concurrency, args.stream, governor)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""多会话页面负载测试
+
+使用Streamlit的无头测试工具（streamlit.testing.v1.AppTest）在同一进程内模拟N个学生并发
+完成真实的操作流程：在数据导入页加载内置数据并执行预处理，然后在数据分析页反复拖动滑块、
+调整时间范围并请求AI分析（使用本地替身服务）。统计每次页面重新运行的延迟分位数、进程峰值
+常驻内存和CPU占用，用于估算单个进程能服务的学生人数。
+
+用法：
+    python -m utils.load_test --sessions 20 --iterations 5
+    python -m utils.load_test --sessions 40 --think-time 0.5 --json
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from utils.mock_llm_server import MockServerConfig, start_mock_server
+from utils.session_resources import process_rss_bytes
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_PAGE = os.path.join(_PROJECT_DIR, "pages", "02_数据导入.py")
+ANALYSIS_PAGE = os.path.join(_PROJECT_DIR, "pages", "03_数据分析.py")
+
+# 从数据导入页带到数据分析页的会话状态（AppTest 每个脚本有独立的会话）
+CARRIED_STATE_KEYS = ('session_id', 'data_processor', 'bigmac_data', 'exchange_rate_data',
+                      'analysis_data', 'data_loaded', 'metrics')
+
+
+class ResourceMonitor:
+    """后台采样进程常驻内存，并统计测试期间的CPU时间"""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak_rss = process_rss_bytes() or 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="load-test-monitor", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = process_rss_bytes()
+            if rss is not None and rss > self.peak_rss:
+                self.peak_rss = rss
+
+    def __enter__(self):
+        self._cpu_start = os.times()
+        self._wall_start = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        cpu_end = os.times()
+        self.wall_sec = time.perf_counter() - self._wall_start
+        self.cpu_sec = (cpu_end.user - self._cpu_start.user) + (cpu_end.system - self._cpu_start.system)
+
+
+def _find(elements, label: str):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"页面中找不到控件: {label}")
+
+
+class _Journey:
+    """一个模拟学生的操作流程，记录每次页面重新运行的耗时"""
+
+    def __init__(self, index: int, iterations: int, think_time: float, timeout: float, use_ai: bool, seed: int):
+        self.index = index
+        self.iterations = iterations
+        self.think_time = think_time
+        self.timeout = timeout
+        self.use_ai = use_ai
+        self.random = random.Random(seed + index)
+        self.timings: List[Dict[str, Any]] = []
+        self.errors: List[str] = []
+
+    def _run(self, step: str, app):
+        start = time.perf_counter()
+        app.run(timeout=self.timeout)
+        latency = time.perf_counter() - start
+        self.timings.append({'step': step, 'latency': latency})
+        if app.exception:
+            self.errors.append(f"{step}: {app.exception[0].value}")
+        if self.think_time > 0:
+            time.sleep(self.random.uniform(0, 2 * self.think_time))
+        return app
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        try:
+            importer = AppTest.from_file(IMPORT_PAGE, default_timeout=self.timeout)
+            self._run("导入页.打开", importer)
+            _find(importer.button, "加载内置数据").click()
+            self._run("导入页.加载内置数据", importer)
+            _find(importer.button, "执行数据预处理").click()
+            self._run("导入页.执行预处理", importer)
+
+            analysis = AppTest.from_file(ANALYSIS_PAGE, default_timeout=self.timeout)
+            for key in CARRIED_STATE_KEYS:
+                if key in importer.session_state:
+                    analysis.session_state[key] = importer.session_state[key]
+            self._run("分析页.打开", analysis)
+
+            date_input = _find(analysis.date_input, "选择时间范围")
+            min_date, max_date = date_input.min, date_input.max
+            span_days = (max_date - min_date).days
+            for _ in range(self.iterations):
+                _find(analysis.slider, "移动平均周期").set_value(self.random.randint(1, 12))
+                self._run("分析页.移动平均周期", analysis)
+                _find(analysis.slider, "变化量阈值百分位数").set_value(self.random.randint(80, 99))
+                self._run("分析页.变化量阈值", analysis)
+                start_offset = self.random.randint(0, span_days // 2)
+                _find(analysis.date_input, "选择时间范围").set_value(
+                    (min_date + timedelta(days=start_offset), max_date))
+                self._run("分析页.时间范围", analysis)
+
+            if self.use_ai:
+                _find(analysis.button, "生成指标智能分析").click()
+                self._run("分析页.提交AI分析", analysis)
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'p50': float('nan'), 'p95': float('nan'), 'p99': float('nan'), 'max': float('nan')}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(max(values))}
+
+
+def run_load_test(sessions: int = 10, iterations: int = 3, think_time: float = 0.0, timeout: float = 60.0,
+                  use_ai: bool = True, seed: int = 0, mock_config: Optional[MockServerConfig] = None) -> Dict[str, Any]:
+    """并发运行 sessions 个模拟学生，返回延迟分位数、峰值内存和CPU占用"""
+    server = start_mock_server(mock_config or MockServerConfig(latency=0.5, token_rate=200))
+    # 页面中创建的分析器和任务队列读取这些环境变量；任务结果写入临时目录，不污染正式缓存
+    os.environ["DEEPSEEK_API_BASE_URL"] = server.base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "sk-load-test")
+    os.environ.setdefault("AI_JOB_STORE_DIR", tempfile.mkdtemp(prefix="bigmac-load-test-"))
+
+    journeys = [_Journey(i, iterations, think_time, timeout, use_ai, seed) for i in range(sessions)]
+    try:
+        with ResourceMonitor() as monitor:
+            with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="student") as pool:
+                list(pool.map(lambda journey: journey.run(), journeys))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    by_step = defaultdict(list)
+    for journey in journeys:
+        for timing in journey.timings:
+            by_step[timing['step']].append(timing['latency'])
+    all_latencies = [latency for values in by_step.values() for latency in values]
+    errors = [error for journey in journeys for error in journey.errors]
+
+    return {
+        'sessions': sessions,
+        'iterations': iterations,
+        'think_time_sec': think_time,
+        'reruns': len(all_latencies),
+        'failed_sessions': sum(1 for journey in journeys if journey.errors),
+        'elapsed_sec': monitor.wall_sec,
+        'reruns_per_sec': len(all_latencies) / monitor.wall_sec if monitor.wall_sec > 0 else 0.0,
+        'rerun_latency_sec': _percentiles(all_latencies),
+        'step_latency_sec': {step: _percentiles(values) for step, values in by_step.items()},
+        'peak_rss_mb': monitor.peak_rss / 1024 / 1024,
+        'cpu_sec': monitor.cpu_sec,
+        # 进程平均占用的CPU核数（受GIL限制，接近1表示单进程已饱和）
+        'cpu_cores_used': monitor.cpu_sec / monitor.wall_sec if monitor.wall_sec > 0 else 0.0,
+        'sample_errors': errors[:5],
+    }
+
+
+def _print_report(report: Dict[str, Any]):
+    latency = report['rerun_latency_sec']
+    print(f"会话数: {report['sessions']}，页面重新运行 {report['reruns']} 次，用时 {report['elapsed_sec']:.1f} 秒，"
+          f"失败会话 {report['failed_sessions']} 个")
+    print(f"重新运行延迟: p50={latency['p50']:.3f}s p95={latency['p95']:.3f}s p99={latency['p99']:.3f}s "
+          f"max={latency['max']:.3f}s")
+    print(f"峰值常驻内存: {report['peak_rss_mb']:.0f} MB，CPU: {report['cpu_sec']:.1f} 秒"
+          f"（平均 {report['cpu_cores_used']:.2f} 核）")
+    print("各步骤延迟(p50/p95):")
+    for step, values in report['step_latency_sec'].items():
+        print(f"  {step}: {values['p50']:.3f}s / {values['p95']:.3f}s")
+    for error in report['sample_errors']:
+        print(f"错误示例: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多会话页面负载测试")
+    parser.add_argument("--sessions", type=int, default=10, help="并发模拟的学生人数")
+    parser.add_argument("--iterations", type=int, default=3, help="每个学生在分析页调整控件的轮数")
+    parser.add_argument("--think-time", type=float, default=0.0, help="两次操作之间的平均停顿（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单次页面运行的超时（秒）")
+    parser.add_argument("--no-ai", action="store_true", help="不提交AI分析")
+    parser.add_argument("--ai-latency", type=float, default=0.5, help="AI替身服务首字延迟（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(args.sessions, args.iterations, args.think_time, args.timeout,
+                           use_ai=not args.no_ai, seed=args.seed,
+                           mock_config=MockServerConfig(latency=args.ai_latency, token_rate=200))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
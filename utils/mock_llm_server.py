@@ -0,0 +1,217 @@
+"""本地DeepSeek兼容替身服务
+
+实现 /chat/completions 协议（含 stream=True 的SSE流式输出），可配置首字延迟、
+生成速率和错误注入，用于在不消耗真实API额度的情况下压测AI分析功能。
+
+用法：
+    python -m utils.mock_llm_server --port 8787 --latency 0.5 --token-rate 40 --error-rate 0.05
+
+然后设置环境变量 DEEPSEEK_API_BASE_URL=http://127.0.0.1:8787 启动应用。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class MockServerConfig:
+    """替身服务行为配置"""
+    latency: float = 0.5          # 首个token前的延迟（秒）
+    token_rate: float = 40.0      # 每秒生成的token数，<=0 表示不限速
+    reply_tokens: int = 300       # 每次回复的token数
+    error_rate: float = 0.0       # 错误注入概率
+    error_status: int = 429       # 注入错误时返回的HTTP状态码
+    seed: Optional[int] = None    # 随机种子，便于复现
+
+
+# 回复内容模板，按需重复以达到配置的token数
+_REPLY_TEXT = (
+    "根据巨无霸指数，人民币相对美元的汇率偏差反映了购买力平价与市场汇率之间的差距。"
+    "这种偏差受到非贸易品价格、资本流动、汇率制度以及巴拉萨-萨缪尔森效应等多种因素的共同影响。"
+    "从长期看，随着汇率市场化改革推进，偏差有望逐步收敛，但短期内仍会随外部冲击而波动。"
+)
+
+
+def _tokenize_reply(n_tokens: int) -> List[str]:
+    """将回复文本切分为token（按两个字符近似一个token）"""
+    tokens = []
+    while len(tokens) < n_tokens:
+        tokens.extend(_REPLY_TEXT[i:i + 2] for i in range(0, len(_REPLY_TEXT), 2))
+    return tokens[:n_tokens]
+
+
+class _ChatCompletionsHandler(BaseHTTPRequestHandler):
+    """处理 POST /chat/completions 请求"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # 压测时请求量大，关闭默认的访问日志
+        pass
+
+    @property
+    def config(self) -> MockServerConfig:
+        return self.server.config
+
+    def _send_json(self, status: int, body: dict, extra_headers: Optional[dict] = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+            self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "请求体不是合法的JSON"}})
+            return
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._send_json(401, {"error": {"message": "缺少API密钥"}})
+            return
+
+        # 错误注入
+        if self.server.draw_error():
+            status = self.config.error_status
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self._send_json(status, {"error": {"message": "注入的模拟错误"}}, headers)
+            return
+
+        tokens = _tokenize_reply(self.config.reply_tokens)
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", []))
+        time.sleep(self.config.latency)
+
+        if request.get("stream"):
+            self._stream(request, tokens)
+        else:
+            self._sleep_for_tokens(len(tokens))
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "deepseek-chat"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                },
+            })
+
+    def _sleep_for_tokens(self, n_tokens: int):
+        if self.config.token_rate > 0:
+            time.sleep(n_tokens / self.config.token_rate)
+
+    def _stream(self, request: dict, tokens: List[str]):
+        """以SSE格式逐token输出"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for i, token in enumerate(tokens):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "deepseek-chat"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": token} if i == 0 else {"content": token},
+                    "finish_reason": None,
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            self._sleep_for_tokens(1)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """多线程的DeepSeek替身HTTP服务"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: Optional[MockServerConfig] = None):
+        super().__init__(address, _ChatCompletionsHandler)
+        self.config = config or MockServerConfig()
+        self._random = random.Random(self.config.seed)
+        self._random_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw_error(self) -> bool:
+        """按配置的概率决定本次请求是否注入错误"""
+        if self.config.error_rate <= 0:
+            return False
+        with self._random_lock:
+            return self._random.random() < self.config.error_rate
+
+
+def start_mock_server(config: Optional[MockServerConfig] = None, host: str = "127.0.0.1",
+                      port: int = 0) -> MockLLMServer:
+    """在后台线程中启动替身服务（port=0 时自动选择空闲端口），返回服务实例"""
+    server = MockLLMServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地DeepSeek兼容替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.5, help="首个token前的延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="每秒生成的token数，0表示不限速")
+    parser.add_argument("--reply-tokens", type=int, default=300, help="每次回复的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="错误注入概率（0-1）")
+    parser.add_argument("--error-status", type=int, default=429, help="注入错误时的HTTP状态码")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    config = MockServerConfig(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    server = MockLLMServer((args.host, args.port), config)
+    print(f"DeepSeek替身服务已启动: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""紧凑的巨无霸指数三维面板（日期 × 国家 × 指标）
+
+把长表形式的面板数据重排为一个 float32 三维数组，日期、国家、指标三个维度都用整数编码，
+标签保存在字典中。按国家、日期或指标取数只是数组切片（视图，不复制数据），沿任一维度的
+统计也是一次向量化计算。面板可以保存为 .npy 数组加 JSON 标签文件，其他进程用
+np.load(mmap_mode='r') 内存映射打开，多个进程共享同一份页缓存；也可以复制到共享内存中供进程池映射。
+"""
+import json
+import os
+import warnings
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.shared_arrays import ArraySpec, SharedArrays, attach_arrays
+
+DateLike = Union[str, pd.Timestamp, np.datetime64]
+
+# 面板中保存的数值指标（与CSV列名一致）
+PANEL_METRICS = (
+    'local_price', 'dollar_ex', 'dollar_price',
+    'USD_raw', 'EUR_raw', 'GBP_raw', 'JPY_raw', 'CNY_raw',
+    'GDP_bigmac', 'adj_price',
+    'USD_adjusted', 'EUR_adjusted', 'GBP_adjusted', 'JPY_adjusted', 'CNY_adjusted',
+)
+
+VALUES_FILE = 'values.npy'
+OBSERVED_FILE = 'observed.npy'
+CURRENCY_FILE = 'currency.npy'
+LABELS_FILE = 'labels.json'
+_ARRAY_FILES = {'values': VALUES_FILE, 'observed': OBSERVED_FILE, 'currency': CURRENCY_FILE}
+
+# 沿某一维度统计时可用的方法（均忽略缺失值）
+_REDUCERS = {
+    'mean': np.nanmean,
+    'median': np.nanmedian,
+    'min': np.nanmin,
+    'max': np.nanmax,
+    'std': np.nanstd,
+    'sum': np.nansum,
+    'count': lambda values, axis: np.sum(~np.isnan(values), axis=axis),
+}
+
+# 可统计的维度及其在数组中的位置
+_AXES = {'date': 0, 'country': 1}
+
+
+class BigMacPanel:
+    """date × country × metric 三维float32面板
+
+    - values[d, c, m]：第 d 个发布日期、第 c 个国家的第 m 个指标，该国当期无数据时为NaN
+    - observed[d, c]：该国在该日期是否有观测
+    - currency[d, c]：该国当期使用的货币在 currency_labels 中的编号（无观测时为-1）
+    """
+
+    def __init__(self, values: np.ndarray, dates: Sequence, countries: Sequence[str], metrics: Sequence[str],
+                 observed: np.ndarray, currency: np.ndarray, currency_labels: Sequence[str],
+                 names: Optional[Dict[str, str]] = None):
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.countries = [str(c) for c in countries]
+        self.metrics = [str(m) for m in metrics]
+        self.currency_labels = [str(c) for c in currency_labels]
+        expected = (len(self.dates), len(self.countries), len(self.metrics))
+        if values.shape != expected:
+            raise ValueError(f"面板数组形状 {values.shape} 与标签数量 {expected} 不一致")
+        if observed.shape != expected[:2] or currency.shape != expected[:2]:
+            raise ValueError("观测标记或货币编号的形状与面板不一致")
+
+        self.values = values
+        self.observed = observed
+        self.currency = currency
+        self.names = dict(names or {})
+        self.date_index: Dict[np.datetime64, int] = {d: i for i, d in enumerate(self.dates)}
+        self.country_index: Dict[str, int] = {c: i for i, c in enumerate(self.countries)}
+        self.metric_index: Dict[str, int] = {m: i for i, m in enumerate(self.metrics)}
+
+    @classmethod
+    def from_frame(cls, panel: pd.DataFrame, metrics: Optional[Sequence[str]] = None) -> "BigMacPanel":
+        """由长表形式的面板数据（如 load_bigmac_panel 的结果）构建三维面板"""
+        metrics = [m for m in (metrics or PANEL_METRICS) if m in panel.columns]
+        if not metrics:
+            raise ValueError("面板数据中没有可用的数值指标")
+
+        date_codes, dates = pd.factorize(pd.to_datetime(panel['date']), sort=True)
+        country_codes, countries = pd.factorize(panel['iso_a3'].astype(str), sort=True)
+        currency_codes, currency_labels = pd.factorize(panel['currency_code'].astype(str), sort=True)
+        if pd.Series(date_codes * len(countries) + country_codes).duplicated().any():
+            raise ValueError("面板数据中存在重复的 (date, iso_a3) 记录")
+
+        shape = (len(dates), len(countries))
+        values = np.full(shape + (len(metrics),), np.nan, dtype=np.float32)
+        values[date_codes, country_codes, :] = panel[metrics].to_numpy(dtype=np.float32, na_value=np.nan)
+        observed = np.zeros(shape, dtype=bool)
+        observed[date_codes, country_codes] = True
+        currency = np.full(shape, -1, dtype=np.int16)
+        currency[date_codes, country_codes] = currency_codes
+
+        # 国家名称取最近一期的写法
+        latest = panel.sort_values('date').drop_duplicates('iso_a3', keep='last')
+        names = dict(zip(latest['iso_a3'].astype(str), latest['name'].astype(str)))
+        return cls(values, dates.to_numpy(), countries, metrics, observed, currency, currency_labels, names)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.values.nbytes + self.observed.nbytes + self.currency.nbytes)
+
+    @property
+    def release_dates(self) -> List[pd.Timestamp]:
+        """全部发布日期"""
+        return [pd.Timestamp(d) for d in self.dates]
+
+    def date_position(self, date: DateLike) -> int:
+        key = np.datetime64(pd.Timestamp(date), 'ns')
+        try:
+            return self.date_index[key]
+        except KeyError:
+            raise ValueError(f"面板中没有 {pd.Timestamp(date).strftime('%Y-%m-%d')} 的数据")
+
+    def country_position(self, iso_a3: str) -> int:
+        try:
+            return self.country_index[iso_a3]
+        except KeyError:
+            raise ValueError(f"面板中没有国家 {iso_a3} 的数据")
+
+    def metric_position(self, metric: str) -> int:
+        try:
+            return self.metric_index[metric]
+        except KeyError:
+            raise ValueError(f"面板中没有指标 {metric}")
+
+    def country(self, iso_a3: str) -> np.ndarray:
+        """某国全部日期的全部指标（dates × metrics 视图）"""
+        return self.values[:, self.country_position(iso_a3), :]
+
+    def date(self, date: DateLike) -> np.ndarray:
+        """某一发布日期全部国家的全部指标（countries × metrics 视图）"""
+        return self.values[self.date_position(date), :, :]
+
+    def metric(self, metric: str) -> np.ndarray:
+        """某一指标的日期 × 国家矩阵（视图）"""
+        return self.values[:, :, self.metric_position(metric)]
+
+    def series(self, iso_a3: str, metric: str) -> np.ndarray:
+        """某国某一指标的时间序列（视图，无观测的日期为NaN）"""
+        return self.values[:, self.country_position(iso_a3), self.metric_position(metric)]
+
+    def reduce(self, metric: Optional[str] = None, over: str = 'date', how: str = 'mean') -> Union[pd.Series, pd.DataFrame]:
+        """沿日期或国家维度做统计（忽略缺失值）
+
+        over='date' 得到每个国家的统计值，over='country' 得到每个发布日期的统计值；
+        指定 metric 时返回 Series，否则返回以指标为列的 DataFrame。
+        """
+        if over not in _AXES:
+            raise ValueError(f"不支持的统计维度: {over}")
+        if how not in _REDUCERS:
+            raise ValueError(f"不支持的统计方法: {how}")
+        values = self.values if metric is None else self.metric(metric)
+        with warnings.catch_warnings():
+            # 全为缺失值的切片结果为NaN，不需要提示
+            warnings.simplefilter('ignore', RuntimeWarning)
+            result = _REDUCERS[how](values, axis=_AXES[over])
+
+        index = pd.Index(self.countries, name='iso_a3') if over == 'date' else pd.DatetimeIndex(self.dates, name='date')
+        if metric is None:
+            return pd.DataFrame(result, index=index, columns=self.metrics)
+        return pd.Series(result, index=index, name=metric)
+
+    def to_frame(self, countries: Optional[Sequence[str]] = None,
+                 metrics: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """还原为长表（只含有观测的行），可限定国家和指标，按 (date, iso_a3) 排序"""
+        country_pos = (np.arange(len(self.countries)) if countries is None
+                       else np.array(sorted(self.country_position(c) for c in countries), dtype=np.intp))
+        metric_pos = (np.arange(len(self.metrics)) if metrics is None
+                      else np.array([self.metric_position(m) for m in metrics], dtype=np.intp))
+
+        date_idx, sub_idx = np.nonzero(self.observed[:, country_pos])
+        country_idx = country_pos[sub_idx]
+        iso_a3 = np.asarray(self.countries, dtype=object)[country_idx]
+        frame = pd.DataFrame({
+            'date': self.dates[date_idx],
+            'iso_a3': iso_a3,
+            'currency_code': np.asarray(self.currency_labels, dtype=object)[self.currency[date_idx, country_idx]],
+            'name': [self.names.get(iso, iso) for iso in iso_a3],
+        })
+        block = self.values[date_idx[:, None], country_idx[:, None], metric_pos[None, :]]
+        for j, pos in enumerate(metric_pos):
+            frame[self.metrics[pos]] = block[:, j]
+        return frame
+
+    def labels(self) -> dict:
+        """维度标签（可序列化为JSON），与三个数组一起即可还原面板"""
+        return {
+            'dates': [pd.Timestamp(d).strftime('%Y-%m-%d') for d in self.dates],
+            'countries': self.countries,
+            'metrics': self.metrics,
+            'currency_labels': self.currency_labels,
+            'names': self.names,
+        }
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {'values': self.values, 'observed': self.observed, 'currency': self.currency}
+
+    @classmethod
+    def _from_arrays(cls, arrays: Dict[str, np.ndarray], labels: dict) -> "BigMacPanel":
+        return cls(arrays['values'], pd.to_datetime(labels['dates']).to_numpy(), labels['countries'],
+                   labels['metrics'], arrays['observed'], arrays['currency'], labels['currency_labels'],
+                   labels['names'])
+
+    def save(self, directory: str):
+        """保存为可内存映射的目录：数组为 .npy 文件，标签为 labels.json（最后写入）"""
+        os.makedirs(directory, exist_ok=True)
+        for key, array in self.arrays().items():
+            filename = _ARRAY_FILES[key]
+            tmp_path = os.path.join(directory, f"{filename}.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_path, os.path.join(directory, filename))
+
+        tmp_path = os.path.join(directory, f"{LABELS_FILE}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.labels(), f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, LABELS_FILE))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "BigMacPanel":
+        """读取 save() 保存的面板；mmap=True 时以只读方式内存映射数组，不把数据读入进程内存"""
+        labels_path = os.path.join(directory, LABELS_FILE)
+        if not os.path.exists(labels_path):
+            raise ValueError(f"面板目录不完整: {directory}")
+        with open(labels_path, encoding='utf-8') as f:
+            labels = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        arrays = {key: np.load(os.path.join(directory, filename), mmap_mode=mmap_mode)
+                  for key, filename in _ARRAY_FILES.items()}
+        return cls._from_arrays(arrays, labels)
+
+    def share(self) -> SharedArrays:
+        """把面板数组复制到共享内存；把返回对象的 spec 和 labels() 传给工作进程后用 attach() 映射"""
+        return SharedArrays(self.arrays())
+
+    @classmethod
+    def attach(cls, spec: ArraySpec, labels: dict) -> Tuple["BigMacPanel", list]:
+        """在工作进程中映射共享内存中的面板，返回 (面板, 共享内存块)，使用面板期间需持有这些块"""
+        arrays, blocks = attach_arrays(spec)
+        return cls._from_arrays(arrays, labels), blocks
@@ -0,0 +1,301 @@
+"""无界面数据处理流水线
+
+不经过Streamlit页面，按数据导入页的步骤依次执行 加载 → 预处理 → 关键指标 → 导出（及图表），
+可选地再生成模拟或真实的AI分析，结果按 国家/时间段 写入输出目录，并记录每个步骤的用时
+（pipeline.json / timing.json），适合由定时任务在上课前预先生成结果、预热本地分析库。
+
+所有国家（包括中国）都用同一个函数 build_country_comparison 基于面板数据相对美国计算，
+合并文件中各国的巨无霸汇率与偏差口径一致。中国使用与数据导入页相同的美元兑人民币汇率
+（内置牌价或 --rates 指定的文件），其他国家优先使用中行牌价套算的市场汇率。
+
+用法：
+    python -m utils.pipeline --output artifacts
+    python -m utils.pipeline --countries CHN,JPN,GBR --periods all,2010- --formats xlsx,csv --ai mock
+    python -m utils.pipeline --bigmac my-index.csv --rates my-rates.xlsx --charts ""
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from utils.batch_report import parse_periods
+from utils.chart_renderer import render_chart
+from utils.data_processor import DataProcessor, build_country_comparison, compute_key_metrics, load_bigmac_panel
+from utils.exporter import EXPORT_FORMATS, export_bytes, stream_export
+from utils.fx import market_rate_frame
+from utils.store import get_store
+from utils.tracing import span
+
+MANIFEST_NAME = "pipeline.json"
+TIMING_NAME = "timing.json"
+
+CHART_TYPES = ('comparison', 'deviation')
+# 多国合并导出文件的列（各国对比数据的公共部分）
+COMBINED_COLUMNS = ['iso_a3', 'name', 'date', 'actual_rate', 'big_mac_rate', 'deviation_pct']
+AI_MODES = ('mock', 'api')
+
+
+class StepTimer:
+    """按步骤累计用时（秒）和执行次数"""
+
+    def __init__(self):
+        self.steps: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+    @contextmanager
+    def step(self, name: str, rows: Optional[int] = None):
+        started = time.perf_counter()
+        try:
+            with span(f"pipeline.{name}", rows=rows):
+                yield
+        finally:
+            stat = self.steps.setdefault(name, {'seconds': 0.0, 'count': 0})
+            stat['seconds'] += time.perf_counter() - started
+            stat['count'] += 1
+
+    def report(self) -> List[Dict[str, Any]]:
+        return [{'step': name, 'seconds': round(stat['seconds'], 4), 'count': stat['count']}
+                for name, stat in self.steps.items()]
+
+
+def _write_bytes(output_dir: str, relative_path: str, payload: bytes) -> str:
+    path = os.path.join(output_dir, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(payload)
+    return relative_path
+
+
+def _write_combined(output_dir: str, comparisons: Dict[str, pd.DataFrame], fmt: str) -> str:
+    """逐国流式写出全部国家的合并文件，不在内存中拼接完整面板"""
+    relative_path = f"all_countries.{fmt}"
+    path = os.path.join(output_dir, relative_path)
+    tmp_path = f"{path}.tmp"
+    chunks = (comparison.assign(iso_a3=iso)[COMBINED_COLUMNS] for iso, comparison in comparisons.items())
+    with open(tmp_path, "wb") as f:
+        stream_export(chunks, fmt, f)
+    os.replace(tmp_path, path)
+    return relative_path
+
+
+def _write_json(path: str, content: Any):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def _jsonable(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: (float(v) if not isinstance(v, str) else v) for k, v in metrics.items()}
+
+
+def _ai_analyses(analyzer, mode: str, iso_a3: str, metrics: Dict[str, Any], comparison: pd.DataFrame,
+                 start_year: int, end_year: int) -> str:
+    """生成指标分析、趋势分析和完整报告，合并为一份Markdown
+
+    api 模式下任一次调用失败都会抛出异常，该结果记为失败（流程以非零状态退出）。
+    """
+    if mode == 'mock' and iso_a3 != 'CHN':
+        # 本地模拟的分析文本针对人民币，其他国家只生成陈述指标的模拟报告
+        return analyzer.mock_country_report(metrics)
+    if mode == 'mock':
+        metrics_analysis = analyzer.mock_analyze_metrics(metrics)
+        trend_analysis = analyzer.mock_analyze_trends(start_year, end_year)
+        report = analyzer.mock_generate_report(metrics)
+    else:
+        metrics_analysis = analyzer.analyze_metrics(metrics)
+        country, currency = analyzer.analysis_subject(metrics)
+        trend_analysis = analyzer.analyze_data_trends(comparison, country=country, currency=currency)
+        report = analyzer.generate_report(metrics, trend_analysis, metrics_analysis)
+    return "\n\n".join([metrics_analysis, trend_analysis, report])
+
+
+def run_pipeline(output_dir: str, bigmac_path: Optional[str] = None, rates_path: Optional[str] = None,
+                 countries: Optional[Sequence[str]] = None, period_spec: str = "all",
+                 formats: Sequence[str] = ('xlsx',), charts: Sequence[str] = CHART_TYPES,
+                 ai: Optional[str] = None, api_key: Optional[str] = None) -> Dict[str, Any]:
+    """执行完整的处理流程并写入结果，返回 manifest 内容
+
+    bigmac_path / rates_path 未指定时使用内置数据；countries 默认只分析中国。
+    ai 为 None（不生成）、'mock'（本地模拟）或 'api'（调用DeepSeek）。
+    """
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+    for chart_type in charts:
+        if chart_type not in CHART_TYPES:
+            raise ValueError(f"未知的图表类型: {chart_type}")
+    if ai is not None and ai not in AI_MODES:
+        raise ValueError(f"未知的AI分析方式: {ai}")
+
+    analyzer = None
+    if ai is not None:
+        from utils.ai_analyzer import DeepSeekAnalyzer
+        analyzer = DeepSeekAnalyzer(api_key=api_key)
+        if ai == 'api' and not analyzer.api_key:
+            raise ValueError("未设置API密钥，请通过 --api-key 或 DEEPSEEK_API_KEY 提供，或使用 --ai mock")
+
+    started = time.time()
+    timer = StepTimer()
+    processor = DataProcessor()
+    countries = [iso.upper() for iso in (countries or ['CHN'])]
+
+    # 加载：汇率使用与数据导入页相同的读取和预处理逻辑
+    with timer.step("load"):
+        panel = load_bigmac_panel(bigmac_path)
+        if rates_path:
+            with open(rates_path, "rb") as f:
+                processor.load_exchange_rate_data(f)
+            fx_matrix = None
+        else:
+            processor.load_builtin_exchange_rate_data()
+            fx_matrix = processor.fx_matrix
+
+    store_status = None
+    if not bigmac_path:
+        # 预先导入本地分析库，课堂上首次查询时不再等待；分析库不可用时记录原因，不中断流程
+        with timer.step("store"):
+            try:
+                store = get_store()
+                store.ensure_builtin()
+                store_status = {'status': 'ok', 'engine': store.engine, 'path': store.path}
+            except Exception as e:
+                store_status = {'status': 'failed', 'error': str(e)}
+
+    with timer.step("analyze"):
+        comparisons = {}
+        failed = {}
+        for iso in countries:
+            try:
+                country_rows = panel[panel['iso_a3'] == iso]
+                if country_rows.empty:
+                    raise ValueError(f"面板中没有 {iso} 的数据")
+                if iso == 'CHN':
+                    rates = processor.exchange_rate_data
+                else:
+                    currency = str(country_rows['currency_code'].iloc[-1])
+                    rates = market_rate_frame(fx_matrix, currency) if fx_matrix is not None else None
+                comparison = build_country_comparison(panel, iso, rates)
+                if comparison.empty:
+                    raise ValueError(f"面板中没有与 {iso} 同期的美国价格")
+                comparisons[iso] = comparison
+            except Exception as e:
+                failed[iso] = str(e)
+
+    os.makedirs(output_dir, exist_ok=True)
+    entries = []
+    for iso, comparison in comparisons.items():
+        years = comparison['date'].dt.year
+        for label, start_year, end_year in parse_periods(period_spec, int(years.min()), int(years.max())):
+            subset = comparison[(years >= start_year) & (years <= end_year)].reset_index(drop=True)
+            # 少于2个观测点时无法分析趋势
+            if len(subset) < 2:
+                continue
+            entry = {'iso_a3': iso, 'name': str(subset['name'].iloc[0]), 'period': label, 'rows': len(subset),
+                     'artifacts': []}
+            try:
+                with timer.step("metrics", rows=len(subset)):
+                    metrics = compute_key_metrics(subset)
+                entry['metrics'] = _jsonable(metrics)
+
+                with timer.step("export", rows=len(subset)):
+                    for fmt in formats:
+                        payload = export_bytes(subset, fmt, metrics)
+                        entry['artifacts'].append(_write_bytes(output_dir, os.path.join(iso, f"{label}.{fmt}"), payload))
+
+                with timer.step("charts", rows=len(subset)):
+                    for chart_type in charts:
+                        payload = render_chart(subset, chart_type, 'png')
+                        entry['artifacts'].append(
+                            _write_bytes(output_dir, os.path.join(iso, f"{label}_{chart_type}.png"), payload))
+
+                if analyzer is not None:
+                    with timer.step("ai", rows=len(subset)):
+                        ai_metrics = metrics if iso == 'CHN' else dict(
+                            metrics, country_name=entry['name'],
+                            currency_label=f"{entry['name']}货币({subset['currency_code'].iloc[0]})")
+                        text = _ai_analyses(analyzer, ai, iso, ai_metrics, subset, start_year, end_year)
+                        entry['artifacts'].append(_write_bytes(output_dir, os.path.join(iso, f"{label}_ai.md"),
+                                                               text.encode("utf-8")))
+                entry['status'] = 'ok'
+            except Exception as e:
+                entry.update(status='failed', error=str(e))
+            entries.append(entry)
+
+    combined = []
+    if len(comparisons) > 1:
+        with timer.step("combined", rows=sum(len(c) for c in comparisons.values())):
+            for fmt in formats:
+                try:
+                    combined.append(_write_combined(output_dir, comparisons, fmt))
+                except Exception as e:
+                    failed[f"all_countries.{fmt}"] = str(e)
+
+    timing = {
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'elapsed_sec': round(time.time() - started, 2),
+        'steps': timer.report(),
+    }
+    manifest = {
+        'generated_at': timing['generated_at'],
+        'elapsed_sec': timing['elapsed_sec'],
+        'inputs': {'bigmac': bigmac_path or 'builtin', 'rates': rates_path or 'builtin'},
+        'periods': period_spec,
+        'formats': list(formats),
+        'charts': list(charts),
+        'ai': ai,
+        'store': store_status,
+        'combined': combined,
+        'failed': failed,
+        'results': entries,
+        'steps': timing['steps'],
+    }
+    _write_json(os.path.join(output_dir, TIMING_NAME), timing)
+    _write_json(os.path.join(output_dir, MANIFEST_NAME), manifest)
+    return manifest
+
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面执行巨无霸指数数据处理流程（适合定时预先生成结果）")
+    parser.add_argument("--output", default="artifacts", help="结果输出目录")
+    parser.add_argument("--bigmac", default=None, help="巨无霸指数CSV路径，默认使用内置数据")
+    parser.add_argument("--rates", default=None, help="美元兑人民币汇率文件（xlsx/csv）路径，默认使用内置数据")
+    parser.add_argument("--countries", default="CHN", help="逗号分隔的ISO国家代码")
+    parser.add_argument("--periods", default="all", help="时间段，如 all,decade,2000-2009,2015-")
+    parser.add_argument("--formats", default="xlsx", help=f"逗号分隔的导出格式（{'/'.join(EXPORT_FORMATS)}）")
+    parser.add_argument("--charts", default=",".join(CHART_TYPES), help="逗号分隔的图表类型，传空字符串不生成图表")
+    parser.add_argument("--ai", choices=AI_MODES, default=None, help="生成AI分析：mock为本地模拟，api为调用DeepSeek")
+    parser.add_argument("--api-key", default=None, help="DeepSeek API密钥，默认读取 DEEPSEEK_API_KEY")
+    args = parser.parse_args(argv)
+
+    manifest = run_pipeline(args.output, args.bigmac, args.rates, _split(args.countries.upper()), args.periods,
+                            _split(args.formats), _split(args.charts), args.ai, args.api_key)
+    ok = sum(1 for entry in manifest['results'] if entry['status'] == 'ok')
+    print(f"完成 {ok}/{len(manifest['results'])} 项，用时 {manifest['elapsed_sec']} 秒，输出目录: {args.output}")
+    for step in manifest['steps']:
+        print(f"  {step['step']:<8} {step['seconds']:>8.3f} 秒  ×{step['count']}")
+    for iso, error in manifest['failed'].items():
+        print(f"  {iso}: {error}")
+    for entry in manifest['results']:
+        if entry['status'] != 'ok':
+            print(f"  {entry['iso_a3']} {entry['period']}: {entry['error']}")
+    store_failed = manifest['store'] is not None and manifest['store']['status'] != 'ok'
+    if store_failed:
+        print(f"  分析库预热失败: {manifest['store']['error']}")
+    # 有失败项时以非零状态退出，便于定时任务报警
+    if manifest['failed'] or store_failed or ok < len(manifest['results']):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import functools
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.chart_renderer import new_figure, figure_to_bytes
+
+ArrayLike = Union[float, np.ndarray, pd.Series]
+
+# 理论学习页练习使用的示例数据：巨无霸本币价格、货币名称、市场汇率（1美元兑本币）
+PRESET_COUNTRIES = {
+    "日本": {"price": 390, "currency": "日元", "exchange_rate": 110},
+    "英国": {"price": 3.49, "currency": "英镑", "exchange_rate": 0.72},
+    "欧元区": {"price": 4.1, "currency": "欧元", "exchange_rate": 0.85},
+    "澳大利亚": {"price": 6.4, "currency": "澳元", "exchange_rate": 1.3},
+}
+
+# 批量计算表的列
+PPP_INPUT_COLUMNS = ['country', 'currency', 'local_price', 'us_price', 'market_rate']
+
+
+def ppp_valuation(local_price: ArrayLike, us_price: ArrayLike, market_rate: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+    """向量化计算巨无霸汇率和本币高估/低估百分比
+
+    参数可以是标量或等长数组（按numpy规则广播），价格或汇率为0时结果为NaN。
+    返回 (巨无霸汇率, 高估(+)/低估(-)百分比)。
+    """
+    local_price = np.asarray(local_price, dtype=np.float64)
+    us_price = np.asarray(us_price, dtype=np.float64)
+    market_rate = np.asarray(market_rate, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        big_mac_rate = np.where(us_price > 0, local_price / us_price, np.nan)
+        valuation_pct = np.where(market_rate > 0, (big_mac_rate - market_rate) / market_rate * 100, np.nan)
+    return big_mac_rate, valuation_pct
+
+
+def preset_frame(us_price: float) -> pd.DataFrame:
+    """按给定的美国价格生成全部预设国家的输入表"""
+    return pd.DataFrame({
+        'country': list(PRESET_COUNTRIES),
+        'currency': [item['currency'] for item in PRESET_COUNTRIES.values()],
+        'local_price': [float(item['price']) for item in PRESET_COUNTRIES.values()],
+        'us_price': float(us_price),
+        'market_rate': [float(item['exchange_rate']) for item in PRESET_COUNTRIES.values()],
+    })
+
+
+def ppp_table(inputs: pd.DataFrame) -> pd.DataFrame:
+    """对输入表（PPP_INPUT_COLUMNS）一次性计算所有行的巨无霸汇率与高估/低估程度"""
+    missing = [col for col in PPP_INPUT_COLUMNS if col not in inputs.columns]
+    if missing:
+        raise ValueError(f"输入缺少列: {', '.join(missing)}")
+    result = inputs[PPP_INPUT_COLUMNS].copy()
+    for col in ('local_price', 'us_price', 'market_rate'):
+        result[col] = pd.to_numeric(result[col], errors='coerce')
+    big_mac_rate, valuation_pct = ppp_valuation(result['local_price'], result['us_price'], result['market_rate'])
+    result['big_mac_rate'] = big_mac_rate
+    result['valuation_pct'] = valuation_pct
+    result['status'] = np.select([valuation_pct > 0, valuation_pct < 0], ["高估", "低估"], default="")
+    return result
+
+
+@functools.lru_cache(maxsize=256)
+def ppp_bar_chart(country: str, currency: str, big_mac_rate: float, market_rate: float) -> bytes:
+    """巨无霸汇率与市场汇率对比柱状图（PNG），按输入组合缓存
+
+    调用方应先把汇率四舍五入到展示精度，使相同的展示结果共享同一张图。
+    """
+    fig = new_figure(size=(8, 5))
+    ax = fig.add_subplot()
+    bars = ax.bar(["巨无霸汇率", "市场汇率"], [big_mac_rate, market_rate], color=["#ff9999", "#66b3ff"])
+    ax.set_ylabel(f"汇率(1美元兑换{currency})")
+    ax.set_title(f"{country}货币汇率对比")
+
+    # 添加数据标签
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2., height + 0.1, f"{height:.2f}", ha='center', va='bottom')
+    fig.tight_layout()
+    return figure_to_bytes(fig, 'png')
@@ -0,0 +1,237 @@
+"""按需性能剖析
+
+在页面地址后加 ?profile=sample（采样）或 ?profile=cprofile（确定性），或设置环境变量
+BIGMAC_PROFILE=sample|cprofile，即可剖析页面的一次运行：页面脚本在剖析器下重新执行，
+结果写入 BIGMAC_PROFILE_DIR（默认 .cache/profiles），并在页面底部展示按代码行汇总的热点。
+
+- 采样模式输出 .folded 文件（每行“栈;栈;栈 次数”），可直接交给 flamegraph.pl 或 speedscope；
+- cProfile 模式输出 .prof 文件，可用 snakeviz 或 pstats 查看。
+
+查询参数只对一次运行生效（剖析后自动从地址中移除），且与运行监控页面一样需要管理员令牌
+（设置 BIGMAC_ADMIN_TOKEN 并同时带上 ?token=<令牌>）；环境变量则对每次运行生效。
+结果目录只保留最近 BIGMAC_PROFILE_KEEP（默认20）个文件。
+"""
+import cProfile
+import io
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple
+
+from utils.tracing import admin_authorized, query_param
+
+PROFILE_MODES = ("sample", "cprofile")
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 正在剖析的线程（防止页面在剖析器中重新执行时再次进入剖析）
+_active = threading.local()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """定时采样目标线程调用栈的剖析器，开销与被剖析代码的调用次数无关"""
+
+    def __init__(self, interval: float = 0.005, root_file: Optional[str] = None):
+        self.interval = interval
+        self.root_file = os.path.abspath(root_file) if root_file else None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="page-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame)
+                frame = frame.f_back
+            stack.reverse()
+            # 只保留页面脚本及其调用的部分，去掉Streamlit运行框架的外层调用
+            if self.root_file:
+                for i, f in enumerate(stack):
+                    if os.path.abspath(f.f_code.co_filename) == self.root_file:
+                        stack = stack[i:]
+                        break
+                else:
+                    # 页面脚本尚未开始或已经结束
+                    continue
+            self.stacks[";".join(_frame_label(f) for f in stack)] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """火焰图工具可直接读取的折叠栈文本"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top_lines(self, limit: int = 20) -> List[Tuple[str, int]]:
+        """按栈顶代码行（自身耗时）汇总的采样次数"""
+        lines: Counter = Counter()
+        for stack, count in self.stacks.items():
+            lines[stack.rsplit(";", 1)[-1]] += count
+        return lines.most_common(limit)
+
+    def top_project_lines(self, limit: int = 20) -> List[Tuple[str, int]]:
+        """按本项目代码行（包括其调用的库函数耗时）汇总的采样次数"""
+        lines: Counter = Counter()
+        project_files = {os.path.basename(path) for path in _project_files()}
+        for stack, count in self.stacks.items():
+            # 取栈中最深的一个项目代码行
+            for label in reversed(stack.split(";")):
+                filename = label.rsplit("(", 1)[-1].split(":", 1)[0]
+                if filename in project_files:
+                    lines[label] += count
+                    break
+        return lines.most_common(limit)
+
+
+def _project_files() -> List[str]:
+    files = [os.path.join(_PROJECT_DIR, "app.py")]
+    for folder in ("pages", "utils"):
+        directory = os.path.join(_PROJECT_DIR, folder)
+        if os.path.isdir(directory):
+            files.extend(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".py"))
+    return files
+
+
+def requested_mode() -> Optional[str]:
+    """本次运行请求的剖析模式，未请求时返回None"""
+    # 页面地址中的剖析请求只接受管理员，避免任意访问者反复剖析页面、写入结果文件
+    requested = query_param("profile") if admin_authorized() else None
+    mode = (requested or os.environ.get("BIGMAC_PROFILE") or "").lower()
+    if mode in ("1", "true", "yes", "on"):
+        mode = "sample"
+    return mode if mode in PROFILE_MODES else None
+
+
+def _clear_query_param():
+    try:
+        import streamlit as st
+        if hasattr(st, "query_params") and "profile" in st.query_params:
+            del st.query_params["profile"]
+    except Exception:
+        pass
+
+
+def _rotate_outputs(output_dir: str, keep: int):
+    """只保留最近的 keep 个结果文件"""
+    try:
+        entries = [entry for entry in os.scandir(output_dir)
+                   if entry.is_file() and entry.name.endswith((".folded", ".prof"))]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in entries[keep:]:
+            os.unlink(entry.path)
+    except OSError:
+        pass
+
+
+def run_profiled(script_path: str, mode: str, output_dir: Optional[str] = None) -> Dict[str, Any]:
+    """在剖析器下执行页面脚本并写出结果文件
+
+    页面脚本抛出的异常（包括 st.stop 等控制流异常）在写出结果后原样抛出，
+    结果保存在返回值中，异常对象保存在 'exception' 键。
+    """
+    output_dir = output_dir or os.environ.get("BIGMAC_PROFILE_DIR", os.path.join(_PROJECT_DIR, ".cache", "profiles"))
+    os.makedirs(output_dir, exist_ok=True)
+    page_name = os.path.splitext(os.path.basename(script_path))[0]
+    base_path = os.path.join(output_dir, f"{page_name}-{time.strftime('%Y%m%d-%H%M%S')}")
+
+    result: Dict[str, Any] = {'mode': mode, 'script': script_path, 'exception': None}
+    profiler = SamplingProfiler(root_file=script_path) if mode == "sample" else cProfile.Profile()
+
+    _active.running = True
+    started = time.perf_counter()
+    try:
+        if mode == "sample":
+            profiler.start()
+        else:
+            profiler.enable()
+        try:
+            runpy.run_path(script_path, run_name="__main__")
+        except BaseException as e:
+            result['exception'] = e
+    finally:
+        if mode == "sample":
+            profiler.stop()
+        else:
+            profiler.disable()
+        _active.running = False
+    result['elapsed_sec'] = time.perf_counter() - started
+
+    if mode == "sample":
+        result['path'] = f"{base_path}.folded"
+        with open(result['path'], "w", encoding="utf-8") as f:
+            f.write(profiler.folded())
+        result['samples'] = profiler.samples
+        result['folded'] = profiler.folded()
+        result['top_lines'] = profiler.top_lines()
+        result['top_project_lines'] = profiler.top_project_lines()
+    else:
+        result['path'] = f"{base_path}.prof"
+        profiler.dump_stats(result['path'])
+        stats_text = io.StringIO()
+        pstats.Stats(profiler, stream=stats_text).strip_dirs().sort_stats("cumulative").print_stats(30)
+        result['stats_text'] = stats_text.getvalue()
+    _rotate_outputs(output_dir, max(1, int(os.environ.get("BIGMAC_PROFILE_KEEP", 20))))
+    return result
+
+
+def render_profile_summary(st, result: Dict[str, Any]):
+    """在页面中展示剖析结果摘要"""
+    with st.expander(f"🔥 性能剖析结果（{result['mode']}，{result['elapsed_sec']:.2f} 秒）", expanded=True):
+        st.caption(f"结果文件: {result['path']}")
+        if result['mode'] == "sample":
+            total = max(result['samples'], 1)
+            st.markdown("**本项目代码行（含其调用的库函数）**")
+            st.dataframe([{'代码行': label, '采样数': count, '占比(%)': round(count / total * 100, 1)}
+                          for label, count in result['top_project_lines']], use_container_width=True)
+            st.markdown("**栈顶代码行（自身耗时）**")
+            st.dataframe([{'代码行': label, '采样数': count, '占比(%)': round(count / total * 100, 1)}
+                          for label, count in result['top_lines']], use_container_width=True)
+            st.download_button("下载折叠栈（火焰图）", result['folded'],
+                               file_name=os.path.basename(result['path']), mime="text/plain")
+        else:
+            st.code(result['stats_text'], language="text")
+            with open(result['path'], "rb") as f:
+                st.download_button("下载 .prof 文件", f.read(),
+                                   file_name=os.path.basename(result['path']), mime="application/octet-stream")
+
+
+def profile_page(script_path: str):
+    """页面脚本开头（set_page_config 之前）调用：请求剖析时在剖析器下重新执行本页面，然后结束本次运行"""
+    if getattr(_active, "running", False):
+        return
+    mode = requested_mode()
+    if mode is None:
+        return
+
+    import streamlit as st
+
+    _clear_query_param()
+    result = run_profiled(script_path, mode)
+    render_profile_summary(st, result)
+    if result['exception'] is not None:
+        raise result['exception']
+    # 页面已在剖析器中完整执行过，不再执行外层的剩余部分
+    st.stop()
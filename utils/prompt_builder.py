@@ -0,0 +1,134 @@
+import textwrap
+import pandas as pd
+import numpy as np
+from typing import List, Dict, Any, Optional, Union
+
+# 单个提示的默认token预算
+DEFAULT_TOKEN_BUDGET = 1500
+
+# DeepSeek官方给出的换算比例：1个中文字符约0.6个token，1个英文字符约0.3个token
+CJK_TOKENS_PER_CHAR = 0.6
+ASCII_TOKENS_PER_CHAR = 0.3
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数（无需加载分词器）"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+    # 连续空白在分词时基本会被合并，不单独计数
+    other = sum(1 for ch in text if ord(ch) <= 0x2E80 and not ch.isspace())
+    return int(np.ceil(cjk * CJK_TOKENS_PER_CHAR + other * ASCII_TOKENS_PER_CHAR))
+
+
+def summarize_series(data: pd.DataFrame, value_col: str = 'deviation_pct', date_col: str = 'date',
+                     top_k: int = 5, max_periods: int = 12) -> Dict[str, Any]:
+    """将数值序列压缩为固定大小的摘要：分位数、分期均值表和最大的k次变化
+
+    年份多于 max_periods 时按等长的多年区间合并，保证摘要大小不随数据跨度增长。
+    """
+    series = data[[date_col, value_col]].dropna().sort_values(date_col)
+    values = series[value_col]
+    dates = series[date_col]
+
+    quantiles = values.quantile([0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0])
+
+    # 分期均值表
+    years = dates.dt.year
+    n_years = years.max() - years.min() + 1 if len(years) else 0
+    span = max(1, int(np.ceil(n_years / max_periods))) if n_years else 1
+    period_start = years.min() + ((years - years.min()) // span) * span
+    periods = values.groupby(period_start.values).mean()
+    period_table = [
+        (f"{start}" if span == 1 else f"{start}-{min(start + span - 1, years.max())}", mean)
+        for start, mean in periods.items()
+    ]
+
+    # 最大的k次相邻变化
+    changes = values.diff()
+    top_idx = changes.abs().nlargest(top_k).index
+    top_changes = [
+        (dates[i], values[i], changes[i]) for i in sorted(top_idx, key=lambda i: dates[i])
+    ]
+
+    return {
+        'count': int(len(values)),
+        'start_date': dates.iloc[0] if len(dates) else None,
+        'end_date': dates.iloc[-1] if len(dates) else None,
+        'start_value': float(values.iloc[0]) if len(values) else float('nan'),
+        'end_value': float(values.iloc[-1]) if len(values) else float('nan'),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'quantiles': {float(q): float(v) for q, v in quantiles.items()},
+        'period_table': period_table,
+        'top_changes': top_changes,
+    }
+
+
+def format_series_summary(summary: Dict[str, Any], unit: str = '%', top_k: Optional[int] = None,
+                          include_periods: bool = True) -> str:
+    """把 summarize_series 的结果格式化为提示文本，可进一步裁剪细节"""
+    q = summary['quantiles']
+    lines = [
+        f"- 观测数: {summary['count']}，均值: {summary['mean']:.2f}{unit}，标准差: {summary['std']:.2f}{unit}",
+        "- 分位数(最小/P10/P25/中位/P75/P90/最大): "
+        + "/".join(f"{q[k]:.2f}" for k in sorted(q)) + unit,
+    ]
+    if include_periods and summary['period_table']:
+        lines.append("- 分期均值: " + "；".join(f"{label}: {mean:.2f}{unit}" for label, mean in summary['period_table']))
+    changes = summary['top_changes'] if top_k is None else summary['top_changes'][:top_k]
+    if changes:
+        lines.append("- 最大变化: " + "；".join(
+            f"{date.strftime('%Y-%m-%d')} {'上升' if change > 0 else '下降'}{abs(change):.2f}{unit}(至{value:.2f}{unit})"
+            for date, value, change in changes
+        ))
+    return "\n".join(lines)
+
+
+class PromptBuilder:
+    """按token预算组装提示
+
+    每个段落可提供多个由详到简的版本；超出预算时先把靠后的可选段落降级为更简版本，
+    仍超出则从后往前丢弃可选段落。必需段落始终保留。
+    """
+
+    def __init__(self, header: str = "", budget: int = DEFAULT_TOKEN_BUDGET):
+        self.header = textwrap.dedent(header).strip()
+        self.budget = budget
+        self._sections: List[Dict[str, Any]] = []
+
+    def add_section(self, title: str, body: Union[str, List[str]], required: bool = False) -> 'PromptBuilder':
+        """添加段落，body 为字符串或由详到简排列的多个版本"""
+        variants = [body] if isinstance(body, str) else [b for b in body if b is not None]
+        if variants:
+            self._sections.append({'title': title, 'variants': variants, 'required': required})
+        return self
+
+    def _render(self, choices: List[Optional[int]]) -> str:
+        parts = [self.header] if self.header else []
+        for section, choice in zip(self._sections, choices):
+            if choice is None:
+                continue
+            body = textwrap.dedent(section['variants'][choice]).strip()
+            parts.append(f"## {section['title']}\n{body}" if section['title'] else body)
+        return "\n\n".join(parts)
+
+    def build(self) -> str:
+        """生成不超过预算的提示（只剩必需段落时即使超出也原样返回）"""
+        choices: List[Optional[int]] = [0] * len(self._sections)
+        prompt = self._render(choices)
+
+        while estimate_tokens(prompt) > self.budget:
+            for i in reversed(range(len(self._sections))):
+                section = self._sections[i]
+                if choices[i] is not None and choices[i] + 1 < len(section['variants']):
+                    choices[i] += 1
+                    break
+            else:
+                optional = [i for i, c in enumerate(choices) if c is not None and not self._sections[i]['required']]
+                if not optional:
+                    break
+                choices[optional[-1]] = None
+            prompt = self._render(choices)
+
+        return prompt
@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Callable
+
+
+class TokenBucket:
+    """令牌桶限流器：按固定速率补充令牌，允许一定突发"""
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("令牌桶速率和容量必须为正数")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def consume(self) -> float:
+        """尝试取出一个令牌，成功返回0，否则返回还需等待的秒数（调用方需自行加锁）"""
+        now = time.monotonic()
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class LLMTrafficGovernor:
+    """进程级LLM流量控制器：令牌桶限速 + 并发上限 + 公平FIFO排队
+
+    所有会话共享同一个实例（见 get_governor），请求按到达顺序依次放行，
+    放行条件为：排在队首、当前并发数未达上限、令牌桶中有可用令牌。
+    """
+
+    # 等待时定期醒来刷新排队位置的间隔（秒）
+    POLL_INTERVAL = 0.5
+    # 吞吐量统计的滑动窗口（秒）
+    THROUGHPUT_WINDOW = 60.0
+
+    def __init__(self, rate_per_sec: float = 2.0, burst: int = 4, max_concurrency: int = 4):
+        if max_concurrency < 1:
+            raise ValueError("最大并发数必须至少为1")
+        self.max_concurrency = int(max_concurrency)
+        self._bucket = TokenBucket(rate_per_sec, burst)
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._active = 0
+        self._version = 0
+
+        # 指标
+        self._admitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rate_limited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._completions = deque()
+
+    def _try_admit(self, ticket) -> Optional[float]:
+        """在持有锁时尝试放行，成功返回None，否则返回建议等待时间"""
+        if self._queue[0] is ticket and self._active < self.max_concurrency:
+            delay = self._bucket.consume()
+            if delay <= 0:
+                self._queue.popleft()
+                self._active += 1
+                self._version += 1
+                self._cond.notify_all()
+                return None
+            return min(delay, self.POLL_INTERVAL)
+        return self.POLL_INTERVAL
+
+    def acquire(self, on_wait: Optional[Callable[[int], None]] = None,
+                timeout: Optional[float] = None) -> float:
+        """排队等待一个调用名额，返回排队等待的秒数
+
+        on_wait 在排队位置变化时被调用（参数为从1开始的位置），在调用方线程中执行，
+        因此可以直接更新Streamlit占位元素。
+        """
+        ticket = object()
+        enqueued = time.monotonic()
+        deadline = None if timeout is None else enqueued + timeout
+        last_position = None
+
+        with self._cond:
+            self._queue.append(ticket)
+
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_admit(ticket)
+                    if delay is None:
+                        waited = time.monotonic() - enqueued
+                        self._admitted += 1
+                        self._wait_total += waited
+                        self._wait_max = max(self._wait_max, waited)
+                        return waited
+                    position = self._queue.index(ticket) + 1
+                    version = self._version
+
+                if on_wait is not None and position != last_position:
+                    on_wait(position)
+                    last_position = position
+
+                with self._cond:
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError("AI请求排队超时，请稍后重试")
+                        delay = min(delay, remaining)
+                    if version == self._version:
+                        self._cond.wait(delay)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._version += 1
+                    self._cond.notify_all()
+            raise
+
+    def release(self, success: bool = True):
+        """归还调用名额"""
+        with self._cond:
+            self._active = max(0, self._active - 1)
+            self._version += 1
+            if success:
+                self._completed += 1
+                self._completions.append(time.monotonic())
+            else:
+                self._failed += 1
+            self._cond.notify_all()
+
+    def record_rate_limited(self):
+        """记录一次服务端返回的429限流响应"""
+        with self._cond:
+            self._rate_limited += 1
+
+    def slot(self, on_wait: Optional[Callable[[int], None]] = None, timeout: Optional[float] = None):
+        """以上下文管理器方式占用一个调用名额"""
+        return _GovernorSlot(self, on_wait, timeout)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出排队等待与吞吐量指标"""
+        with self._cond:
+            now = time.monotonic()
+            while self._completions and now - self._completions[0] > self.THROUGHPUT_WINDOW:
+                self._completions.popleft()
+            return {
+                'queue_length': len(self._queue),
+                'active': self._active,
+                'max_concurrency': self.max_concurrency,
+                'rate_per_sec': self._bucket.rate,
+                'burst': self._bucket.capacity,
+                'admitted': self._admitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rate_limited': self._rate_limited,
+                'avg_queue_wait': self._wait_total / self._admitted if self._admitted else 0.0,
+                'max_queue_wait': self._wait_max,
+                'throughput_per_min': len(self._completions) * 60.0 / self.THROUGHPUT_WINDOW,
+            }
+
+
+class _GovernorSlot:
+    """LLMTrafficGovernor.slot 返回的上下文管理器"""
+
+    def __init__(self, governor: LLMTrafficGovernor, on_wait, timeout):
+        self.governor = governor
+        self.on_wait = on_wait
+        self.timeout = timeout
+        self.waited = 0.0
+
+    def __enter__(self):
+        self.waited = self.governor.acquire(self.on_wait, self.timeout)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.governor.release(success=exc_type is None)
+        return False
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> LLMTrafficGovernor:
+    """获取进程内共享的流量控制器，参数可通过环境变量配置"""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = LLMTrafficGovernor(
+                    rate_per_sec=float(os.environ.get("DEEPSEEK_RATE_LIMIT", "2")),
+                    burst=int(os.environ.get("DEEPSEEK_BURST", "4")),
+                    max_concurrency=int(os.environ.get("DEEPSEEK_MAX_CONCURRENCY", "4")),
+                )
+    return _governor
@@ -0,0 +1,264 @@
+import io
+import os
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections.abc import Mapping
+from typing import Dict, Any, List, Optional, Iterator
+
+import pandas as pd
+
+from utils.dtypes import frame_memory_bytes
+from utils.frame_registry import FrameHandle, get_frame_registry
+from utils.store import prune_upload_sources
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _iter_handles(value: Any, depth: int = 0) -> Iterator[FrameHandle]:
+    """找出会话状态值中引用的数据句柄（包括 DataProcessor 等对象属性中的句柄）"""
+    if depth > 2:
+        return
+    if isinstance(value, FrameHandle):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _iter_handles(item, depth + 1)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _iter_handles(item, depth + 1)
+    elif hasattr(value, "__dict__") and not isinstance(value, type):
+        for item in vars(value).values():
+            if isinstance(item, FrameHandle):
+                yield item
+
+
+def measure_value(value: Any, depth: int = 0) -> int:
+    """估算会话状态中一个值独占的内存（字节）
+
+    数据句柄指向的是各会话共享的数据，不计入这里，由 SessionResourceManager 单独统计。
+    """
+    if value is None or isinstance(value, FrameHandle):
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return frame_memory_bytes(value)
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, io.BytesIO):
+        return value.getbuffer().nbytes
+    if depth > 2:
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(measure_value(item, depth + 1) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(measure_value(item, depth + 1) for item in value.values())
+    if hasattr(value, "__dict__") and not isinstance(value, type):
+        return sys.getsizeof(value) + sum(measure_value(item, depth + 1) for item in vars(value).values())
+    return sys.getsizeof(value)
+
+
+class _SessionRecord:
+    """一个会话最近一次运行时的资源占用"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.last_active = time.time()
+        self.runs = 0
+        self.measured_at = 0.0
+        self.key_bytes: Dict[str, int] = {}
+        self.handles: "weakref.WeakSet[FrameHandle]" = weakref.WeakSet()
+        # 本会话的数据溢出写出的缓存文件，会话过期时删除
+        self.spill_paths: set = set()
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        handles = list(self.handles)
+        resident = [h for h in handles if not h.spilled]
+        private_bytes = sum(self.key_bytes.values())
+        shared_bytes = sum(h.nbytes for h in {h.fingerprint: h for h in resident}.values())
+        top_keys = sorted(self.key_bytes.items(), key=lambda item: item[1], reverse=True)[:5]
+        return {
+            'session_id': self.session_id,
+            'last_active': self.last_active,
+            'idle_sec': now - self.last_active,
+            'runs': self.runs,
+            'private_bytes': private_bytes,
+            'shared_bytes': shared_bytes,
+            'total_bytes': private_bytes + shared_bytes,
+            'frames': len(handles),
+            'spilled_frames': len(handles) - len(resident),
+            'top_keys': top_keys,
+        }
+
+
+class SessionResourceManager:
+    """会话资源管理
+
+    页面运行时记录会话状态中各键的内存占用和引用的数据句柄（深度统计较慢，同一会话
+    至多每 measure_interval 秒统计一次）；会话空闲超过 spill_after 秒后，其引用的大型数据
+    溢出到磁盘列式缓存（读取时自动重新加载），超过 expire_after 秒的会话记录被清除，
+    不再被其他会话引用的缓存文件随之删除；分析库中同样超过 expire_after 秒未再上传的数据源也一并清理。
+    """
+
+    def __init__(self, spill_dir: str, spill_after: float = 900, expire_after: float = 4 * 3600,
+                 spill_min_bytes: int = 256 * 1024, sweep_interval: float = 30, measure_interval: float = 10):
+        self.spill_dir = spill_dir
+        self.spill_after = spill_after
+        self.expire_after = expire_after
+        self.spill_min_bytes = spill_min_bytes
+        self.sweep_interval = sweep_interval
+        self.measure_interval = measure_interval
+        self._sessions: Dict[str, _SessionRecord] = {}
+        # 过期会话留下的缓存文件 -> 仍可能读取它的句柄（会话状态尚未释放时句柄仍然存活）
+        self._expired_spills: Dict[str, "weakref.WeakSet[FrameHandle]"] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def track(self, session_id: str, state: Mapping) -> Dict[str, Any]:
+        """记录会话本次运行的资源占用，并顺带清理其他空闲会话"""
+        now = time.time()
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                record = self._sessions[session_id] = _SessionRecord(session_id)
+            record.last_active = now
+            record.runs += 1
+            measure_due = now - record.measured_at >= self.measure_interval
+            if measure_due:
+                record.measured_at = now
+
+        if measure_due:
+            key_bytes = {}
+            handles = []
+            for key, value in list(state.items()):
+                key_bytes[str(key)] = measure_value(value)
+                handles.extend(_iter_handles(value))
+            with self._lock:
+                record.key_bytes = key_bytes
+                record.handles = weakref.WeakSet(handles)
+
+        with self._lock:
+            sweep_due = now - self._last_sweep >= self.sweep_interval
+            if sweep_due:
+                self._last_sweep = now
+
+        if sweep_due:
+            self.sweep(now)
+        return record.summary(now)
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        """溢出空闲会话的大型数据并清除过期会话记录"""
+        now = now or time.time()
+        spilled = expired = 0
+        with self._lock:
+            records = list(self._sessions.values())
+        for record in records:
+            idle = now - record.last_active
+            if idle >= self.expire_after:
+                with self._lock:
+                    self._sessions.pop(record.session_id, None)
+                expired += 1
+                with self._lock:
+                    for path in record.spill_paths:
+                        self._expired_spills.setdefault(path, weakref.WeakSet()).update(record.handles)
+                continue
+            if idle >= self.spill_after:
+                for handle in list(record.handles):
+                    if handle.nbytes >= self.spill_min_bytes and handle.spill(self.spill_dir):
+                        record.spill_paths.add(handle.spill_path)
+                        spilled += 1
+        return {'spilled': spilled, 'expired': expired, 'removed_files': self._remove_spill_files(),
+                'removed_uploads': prune_upload_sources(self.expire_after)}
+
+    def _remove_spill_files(self) -> int:
+        """删除过期会话留下、且已没有句柄可能读取的缓存文件
+
+        同一内容的缓存文件由各会话共用，仍被未过期的会话引用时保留；过期会话的状态尚未释放时
+        （句柄仍存活且处于溢出状态）也保留，留待之后的清理。
+        """
+        with self._lock:
+            in_use = set()
+            for record in self._sessions.values():
+                in_use.update(record.spill_paths)
+            removable = []
+            for path, handles in list(self._expired_spills.items()):
+                if path in in_use:
+                    del self._expired_spills[path]
+                elif not any(h.spilled and h.spill_path == path for h in list(handles)):
+                    del self._expired_spills[path]
+                    removable.append(path)
+        removed = 0
+        for path in removable:
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def top_sessions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """按内存占用从大到小列出会话"""
+        now = time.time()
+        with self._lock:
+            records = list(self._sessions.values())
+        summaries = [record.summary(now) for record in records]
+        summaries.sort(key=lambda item: item['total_bytes'], reverse=True)
+        return summaries[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        """全部会话的汇总统计"""
+        summaries = self.top_sessions(limit=len(self._sessions) or 1)
+        return {
+            'sessions': len(summaries),
+            'private_bytes': sum(s['private_bytes'] for s in summaries),
+            'spilled_frames': sum(s['spilled_frames'] for s in summaries),
+            'registry': get_frame_registry().stats(),
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager() -> SessionResourceManager:
+    """获取进程内共享的会话资源管理器"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = SessionResourceManager(
+                    spill_dir=os.environ.get("SESSION_SPILL_DIR", os.path.join(_PROJECT_DIR, ".cache", "spill")),
+                    spill_after=float(os.environ.get("SESSION_SPILL_AFTER_SEC", "900")),
+                    expire_after=float(os.environ.get("SESSION_EXPIRE_SEC", str(4 * 3600))),
+                    spill_min_bytes=int(os.environ.get("SESSION_SPILL_MIN_BYTES", str(256 * 1024))),
+                    measure_interval=float(os.environ.get("SESSION_MEASURE_INTERVAL_SEC", "10")),
+                )
+    return _manager
+
+
+def track_session(state) -> Dict[str, Any]:
+    """在页面脚本开头调用：确保会话ID存在并记录本会话的资源占用"""
+    if 'session_id' not in state:
+        state['session_id'] = uuid.uuid4().hex
+    return get_session_manager().track(state['session_id'], state)
+
+
+def process_rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（字节），无法获取时返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # 非Linux平台只能取得峰值；macOS上单位为字节，其余为KB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
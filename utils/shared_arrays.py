@@ -0,0 +1,74 @@
+"""进程间共享的numpy数组
+
+主进程把数组复制到 multiprocessing.shared_memory 共享内存块中，只把块名称、形状和类型
+（spec）传给进程池；工作进程按 spec 映射同一块内存，得到零复制的数组视图，不需要序列化数据。
+"""
+import sys
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# {数组名: (共享内存块名称, 形状, dtype字符串)}
+ArraySpec = Dict[str, Tuple[str, tuple, str]]
+
+
+class SharedArrays:
+    """一组复制到共享内存中的数组，由创建它的进程负责释放（close 或退出 with 语句）"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self._blocks: List[SharedMemory] = []
+        self.spec: ArraySpec = {}
+        try:
+            for key, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                if array.dtype.hasobject:
+                    raise ValueError(f"数组 {key} 含有Python对象，无法放入共享内存")
+                shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+                self._blocks.append(shm)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+                self.spec[key] = (shm.name, array.shape, array.dtype.str)
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def nbytes(self) -> int:
+        return sum(shm.size for shm in self._blocks)
+
+    def close(self):
+        """释放全部共享内存块"""
+        for shm in self._blocks:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_block(name: str) -> SharedMemory:
+    if sys.version_info >= (3, 13):
+        # 只映射不登记，释放由创建方负责
+        return SharedMemory(name=name, track=False)
+    return SharedMemory(name=name)
+
+
+def attach_arrays(spec: ArraySpec) -> Tuple[Dict[str, np.ndarray], List[SharedMemory]]:
+    """在工作进程中按 spec 映射共享数组
+
+    返回 (数组字典, 共享内存块列表)；调用方需要在使用数组期间一直持有这些块。
+    """
+    arrays: Dict[str, np.ndarray] = {}
+    blocks: List[SharedMemory] = []
+    for key, (name, shape, dtype) in spec.items():
+        shm = _open_block(name)
+        blocks.append(shm)
+        arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return arrays, blocks
@@ -0,0 +1,135 @@
+import threading
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.cross_rates import CrossRateMatrix
+from utils.data_processor import load_bigmac_panel
+
+DateLike = Union[str, pd.Timestamp, np.datetime64]
+
+
+class ValuationSnapshotIndex:
+    """按发布日期预先索引的巨无霸指数面板，用于查询任一日期的各国估值横截面
+
+    面板按 (date, iso_a3) 排序后，每个发布日期对应一段连续的行，查询时只需二分查找日期、
+    取出该段的数组切片做向量化计算，不做任何布尔筛选。
+    """
+
+    def __init__(self, panel: pd.DataFrame):
+        panel = panel.sort_values(['date', 'iso_a3']).reset_index(drop=True)
+        dates = panel['date'].to_numpy(dtype='datetime64[ns]')
+        self.dates = np.unique(dates)
+        # 每个日期在排序后面板中的起止行
+        self._starts = np.searchsorted(dates, self.dates, side='left')
+        self._ends = np.searchsorted(dates, self.dates, side='right')
+
+        self.iso_a3 = panel['iso_a3'].astype(str).to_numpy()
+        self.name = panel['name'].astype(str).to_numpy()
+        self.currency_code = panel['currency_code'].astype(str).to_numpy()
+        self.local_price = panel['local_price'].to_numpy(dtype=np.float64)
+        self.dollar_ex = panel['dollar_ex'].to_numpy(dtype=np.float64)
+        self.dollar_price = panel['dollar_price'].to_numpy(dtype=np.float64)
+        adj_price = panel['adj_price'] if 'adj_price' in panel.columns else pd.Series(np.nan, index=panel.index)
+        self.adj_price = adj_price.to_numpy(dtype=np.float64)
+
+        self._cache: Dict[tuple, Dict[str, np.ndarray]] = {}
+        self._matrices: Dict[int, CrossRateMatrix] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def release_dates(self) -> List[pd.Timestamp]:
+        """全部发布日期"""
+        return [pd.Timestamp(d) for d in self.dates]
+
+    def nearest_date_index(self, date: DateLike) -> int:
+        """距离给定日期最近的发布日期下标"""
+        target = np.datetime64(pd.Timestamp(date), 'ns')
+        pos = int(np.searchsorted(self.dates, target))
+        if pos == 0:
+            return 0
+        if pos >= len(self.dates):
+            return len(self.dates) - 1
+        # 与前后两个发布日期比较，取更近的一个
+        return pos if self.dates[pos] - target < target - self.dates[pos - 1] else pos - 1
+
+    def base_options(self, date: DateLike) -> List[str]:
+        """该日期可作为基准的货币代码"""
+        i = self.nearest_date_index(date)
+        return sorted(set(self.currency_code[self._starts[i]:self._ends[i]]))
+
+    def cross_rate_matrix(self, date: DateLike) -> CrossRateMatrix:
+        """最近发布日期的货币交叉估值矩阵（每个日期只计算一次）"""
+        i = self.nearest_date_index(date)
+        matrix = self._matrices.get(i)
+        if matrix is None:
+            rows = slice(self._starts[i], self._ends[i])
+            matrix = CrossRateMatrix(self.dates[i], self.currency_code[rows], self.local_price[rows],
+                                     self.dollar_ex[rows], self.adj_price[rows])
+            with self._lock:
+                self._matrices[i] = matrix
+        return matrix
+
+    def query_arrays(self, date: DateLike, base: str = 'USD') -> Dict[str, np.ndarray]:
+        """返回最近发布日期的横截面数组（按原始估值从高到低排序）
+
+        估值以百分比表示：原始估值 = 本国美元价格 / 基准国美元价格 - 1；
+        GDP调整估值 = (本国美元价格/调整价格) / (基准国美元价格/基准国调整价格) - 1。
+        """
+        i = self.nearest_date_index(date)
+        key = (i, base)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        rows = slice(self._starts[i], self._ends[i])
+        currency_code = self.currency_code[rows]
+        dollar_price = self.dollar_price[rows]
+
+        # 任一基准货币的估值都是交叉估值矩阵中的一列
+        matrix = self.cross_rate_matrix(self.dates[i])
+        b = matrix.position(base)
+        raw_valuation = matrix.valuation[:, b] * 100
+        adjusted_valuation = matrix.adjusted_valuation[:, b] * 100
+
+        order = np.argsort(-raw_valuation, kind='stable')
+        result = {
+            'date': self.dates[i],
+            'iso_a3': self.iso_a3[rows][order],
+            'name': self.name[rows][order],
+            'currency_code': currency_code[order],
+            'local_price': self.local_price[rows][order],
+            'dollar_ex': self.dollar_ex[rows][order],
+            'dollar_price': dollar_price[order],
+            'raw_valuation': raw_valuation[order],
+            'adjusted_valuation': adjusted_valuation[order],
+            'rank': np.arange(1, len(order) + 1),
+            'adjusted_rank': _rank_desc(adjusted_valuation[order]),
+        }
+        with self._lock:
+            self._cache[key] = result
+        return result
+
+    def query(self, date: DateLike, base: str = 'USD') -> pd.DataFrame:
+        """返回最近发布日期各国相对基准货币的原始与GDP调整估值，按原始估值排名"""
+        arrays = self.query_arrays(date, base)
+        frame = pd.DataFrame({k: v for k, v in arrays.items() if k != 'date'})
+        frame.insert(0, 'date', pd.Timestamp(arrays['date']))
+        return frame
+
+
+def _rank_desc(values: np.ndarray) -> np.ndarray:
+    """从高到低排名（1为最高），缺失值排名为0"""
+    ranks = np.zeros(len(values), dtype=np.int64)
+    valid = np.flatnonzero(~np.isnan(values))
+    ranks[valid[np.argsort(-values[valid], kind='stable')]] = np.arange(1, len(valid) + 1)
+    return ranks
+
+
+def get_snapshot_index(panel_path: Optional[str] = None) -> ValuationSnapshotIndex:
+    """获取基于内置面板数据的共享快照索引（随内置数据热更新，见 utils.data_registry）"""
+    if panel_path is not None:
+        return ValuationSnapshotIndex(load_bigmac_panel(panel_path))
+    from utils.data_registry import get_data_registry
+    return get_data_registry().current.snapshot_index
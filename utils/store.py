@@ -0,0 +1,371 @@
+"""嵌入式分析数据库
+
+把巨无霸面板和汇率数据写入进程本地的嵌入式数据库（安装了 duckdb 时使用DuckDB，否则使用
+标准库 sqlite3），按 (source, iso_a3, date) 和 (source, pair, quote, date) 建立索引。
+内置数据只在文件变化时导入一次，上传的数据按内容指纹各自保存为一个数据源（长时间未再上传的
+数据源随会话过期一起清理，见 prune_uploads）。页面按需查询
+时间区间、按日期做 as-of 汇率匹配或分组统计，过滤和聚合都在数据库中完成，只取回需要展示的行。
+
+数据库文件位置由环境变量 BIGMAC_STORE_PATH 指定，默认为 .cache/bigmac.duckdb（或 .sqlite）。
+DuckDB文件已被其他进程占用时改用同名的 .sqlite 文件；分析库是可选功能，不可用时不影响数据加载。
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from utils.exporter import analysis_fingerprint
+from utils.panel import PANEL_METRICS
+from utils.tracing import span
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 内置数据使用的数据源名称
+BUILTIN_SOURCE = 'builtin'
+
+# 上传数据的数据源名称前缀（upload-<内容指纹>），这些数据源会按时间和数量清理
+UPLOAD_SOURCE_PREFIX = 'upload-'
+
+BIGMAC_TEXT_COLUMNS = ('iso_a3', 'currency_code', 'name')
+BIGMAC_COLUMNS = ('date',) + BIGMAC_TEXT_COLUMNS + PANEL_METRICS
+FX_COLUMNS = ('date', 'pair', 'quote', 'rate')
+
+# 允许的分组维度与统计函数（拼接SQL前按白名单校验）
+GROUP_EXPRESSIONS = {
+    'iso_a3': 'iso_a3',
+    'date': 'date',
+    'year': 'substr(date, 1, 4)',
+}
+AGGREGATES = ('avg', 'min', 'max', 'sum', 'count')
+
+
+def _iso_date(value) -> Optional[str]:
+    return None if value is None else pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def fx_matrix_to_long(fx_matrix: pd.DataFrame) -> pd.DataFrame:
+    """把汇率宽表（{货币}_{报价类型} 列）转为 date / pair / quote / rate 长表"""
+    long = fx_matrix.melt(id_vars='date', var_name='column', value_name='rate').dropna(subset=['rate'])
+    parts = long['column'].str.rsplit('_', n=1, expand=True)
+    return pd.DataFrame({
+        'date': pd.to_datetime(long['date']).dt.strftime('%Y-%m-%d'),
+        'pair': parts[0],
+        'quote': parts[1],
+        'rate': long['rate'].astype('float64'),
+    })
+
+
+class AnalyticsStore:
+    """巨无霸面板与汇率数据的嵌入式分析库
+
+    每个线程使用独立的连接（DuckDB为同一数据库的游标，SQLite为独立连接）；写入操作串行执行。
+    日期统一保存为 YYYY-MM-DD 文本，读取时转换为日期类型。
+    """
+
+    def __init__(self, path: Optional[str] = None, engine: Optional[str] = None):
+        auto = engine is None
+        duckdb = _import_duckdb() if engine in (None, 'duckdb') else None
+        if auto:
+            engine = 'duckdb' if duckdb is not None else 'sqlite'
+        if engine not in ('duckdb', 'sqlite'):
+            raise ValueError(f"不支持的数据库引擎: {engine}")
+        if engine == 'duckdb' and duckdb is None:
+            raise ValueError("未安装 duckdb，无法使用DuckDB引擎")
+        self.engine = engine
+        suffix = '.duckdb' if engine == 'duckdb' else '.sqlite'
+        self.path = path or os.environ.get("BIGMAC_STORE_PATH",
+                                           os.path.join(_PROJECT_DIR, ".cache", f"bigmac{suffix}"))
+        self._make_parent_dir()
+
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._database = None
+        if engine == 'duckdb':
+            try:
+                self._database = duckdb.connect(self.path)
+            except duckdb.Error as e:
+                if not auto:
+                    raise ValueError(f"无法打开分析库 {self.path}: {e}")
+                # DuckDB文件同一时间只能由一个进程打开（如页面服务运行时执行命令行流程），
+                # 此时改用允许多进程访问的SQLite文件
+                self.engine = 'sqlite'
+                self.path = self.path if self.path == ':memory:' else f"{os.path.splitext(self.path)[0]}.sqlite"
+                self._make_parent_dir()
+        self._create_schema()
+
+    def _make_parent_dir(self):
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.engine == 'duckdb':
+                conn = self._database.cursor()
+            else:
+                # 其他进程写入时最多等待30秒，而不是立即报 database is locked
+                conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """串行执行的写事务，出错时回滚"""
+        with self._write_lock:
+            conn = self._connection()
+            if self.engine == 'duckdb':
+                conn.begin()
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _create_schema(self):
+        text_type = 'VARCHAR' if self.engine == 'duckdb' else 'TEXT'
+        real_type = 'DOUBLE' if self.engine == 'duckdb' else 'REAL'
+        bigmac_columns = ', '.join(
+            [f"source {text_type}", f"date {text_type}"]
+            + [f"{col} {text_type}" for col in BIGMAC_TEXT_COLUMNS]
+            + [f"{col} {real_type}" for col in PANEL_METRICS])
+        statements = [
+            f"CREATE TABLE IF NOT EXISTS bigmac ({bigmac_columns})",
+            f"CREATE TABLE IF NOT EXISTS fx_rates (source {text_type}, date {text_type}, pair {text_type}, "
+            f"quote {text_type}, rate {real_type})",
+            f"CREATE TABLE IF NOT EXISTS datasets (source {text_type}, kind {text_type}, "
+            f"fingerprint {text_type}, rows INTEGER, loaded_at {real_type})",
+            "CREATE INDEX IF NOT EXISTS idx_bigmac_iso_date ON bigmac (source, iso_a3, date)",
+            "CREATE INDEX IF NOT EXISTS idx_fx_pair_date ON fx_rates (source, pair, quote, date)",
+        ]
+        with self._transaction() as conn:
+            for statement in statements:
+                conn.execute(statement)
+
+    def _query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        conn = self._connection()
+        if self.engine == 'duckdb':
+            frame = conn.execute(sql, list(params)).df()
+        else:
+            frame = pd.read_sql_query(sql, conn, params=list(params))
+        if 'date' in frame.columns:
+            frame['date'] = pd.to_datetime(frame['date'])
+        return frame
+
+    def _insert(self, table: str, frame: pd.DataFrame):
+        conn = self._connection()
+        if self.engine == 'duckdb':
+            conn.register('_incoming', frame)
+            try:
+                conn.execute(f"INSERT INTO {table} ({', '.join(frame.columns)}) SELECT * FROM _incoming")
+            finally:
+                conn.unregister('_incoming')
+        else:
+            placeholders = ', '.join('?' * len(frame.columns))
+            rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+            conn.executemany(f"INSERT INTO {table} ({', '.join(frame.columns)}) VALUES ({placeholders})", rows)
+
+    def dataset_fingerprint(self, source: str, kind: str) -> Optional[str]:
+        """已导入数据源的指纹，未导入时返回None"""
+        result = self._query("SELECT fingerprint FROM datasets WHERE source = ? AND kind = ?", (source, kind))
+        return None if result.empty else str(result['fingerprint'].iloc[0])
+
+    def _touch(self, source: str, kind: str):
+        """内容相同的数据再次导入时刷新导入时间，避免仍在使用的上传数据被清理"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE datasets SET loaded_at = ? WHERE source = ? AND kind = ?", (time.time(), source, kind))
+
+    def _replace(self, table: str, kind: str, source: str, frame: pd.DataFrame, fingerprint: str):
+        with span(f"store.load.{table}", rows=len(frame)), self._transaction() as conn:
+            conn.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+            conn.execute("DELETE FROM datasets WHERE source = ? AND kind = ?", (source, kind))
+            self._insert(table, frame.assign(source=source)[['source'] + list(frame.columns)])
+            conn.execute("INSERT INTO datasets (source, kind, fingerprint, rows, loaded_at) VALUES (?, ?, ?, ?, ?)",
+                         (source, kind, fingerprint, len(frame), time.time()))
+
+    def load_bigmac(self, panel: pd.DataFrame, source: str, fingerprint: Optional[str] = None) -> bool:
+        """导入长表形式的巨无霸面板（替换同名数据源），指纹未变化时跳过并返回False"""
+        fingerprint = fingerprint or analysis_fingerprint(panel)
+        if self.dataset_fingerprint(source, 'bigmac') == fingerprint:
+            if source.startswith(UPLOAD_SOURCE_PREFIX):
+                self._touch(source, 'bigmac')
+            return False
+        rows = panel.reindex(columns=list(BIGMAC_COLUMNS))
+        rows['date'] = pd.to_datetime(rows['date']).dt.strftime('%Y-%m-%d')
+        for col in BIGMAC_TEXT_COLUMNS:
+            rows[col] = [None if pd.isna(value) else str(value) for value in rows[col]]
+        for col in PANEL_METRICS:
+            rows[col] = pd.to_numeric(rows[col], errors='coerce').astype('float64')
+        self._replace('bigmac', 'bigmac', source, rows, fingerprint)
+        return True
+
+    def load_fx(self, fx_matrix: pd.DataFrame, source: str, fingerprint: Optional[str] = None) -> bool:
+        """导入汇率宽表（替换同名数据源），指纹未变化时跳过并返回False"""
+        fingerprint = fingerprint or analysis_fingerprint(fx_matrix)
+        if self.dataset_fingerprint(source, 'fx') == fingerprint:
+            if source.startswith(UPLOAD_SOURCE_PREFIX):
+                self._touch(source, 'fx')
+            return False
+        self._replace('fx_rates', 'fx', source, fx_matrix_to_long(fx_matrix)[list(FX_COLUMNS)], fingerprint)
+        return True
+
+    def ensure_builtin(self):
+        """内置数据文件变化（或从未导入）时重新导入"""
+        from utils.data_processor import BIGMAC_DATA_PATH, EXCHANGE_RATE_DATA_PATH, DataProcessor, load_bigmac_panel
+
+        bigmac_fingerprint = _file_fingerprint(BIGMAC_DATA_PATH)
+        if self.dataset_fingerprint(BUILTIN_SOURCE, 'bigmac') != bigmac_fingerprint:
+            self.load_bigmac(load_bigmac_panel(), BUILTIN_SOURCE, bigmac_fingerprint)
+        fx_fingerprint = _file_fingerprint(EXCHANGE_RATE_DATA_PATH)
+        if fx_fingerprint and self.dataset_fingerprint(BUILTIN_SOURCE, 'fx') != fx_fingerprint:
+            try:
+                fx_matrix = DataProcessor().load_builtin_fx_matrix()
+            except ValueError:
+                # 汇率文件无法解析时只提供面板数据
+                return
+            self.load_fx(fx_matrix, BUILTIN_SOURCE, fx_fingerprint)
+
+    def prune_uploads(self, max_age: float, max_sources: int) -> int:
+        """删除导入时间超过 max_age 秒的上传数据源，并只保留最近导入的 max_sources 个，返回删除的数量"""
+        datasets = self._query("SELECT source, kind, loaded_at FROM datasets WHERE source LIKE ? "
+                               "ORDER BY loaded_at DESC", (f"{UPLOAD_SOURCE_PREFIX}%",))
+        cutoff = time.time() - max_age
+        stale = [(row.source, row.kind) for i, row in enumerate(datasets.itertuples(index=False))
+                 if row.loaded_at < cutoff or i >= max_sources]
+        if not stale:
+            return 0
+        with span("store.prune_uploads", rows=len(stale)), self._transaction() as conn:
+            for source, kind in stale:
+                conn.execute(f"DELETE FROM {'bigmac' if kind == 'bigmac' else 'fx_rates'} WHERE source = ?", (source,))
+                conn.execute("DELETE FROM datasets WHERE source = ? AND kind = ?", (source, kind))
+        return len(stale)
+
+    def bigmac_range(self, iso_a3: Optional[Sequence[str]] = None, start=None, end=None,
+                     columns: Optional[Sequence[str]] = None, source: str = BUILTIN_SOURCE) -> pd.DataFrame:
+        """按国家和日期区间查询面板数据（按日期、国家排序）"""
+        columns = list(columns or BIGMAC_COLUMNS)
+        unknown = [col for col in columns if col not in BIGMAC_COLUMNS]
+        if unknown:
+            raise ValueError(f"未知的列: {', '.join(unknown)}")
+        where, params = self._bigmac_filters(iso_a3, start, end, source)
+        sql = f"SELECT {', '.join(columns)} FROM bigmac WHERE {where} ORDER BY date, iso_a3"
+        with span("store.query.bigmac_range"):
+            return self._query(sql, params)
+
+    def asof_join(self, iso_a3: str, pair: str = 'USD', quote: str = 'mid', start=None, end=None,
+                  source: str = BUILTIN_SOURCE, fx_source: str = BUILTIN_SOURCE) -> pd.DataFrame:
+        """某国的巨无霸数据，附上同期美国价格和每个发布日期当天或之前最近一个交易日的牌价（actual_rate）"""
+        where, params = self._bigmac_filters([iso_a3], start, end, source, alias='b')
+        sql = f"""
+            SELECT b.date, b.iso_a3, b.currency_code, b.name, b.local_price, b.dollar_ex, b.dollar_price,
+                   u.local_price AS us_price,
+                   (SELECT f.rate FROM fx_rates f
+                     WHERE f.source = ? AND f.pair = ? AND f.quote = ? AND f.date <= b.date
+                     ORDER BY f.date DESC LIMIT 1) AS actual_rate
+            FROM bigmac b
+            JOIN bigmac u ON u.source = b.source AND u.iso_a3 = 'USA' AND u.date = b.date
+            WHERE {where}
+            ORDER BY b.date
+        """
+        with span("store.query.asof_join"):
+            return self._query(sql, [fx_source, pair, quote] + params)
+
+    def aggregate(self, metric: str, by: str = 'iso_a3', how: str = 'avg',
+                  iso_a3: Optional[Sequence[str]] = None, start=None, end=None,
+                  source: str = BUILTIN_SOURCE) -> pd.DataFrame:
+        """按国家、发布日期或年份分组统计某一指标，返回 分组 / value / observations 三列"""
+        if metric not in PANEL_METRICS:
+            raise ValueError(f"未知的指标: {metric}")
+        if by not in GROUP_EXPRESSIONS:
+            raise ValueError(f"不支持的分组维度: {by}")
+        if how not in AGGREGATES:
+            raise ValueError(f"不支持的统计方法: {how}")
+        where, params = self._bigmac_filters(iso_a3, start, end, source)
+        group = GROUP_EXPRESSIONS[by]
+        sql = (f"SELECT {group} AS {by}, {how}({metric}) AS value, count({metric}) AS observations "
+               f"FROM bigmac WHERE {where} GROUP BY {group} ORDER BY {group}")
+        with span("store.query.aggregate"):
+            return self._query(sql, params)
+
+    @staticmethod
+    def _bigmac_filters(iso_a3, start, end, source: str, alias: str = ''):
+        prefix = f"{alias}." if alias else ''
+        where = [f"{prefix}source = ?"]
+        params: List[Any] = [source]
+        if iso_a3:
+            codes = list(iso_a3)
+            where.append(f"{prefix}iso_a3 IN ({', '.join('?' * len(codes))})")
+            params.extend(codes)
+        if start is not None:
+            where.append(f"{prefix}date >= ?")
+            params.append(_iso_date(start))
+        if end is not None:
+            where.append(f"{prefix}date <= ?")
+            params.append(_iso_date(end))
+        return ' AND '.join(where), params
+
+    def stats(self) -> Dict[str, Any]:
+        """各数据源的行数与导入时间"""
+        datasets = self._query("SELECT source, kind, rows, loaded_at FROM datasets ORDER BY source, kind")
+        return {'engine': self.engine, 'path': self.path, 'datasets': datasets.to_dict('records')}
+
+
+def _import_duckdb():
+    """duckdb 为可选依赖，未安装时返回None"""
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb
+
+
+def _file_fingerprint(path: str) -> str:
+    """按文件大小和修改时间判断内置数据是否变化"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ''
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def prune_upload_sources(max_age: float, max_sources: Optional[int] = None) -> int:
+    """清理本进程已打开的分析库中过期的上传数据源（分析库尚未打开或不可用时不做任何事）
+
+    max_sources 默认取环境变量 BIGMAC_STORE_MAX_UPLOADS（默认50）。
+    """
+    store = _store
+    if store is None:
+        return 0
+    if max_sources is None:
+        max_sources = int(os.environ.get("BIGMAC_STORE_MAX_UPLOADS", 50))
+    try:
+        return store.prune_uploads(max_age, max_sources)
+    except Exception:
+        return 0
+
+
+def get_store() -> AnalyticsStore:
+    """获取进程共享的分析库（首次调用时创建并导入内置数据）
+
+    数据库文件无法打开或导入失败时抛出 ValueError，调用方应把分析库视为可选功能。
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    store = AnalyticsStore()
+                    store.ensure_builtin()
+                except Exception as e:
+                    raise ValueError(f"分析库不可用: {e}")
+                _store = store
+    return _store
@@ -0,0 +1,126 @@
+"""多分辨率预聚合图表数据
+
+对一条按日期排列的序列预先计算日、周、月、季四级聚合（每个区间的最小值、最大值、均值、
+期末值和观测数）。绘图时按所选时间范围和图表宽度，选取仍能达到约每像素一个点的最粗一级，
+用均值画线、最小/最大值画区间带，数据点数量与时间跨度无关，同时不丢失极值。
+
+同一份数据（按内容指纹）的金字塔在进程内只计算一次，各会话共享。
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 聚合级别（由细到粗）：级别 -> (pandas周期频率, 显示名称)
+LEVELS = OrderedDict([
+    ('D', ('D', '日')),
+    ('W', ('W', '周')),
+    ('M', ('M', '月')),
+    ('Q', ('Q', '季')),
+])
+
+TILE_COLUMNS = ['date', 'min', 'max', 'mean', 'last', 'count']
+
+# 默认按约800像素宽的图表选择级别
+DEFAULT_PIXELS = 800
+
+
+class SeriesPyramid:
+    """一条序列的日/周/月/季聚合金字塔"""
+
+    def __init__(self, series: pd.Series):
+        series = series.dropna()
+        series = series[~series.index.duplicated(keep='last')].sort_index().astype(np.float64)
+        self.levels: Dict[str, pd.DataFrame] = {}
+        self._dates: Dict[str, np.ndarray] = {}
+        for level, (freq, _) in LEVELS.items():
+            periods = series.index.to_period(freq)
+            grouped = series.groupby(periods)
+            tile = pd.DataFrame({
+                'min': grouped.min(),
+                'max': grouped.max(),
+                'mean': grouped.mean(),
+                'last': grouped.last(),
+                'count': grouped.count(),
+            })
+            # 以区间起始日期作为横坐标
+            tile.insert(0, 'date', tile.index.to_timestamp(how='start'))
+            tile = tile.reset_index(drop=True)
+            self.levels[level] = tile
+            self._dates[level] = tile['date'].to_numpy(dtype='datetime64[ns]')
+
+    @property
+    def start(self) -> Optional[pd.Timestamp]:
+        dates = self._dates['D']
+        return pd.Timestamp(dates[0]) if len(dates) else None
+
+    @property
+    def end(self) -> Optional[pd.Timestamp]:
+        dates = self._dates['D']
+        return pd.Timestamp(dates[-1]) if len(dates) else None
+
+    def _bounds(self, level: str, start, end) -> Tuple[int, int]:
+        dates = self._dates[level]
+        lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start), 'ns'), side='left'))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end), 'ns'), side='right'))
+        return lo, hi
+
+    def choose_level(self, start=None, end=None, pixels: int = DEFAULT_PIXELS) -> str:
+        """范围内点数不少于像素数的最粗级别；日度数据也不足时返回日级"""
+        for level in reversed(LEVELS):
+            lo, hi = self._bounds(level, start, end)
+            if hi - lo >= pixels:
+                return level
+        return 'D'
+
+    def query(self, start=None, end=None, pixels: int = DEFAULT_PIXELS) -> Tuple[str, pd.DataFrame]:
+        """返回 (所选级别, 范围内的聚合数据)，数据列为 TILE_COLUMNS"""
+        level = self.choose_level(start, end, pixels)
+        lo, hi = self._bounds(level, start, end)
+        return level, self.levels[level].iloc[lo:hi]
+
+
+_MAX_PYRAMIDS = 32
+_pyramids: "OrderedDict[tuple, SeriesPyramid]" = OrderedDict()
+_pyramids_lock = threading.Lock()
+
+
+def get_pyramid(fingerprint: str, column: str, series_factory: Callable[[], pd.Series]) -> SeriesPyramid:
+    """按 (数据指纹, 列名) 获取共享的聚合金字塔，未命中时调用 series_factory 取得序列并计算"""
+    key = (fingerprint, column)
+    with _pyramids_lock:
+        pyramid = _pyramids.get(key)
+        if pyramid is not None:
+            _pyramids.move_to_end(key)
+            return pyramid
+    pyramid = SeriesPyramid(series_factory())
+    with _pyramids_lock:
+        _pyramids[key] = pyramid
+        while len(_pyramids) > _MAX_PYRAMIDS:
+            _pyramids.popitem(last=False)
+    return pyramid
+
+
+def frame_pyramid(handle, column: str, date_column: str = 'date') -> SeriesPyramid:
+    """数据框句柄（FrameHandle）中某一列的聚合金字塔"""
+    def _series() -> pd.Series:
+        data = handle.df
+        return pd.Series(data[column].to_numpy(), index=pd.DatetimeIndex(data[date_column]))
+    return get_pyramid(handle.fingerprint, column, _series)
+
+
+def tile_traces(level: str, tile: pd.DataFrame, name: str, color: str, fill_color: str) -> List:
+    """把聚合数据转换为plotly轨迹：日级为折线，更粗的级别为均值折线加最小/最大值区间带"""
+    import plotly.graph_objects as go
+
+    if level == 'D':
+        return [go.Scatter(x=tile['date'], y=tile['mean'], name=name, line=dict(color=color, width=2))]
+    label = LEVELS[level][1]
+    return [
+        go.Scatter(x=tile['date'], y=tile['max'], line=dict(width=0), hoverinfo='skip', showlegend=False),
+        go.Scatter(x=tile['date'], y=tile['min'], line=dict(width=0), fill='tonexty', fillcolor=fill_color,
+                   name=f"{name}（{label}内区间）", hoverinfo='skip'),
+        go.Scatter(x=tile['date'], y=tile['mean'], name=f"{name}（{label}均值）", line=dict(color=color, width=2)),
+    ]
@@ -0,0 +1,318 @@
+"""轻量级阶段耗时追踪
+
+用 span() 上下文管理器或 traced() 装饰器标记热点阶段（读取Excel、merge_asof、图表序列化、
+DeepSeek调用等），记录耗时和处理的行数：
+- 每次页面运行的阶段明细保存在当前线程中，开启调试开关（环境变量 BIGMAC_DEBUG=1 或 ?debug=1）
+  时由 render_timing_panel 在页面底部展示；
+- 所有阶段的耗时汇总为直方图，可按Prometheus文本格式导出：设置 BIGMAC_METRICS_PORT 启动本地
+  /metrics 端点，或设置 BIGMAC_METRICS_FILE 在每次页面运行结束时写入文件。
+"""
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Callable, Iterator
+
+# 耗时直方图的分桶上限（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "bigmac_stage"
+
+
+class Span:
+    """一次阶段执行记录"""
+
+    __slots__ = ("name", "start", "duration", "rows", "depth", "error")
+
+    def __init__(self, name: str, depth: int = 0):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.rows: Optional[int] = None
+        self.depth = depth
+        self.error = False
+
+
+class _StageStats:
+    """单个阶段的累计直方图"""
+
+    __slots__ = ("bucket_counts", "count", "total", "rows", "errors")
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+        self.errors = 0
+
+    def observe(self, span: Span):
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if span.duration <= bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.total += span.duration
+        self.rows += span.rows or 0
+        self.errors += int(span.error)
+
+
+class Tracer:
+    """阶段耗时记录器：进程级直方图 + 线程内的本次运行明细"""
+
+    def __init__(self):
+        self._stats: Dict[str, _StageStats] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _run_spans(self) -> Optional[List[Span]]:
+        return getattr(self._local, "spans", None)
+
+    def begin_run(self):
+        """开始记录当前线程的一次运行（页面脚本开头调用）"""
+        self._local.spans = []
+        self._local.depth = 0
+
+    def end_run(self) -> List[Span]:
+        """结束当前线程的运行记录并返回其中的阶段明细"""
+        spans = self._run_spans() or []
+        self._local.spans = None
+        return spans
+
+    @contextmanager
+    def span(self, name: str, rows: Optional[int] = None) -> Iterator[Span]:
+        """记录一个阶段；可在代码块内设置 span.rows 记录处理的行数"""
+        depth = getattr(self._local, "depth", 0)
+        current = Span(name, depth)
+        current.rows = rows
+        self._local.depth = depth + 1
+        try:
+            yield current
+        except BaseException:
+            current.error = True
+            raise
+        finally:
+            current.duration = time.perf_counter() - current.start
+            self._local.depth = depth
+            self._record(current)
+
+    def _record(self, span: Span):
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = _StageStats()
+            stats.observe(span)
+        spans = self._run_spans()
+        if spans is not None:
+            spans.append(span)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段的累计次数、总耗时、平均耗时和行数"""
+        with self._lock:
+            return {
+                name: {
+                    'count': s.count,
+                    'total_sec': s.total,
+                    'avg_sec': s.total / s.count if s.count else 0.0,
+                    'rows': s.rows,
+                    'errors': s.errors,
+                }
+                for name, s in self._stats.items()
+            }
+
+    def render_prometheus(self) -> str:
+        """以Prometheus文本格式输出各阶段的耗时直方图和行数计数"""
+        lines = [
+            f"# HELP {METRIC_PREFIX}_duration_seconds 各阶段耗时",
+            f"# TYPE {METRIC_PREFIX}_duration_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted((name, s.bucket_counts[:], s.count, s.total, s.rows, s.errors)
+                           for name, s in self._stats.items())
+        for name, buckets, count, total, _, _ in items:
+            label = _escape_label(name)
+            cumulative = 0
+            for bound, n in zip(DURATION_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'{METRIC_PREFIX}_duration_seconds_bucket{{stage="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}_duration_seconds_bucket{{stage="{label}",le="+Inf"}} {count}')
+            lines.append(f'{METRIC_PREFIX}_duration_seconds_sum{{stage="{label}"}} {total:.6f}')
+            lines.append(f'{METRIC_PREFIX}_duration_seconds_count{{stage="{label}"}} {count}')
+        lines.append(f"# HELP {METRIC_PREFIX}_rows_total 各阶段处理的数据行数")
+        lines.append(f"# TYPE {METRIC_PREFIX}_rows_total counter")
+        for name, _, _, _, rows, _ in items:
+            lines.append(f'{METRIC_PREFIX}_rows_total{{stage="{_escape_label(name)}"}} {rows}')
+        lines.append(f"# HELP {METRIC_PREFIX}_errors_total 各阶段抛出异常的次数")
+        lines.append(f"# TYPE {METRIC_PREFIX}_errors_total counter")
+        for name, _, _, _, _, errors in items:
+            lines.append(f'{METRIC_PREFIX}_errors_total{{stage="{_escape_label(name)}"}} {errors}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """把Prometheus文本写入文件（原子替换，供 node_exporter textfile 采集）"""
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _count_rows(value: Any) -> Optional[int]:
+    """返回值为 DataFrame / Series / ndarray 时取其行数，其他对象（如Streamlit元素）返回None
+
+    不能按 shape / __len__ 属性判断：DeltaGenerator 对任意属性名都返回包装函数。
+    """
+    try:
+        import numpy as np
+        import pandas as pd
+        if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+            return len(value)
+    except Exception:
+        # 行数只是附加信息，任何失败都不影响被追踪的函数
+        pass
+    return None
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """获取进程内共享的追踪器"""
+    return _tracer
+
+
+def span(name: str, rows: Optional[int] = None):
+    """记录一个阶段的耗时（上下文管理器）"""
+    return _tracer.span(name, rows)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """装饰器：记录函数耗时，返回数据框时同时记录行数"""
+    def decorator(fn):
+        stage = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _tracer.span(stage) as current:
+                result = fn(*args, **kwargs)
+                current.rows = _count_rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = _tracer.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """在后台线程启动 /metrics 端点（进程内只启动一次）"""
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+            _metrics_server = server
+    return _metrics_server
+
+
+def query_param(name: str) -> Optional[str]:
+    """读取页面URL查询参数（兼容旧版本Streamlit），不在页面中运行时返回None"""
+    try:
+        import streamlit as st
+        if hasattr(st, "query_params"):
+            return st.query_params.get(name)
+        values = st.experimental_get_query_params().get(name)
+        return values[0] if values else None
+    except Exception:
+        return None
+
+
+def admin_authorized() -> bool:
+    """本次页面请求带有管理员令牌：需设置环境变量 BIGMAC_ADMIN_TOKEN，并以 ?token=<令牌> 访问"""
+    admin_token = os.environ.get("BIGMAC_ADMIN_TOKEN")
+    return bool(admin_token) and query_param("token") == admin_token
+
+
+def debug_enabled() -> bool:
+    """调试开关：环境变量 BIGMAC_DEBUG 或页面查询参数 debug 为真值时开启"""
+    truthy = ("1", "true", "yes", "on")
+    return (os.environ.get("BIGMAC_DEBUG", "").lower() in truthy
+            or (query_param("debug") or "").lower() in truthy)
+
+
+def begin_page_trace():
+    """页面脚本开头调用：开始记录本次运行，并按环境变量启动指标端点"""
+    port = os.environ.get("BIGMAC_METRICS_PORT")
+    if port:
+        try:
+            start_metrics_server(int(port))
+        except OSError:
+            # 端口被占用（如多个进程）时不影响页面运行
+            pass
+    _tracer.begin_run()
+
+
+def finish_page_trace(st=None) -> List[Span]:
+    """页面脚本末尾调用：结束本次记录，按环境变量写出指标文件；
+    传入 st 且开启调试开关时在页面底部展示耗时面板。返回本次运行的阶段明细。
+    """
+    spans = _tracer.end_run()
+    path = os.environ.get("BIGMAC_METRICS_FILE")
+    if path:
+        try:
+            _tracer.write_prometheus(path)
+        except OSError:
+            pass
+    if st is not None and debug_enabled():
+        render_timing_panel(st, spans)
+    return spans
+
+
+def stop_page(st):
+    """代替 st.stop()：先结束本次运行的记录（写出指标、展示耗时面板），再停止页面脚本"""
+    try:
+        finish_page_trace(st)
+    finally:
+        st.stop()
+
+
+def render_timing_panel(st, spans: List[Span]):
+    """以折叠面板展示本次运行各阶段的耗时"""
+    with st.expander(f"⏱️ 本次运行耗时（{len(spans)} 个阶段）"):
+        if not spans:
+            st.write("本次运行没有记录到阶段。")
+            return
+        ordered = sorted(spans, key=lambda s: s.start)
+        st.dataframe(
+            [{
+                '阶段': "　" * s.depth + s.name,
+                '耗时(毫秒)': round(s.duration * 1000, 1),
+                '行数': s.rows if s.rows is not None else "",
+                '异常': "是" if s.error else "",
+            } for s in ordered],
+            use_container_width=True,
+        )
+        top_level = sum(s.duration for s in spans if s.depth == 0)
+        st.caption(f"顶层阶段合计 {top_level * 1000:.1f} 毫秒")